@@ -0,0 +1,137 @@
+"""Benchmark the worker ingestion stages: fetch, parse and database write.
+
+Each stage runs separately on synthetic RouterOS payloads of several sizes,
+the write stages on an in-memory and a file-backed SQLite database (and on
+`--db-url`, e.g. a local PostgreSQL, if given). Results are printed as JSON
+lines, or written to `--output`, so runs of different branches can be diffed.
+
+Run with `python -m tests.benchmarks.ingestion`.
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+
+from tests.benchmarks.payloads import make_leases
+from tests.routeros import FakeRestServer
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import DeviceRepository
+from whois.mikrotik import RouterOSClient, iter_leases, parse_leases
+from whois.worker import lease_to_device
+
+SIZES = (1_000, 10_000, 50_000)
+CHUNK_SIZE = 64 * 1024
+
+
+def measure(stage, setup=lambda: None) -> tuple:
+    """Return wall time and peak traced memory of a stage.
+
+    The stage runs twice, untraced for timing and under tracemalloc for
+    memory, each time with a fresh result of `setup`, which is not measured.
+    """
+    context = setup()
+    started = time.perf_counter()
+    stage(context)
+    elapsed = time.perf_counter() - started
+
+    context = setup()
+    tracemalloc.start()
+    stage(context)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def fetch(url: str) -> None:
+    client = RouterOSClient(url, "whois", "secret")
+    try:
+        with client.get("rest/ip/dhcp-server/lease") as resp:
+            for _ in resp.iter_content(CHUNK_SIZE):
+                pass
+    finally:
+        client.close()
+
+
+def parse(payload: str) -> None:
+    chunks = (
+        payload[start : start + CHUNK_SIZE]
+        for start in range(0, len(payload), CHUNK_SIZE)
+    )
+    for _ in iter_leases(chunks):
+        pass
+
+
+def fresh_repository(db_url: str, devices: list = ()) -> DeviceRepository:
+    database = Database(db_url)
+    database.drop()
+    database.create_db()
+    repository = DeviceRepository(database)
+    repository.upsert_many(devices)
+    return repository
+
+
+def run(sizes, db_urls: dict):
+    for size in sizes:
+        leases = make_leases(size)
+        payload = json.dumps(leases)
+        now = datetime.now(timezone.utc)
+        devices = [
+            lease_to_device(lease, now)
+            for lease in parse_leases(leases)
+            if lease.last_seen is not None
+        ]
+        moved = [
+            replace(device, last_seen=device.last_seen + timedelta(minutes=5))
+            for device in devices
+        ]
+
+        with FakeRestServer(leases) as server:
+            yield "fetch", None, size, measure(lambda _: fetch(server.url))
+        yield "parse", None, size, measure(lambda _: parse(payload))
+
+        for name, db_url in db_urls.items():
+            yield "insert", name, size, measure(
+                lambda repository: repository.upsert_many(devices),
+                lambda: fresh_repository(db_url),
+            )
+            yield "update", name, size, measure(
+                lambda repository: repository.upsert_many(moved),
+                lambda: fresh_repository(db_url, devices),
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--db-url", help="additional database to benchmark")
+    parser.add_argument("--output", type=argparse.FileType("w"), default=sys.stdout)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        db_urls = {
+            "sqlite-memory": "sqlite://",
+            "sqlite-file": f"sqlite:///{directory}/bench.sqlite",
+        }
+        if args.db_url:
+            db_urls["db-url"] = args.db_url
+
+        for stage, db, size, (elapsed, peak) in run(args.sizes, db_urls):
+            report = {
+                "stage": stage,
+                "db": db,
+                "leases": size,
+                "seconds": round(elapsed, 4),
+                "leases_per_s": round(size / elapsed),
+                "peak_bytes": peak,
+            }
+            args.output.write(json.dumps(report) + "\n")
+            args.output.flush()
+
+
+if __name__ == "__main__":
+    main()
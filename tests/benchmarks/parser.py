@@ -0,0 +1,93 @@
+"""Compare the streaming lease parser with the previous parse_leases.
+
+Run with `python -m tests.benchmarks.parser`.
+"""
+
+import json
+import time
+import tracemalloc
+from dataclasses import fields
+from datetime import timedelta
+
+from tests.benchmarks.payloads import make_payload
+from whois.mikrotik import MikrotikDhcpLease, iter_leases, parse_duration
+
+SIZES = (1_000, 10_000, 100_000)
+CHUNK_SIZE = 64 * 1024
+
+
+def legacy_parse_value(value, field_type):
+    if not value:
+        return
+
+    if field_type is timedelta:
+        return parse_duration(value)
+
+    if field_type is bool:
+        return value == "true"
+
+    return value
+
+
+def legacy_parse_leases(payload: str) -> list:
+    """parse_leases as it was before the streaming parser, including resp.json()"""
+    dhcp_leases = []
+
+    for lease in json.loads(payload):
+        data = {
+            key.replace("-", "_"): value for key, value in lease.items() if key != ".id"
+        }
+
+        parsed = {
+            field.name: legacy_parse_value(data.get(field.name), field.type)
+            for field in fields(MikrotikDhcpLease)
+        }
+
+        dhcp_leases.append(MikrotikDhcpLease(**parsed))
+
+    return dhcp_leases
+
+
+def streaming_parse_leases(payload: str) -> int:
+    chunks = (
+        payload[start : start + CHUNK_SIZE]
+        for start in range(0, len(payload), CHUNK_SIZE)
+    )
+    count = 0
+    for _ in iter_leases(chunks):
+        count += 1
+    return count
+
+
+def measure(parse, payload: str) -> tuple:
+    """Time a run without tracing, then trace a second run for peak memory."""
+    started = time.perf_counter()
+    parse(payload)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    parse(payload)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    print(
+        f"{'leases':>8} {'parser':>10} {'seconds':>9} {'leases/s':>10} {'peak MiB':>9}"
+    )
+    for size in SIZES:
+        payload = make_payload(size)
+        for name, parse in (
+            ("legacy", legacy_parse_leases),
+            ("streaming", streaming_parse_leases),
+        ):
+            elapsed, peak = measure(parse, payload)
+            print(
+                f"{size:>8} {name:>10} {elapsed:>9.3f} {size / elapsed:>10.0f} "
+                f"{peak / 2**20:>9.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
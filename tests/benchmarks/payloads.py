@@ -0,0 +1,65 @@
+"""Synthetic RouterOS payloads used by the benchmarks."""
+
+import json
+import random
+
+
+def random_mac(rng: random.Random) -> str:
+    return ":".join(f"{rng.randrange(256):02X}" for _ in range(6))
+
+
+def random_duration(rng: random.Random) -> str:
+    parts = (("w", 52), ("d", 7), ("h", 24), ("m", 60), ("s", 60))
+    duration = "".join(
+        f"{rng.randrange(1, limit)}{unit}"
+        for unit, limit in parts
+        if rng.random() < 0.5
+    )
+    return duration or "0s"
+
+
+def make_lease(rng: random.Random, index: int) -> dict:
+    mac_address = random_mac(rng)
+    address = f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}"
+    lease = {
+        ".id": f"*{index:X}",
+        "address": address,
+        "mac-address": mac_address,
+        "client-id": f"1:{mac_address.lower()}",
+        "address-lists": "",
+        "server": "defconf",
+        "dhcp-option": "",
+        "status": rng.choice(("bound",) * 9 + ("waiting",)),
+        "last-seen": random_duration(rng),
+        "radius": "false",
+        "dynamic": rng.choice(("true", "false")),
+        "blocked": "false",
+        "disabled": "false",
+    }
+    if lease["status"] == "bound":
+        lease.update(
+            {
+                "active-address": address,
+                "active-mac-address": mac_address,
+                "active-client-id": lease["client-id"],
+                "active-server": "defconf",
+                "expires-after": random_duration(rng),
+            }
+        )
+    else:
+        # static leases of devices which did not connect yet
+        lease["last-seen"] = rng.choice(("never", ""))
+    if rng.random() < 0.8:
+        lease["host-name"] = f"host-{index}"
+    if rng.random() < 0.05:
+        del lease["last-seen"]
+    return lease
+
+
+def make_leases(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [make_lease(rng, index) for index in range(count)]
+
+
+def make_payload(count: int, seed: int = 0) -> str:
+    return json.dumps(make_leases(count, seed))
@@ -0,0 +1,108 @@
+"""Compare the ORM and the Core read path of the device repositories.
+
+The device table of a file-backed SQLite database is filled with devices, half
+of them seen within RECENT_TIME. get_all is run through DeviceRepository (ORM
+instances mapped to Device) and DeviceReadRepository (Core rows built into
+DeviceRecord), get_recent, which only has the Core path, through the latter. Reports the median per-row cost and the
+peak traced memory of each call. Runs on `--db-url` too, if given.
+
+Run with `python -m tests.benchmarks.read_path`.
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from tests.benchmarks.payloads import random_mac
+from whois.data.db.database import Database
+from whois.data.repository.device_read_repository import DeviceReadRepository
+from whois.data.repository.device_repository import DeviceRepository
+from whois.entity.device import Device
+
+SIZES = (100_000,)
+RECENT_TIME = timedelta(minutes=20)
+ROUNDS = 5
+
+
+def make_devices(size: int, now: datetime) -> list:
+    rng = random.Random(size)
+    devices = {}
+    while len(devices) < size:
+        window = RECENT_TIME if len(devices) % 2 else timedelta(days=365)
+        device = Device(
+            mac_address=random_mac(rng),
+            hostname=f"host-{len(devices)}",
+            last_seen=now
+            - timedelta(seconds=rng.randrange(int(window.total_seconds()))),
+            owner=rng.choice((None, None, None, 1)),
+            flags=None,
+        )
+        devices[device.mac_address] = device
+    return list(devices.values())
+
+
+def measure(database: Database, query) -> tuple:
+    """Median seconds per call and rows of `query`, then its traced peak."""
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        rows = len(query())
+        timings.append(time.perf_counter() - started)
+        database.remove_session()
+
+    tracemalloc.start()
+    query()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    database.remove_session()
+    return statistics.median(timings), rows, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--db-url", help="additional database to benchmark")
+    args = parser.parse_args()
+
+    print(
+        f"{'db':>12} {'devices':>8} {'query':>11} {'path':>5} {'rows':>8} "
+        f"{'us/row':>7} {'peak MiB':>9}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        db_urls = {"sqlite-file": f"sqlite:///{directory}/bench.sqlite"}
+        if args.db_url:
+            db_urls["db-url"] = args.db_url
+
+        for name, db_url in db_urls.items():
+            database = Database(db_url)
+            paths = {
+                "orm": DeviceRepository(database),
+                "core": DeviceReadRepository(database),
+            }
+            for size in args.sizes:
+                database.drop()
+                database.create_db()
+                paths["orm"].upsert_many(make_devices(size, datetime.now(timezone.utc)))
+
+                for query, query_args, query_paths in (
+                    ("get_all", (), ("orm", "core")),
+                    ("get_recent", (RECENT_TIME,), ("core",)),
+                ):
+                    for path in query_paths:
+                        repository = paths[path]
+                        method = getattr(repository, query)
+                        elapsed, rows, peak = measure(
+                            database, lambda: method(*query_args)
+                        )
+                        print(
+                            f"{name:>12} {size:>8} {query:>11} {path:>5} {rows:>8} "
+                            f"{elapsed / rows * 1e6:>7.2f} {peak / 2**20:>9.1f}"
+                        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Measure DeviceReadRepository.get_recent latency before and after the indexes.
+
+For each table size the device table is filled with devices seen over the
+last year, a few of them within RECENT_TIME, and get_recent is timed with
+the schema migrated down to version 0 (no indexes) and up to the latest
+version. Runs on a file-backed SQLite database, and on `--db-url` if given.
+
+Run with `python -m tests.benchmarks.recent`.
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from tests.benchmarks.payloads import random_mac
+from whois.data.db.database import Database
+from whois.data.db.migrations import LATEST_VERSION, migrate
+from whois.data.repository.device_read_repository import DeviceReadRepository
+from whois.data.repository.device_repository import DeviceRepository
+from whois.entity.device import Device
+
+SIZES = (1_000, 10_000, 100_000)
+RECENT_DEVICES = 50
+RECENT_TIME = timedelta(minutes=20)
+ROUNDS = 20
+
+
+def make_devices(size: int, now: datetime) -> list:
+    rng = random.Random(size)
+    devices = {}
+    while len(devices) < size:
+        recent = len(devices) < RECENT_DEVICES
+        age = timedelta(
+            seconds=rng.randrange(RECENT_TIME.seconds if recent else 365 * 86400)
+        )
+        device = Device(
+            mac_address=random_mac(rng),
+            hostname=f"host-{len(devices)}",
+            last_seen=now - (age if recent else age + RECENT_TIME),
+            owner=None,
+            flags=None,
+        )
+        devices[device.mac_address] = device
+    return list(devices.values())
+
+
+def measure(repository: DeviceReadRepository) -> float:
+    """Median latency of get_recent over ROUNDS calls, each in a new session."""
+    timings = []
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        repository.get_recent(RECENT_TIME)
+        timings.append(time.perf_counter() - started)
+        repository.database.remove_session()
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--db-url", help="additional database to benchmark")
+    args = parser.parse_args()
+
+    print(f"{'db':>12} {'devices':>8} {'no index ms':>12} {'indexed ms':>11}")
+    with tempfile.TemporaryDirectory() as directory:
+        db_urls = {"sqlite-file": f"sqlite:///{directory}/bench.sqlite"}
+        if args.db_url:
+            db_urls["db-url"] = args.db_url
+
+        for name, db_url in db_urls.items():
+            database = Database(db_url)
+            repository = DeviceReadRepository(database)
+            for size in args.sizes:
+                database.drop()
+                database.create_db()
+                DeviceRepository(database).upsert_many(
+                    make_devices(size, datetime.now(timezone.utc))
+                )
+
+                migrate(database.engine, target=0)
+                before = measure(repository)
+                migrate(database.engine, target=LATEST_VERSION)
+                after = measure(repository)
+                print(
+                    f"{name:>12} {size:>8} {before * 1000:>12.2f} {after * 1000:>11.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
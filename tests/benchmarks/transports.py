@@ -0,0 +1,51 @@
+"""Compare the REST and the native API transports against local fake routers.
+
+The fake routers run in the same process, so their serialization cost is
+included in the timings. Router-side JSON rendering on real hardware is not.
+
+Run with `python -m tests.benchmarks.transports`.
+"""
+
+import time
+
+from tests.benchmarks.payloads import make_leases
+from tests.routeros import FakeApiServer, FakeRestServer
+from whois.mikrotik import WORKER_PROPLIST, make_client
+
+SIZES = (1_000, 10_000, 50_000)
+ROUNDS = 3
+
+
+def measure(url: str, proplist) -> tuple:
+    client = make_client(url, "whois", "secret", proplist=proplist)
+    try:
+        best = float("inf")
+        for _ in range(ROUNDS):
+            started = time.perf_counter()
+            client.fetch_leases()
+            best = min(best, time.perf_counter() - started)
+        return best, client.metrics.last_response_bytes
+    finally:
+        client.close()
+
+
+def main():
+    print(
+        f"{'leases':>8} {'transport':>10} {'proplist':>9} {'seconds':>9} "
+        f"{'leases/s':>10} {'KiB':>8}"
+    )
+    for size in SIZES:
+        leases = make_leases(size)
+        with FakeRestServer(leases) as rest, FakeApiServer(leases) as api:
+            for name, url in (("rest", rest.url), ("api", api.url)):
+                for proplist in (None, WORKER_PROPLIST):
+                    elapsed, size_bytes = measure(url, proplist)
+                    print(
+                        f"{size:>8} {name:>10} {'yes' if proplist else 'no':>9} "
+                        f"{elapsed:>9.3f} {size / elapsed:>10.0f} "
+                        f"{size_bytes / 1024:>8.0f}"
+                    )
+
+
+if __name__ == "__main__":
+    main()
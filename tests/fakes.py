@@ -0,0 +1,37 @@
+"""Shared stand-ins for clocks and devices used by tests."""
+
+from datetime import datetime, timezone
+
+from whois.entity.device import Device
+
+
+class FakeClock:
+    """Clock returning `now`, which tests move by hand or through `sleep`.
+
+    Works for numeric and datetime clocks alike.
+    """
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_device(
+    mac_address,
+    hostname="host",
+    last_seen=None,
+    owner=None,
+    flags=None,
+):
+    return Device(
+        mac_address=mac_address,
+        hostname=hostname,
+        last_seen=last_seen or datetime(2024, 1, 1, 12, tzinfo=timezone.utc),
+        owner=owner,
+        flags=flags,
+    )
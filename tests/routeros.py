@@ -0,0 +1,152 @@
+"""Local stand-ins for RouterOS routers used by tests and benchmarks."""
+
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from whois.mikrotik import encode_sentence, read_sentence, sentence_attributes
+
+
+class FakeRestServer:
+    """Serves `rest/ip/dhcp-server/lease` from a list of lease dicts."""
+
+    def __init__(self, leases: list, failures: int = 0):
+        self.leases = leases
+        self.failures = failures
+        self.requests = []
+        self.connections = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                server.connections += 1
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                server.requests.append((url.path, parse_qs(url.query)))
+                if server.failures > 0:
+                    server.failures -= 1
+                    self.respond(503, b"")
+                elif url.path != "/rest/ip/dhcp-server/lease":
+                    self.respond(404, b"")
+                else:
+                    self.respond(200, server.payload(parse_qs(url.query)))
+
+            def respond(self, status: int, body: bytes):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, args=(0.05,), daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}/"
+
+    def payload(self, query: dict) -> bytes:
+        leases = self.leases
+        if ".proplist" in query:
+            keys = query[".proplist"][0].split(",")
+            leases = [{k: v for k, v in lease.items() if k in keys} for lease in leases]
+        return json.dumps(leases).encode()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeApiServer:
+    """Speaks the RouterOS API sentence protocol for lease printing."""
+
+    def __init__(self, leases: list, user: str = "whois", password: str = "secret"):
+        self.leases = leases
+        self.commands = []
+        self.connections = 0
+
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            wbufsize = 64 * 1024
+
+            def handle(self):
+                server.connections += 1
+                logged_in = False
+                while True:
+                    try:
+                        words = read_sentence(self.rfile)
+                    except ConnectionError:
+                        return
+                    server.commands.append(words)
+                    attributes = sentence_attributes(words)
+
+                    if words[0] == "/login":
+                        credentials = (
+                            attributes.get("name"),
+                            attributes.get("password"),
+                        )
+                        logged_in = credentials == (user, password)
+                        if not logged_in:
+                            self.reply(
+                                ["!trap", "=message=invalid user name or password"]
+                            )
+                    elif not logged_in:
+                        self.reply(["!fatal", "not logged in"])
+                        self.wfile.flush()
+                        return
+                    elif words[0] == "/ip/dhcp-server/lease/print":
+                        keys = attributes.get(".proplist")
+                        for lease in server.leases:
+                            if keys:
+                                lease = {
+                                    k: lease[k] for k in keys.split(",") if k in lease
+                                }
+                            self.reply(
+                                ["!re"] + [f"={k}={v}" for k, v in lease.items()]
+                            )
+                    else:
+                        self.reply(["!trap", "=message=no such command"])
+                    self.reply(["!done"])
+                    self.wfile.flush()
+
+            def reply(self, words):
+                self.wfile.write(encode_sentence(words))
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"api://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,159 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import tempfile
+from datetime import datetime, timezone
+from unittest import TestCase, skipUnless
+
+from whois.data.db.async_database import async_url
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import DeviceRepository
+from whois.data.repository.user_repository import UserRepository
+from whois.entity.device import Device
+from whois.entity.user import User
+from whois.settings.testing import app_settings, mikrotik_settings
+
+HAS_AIOSQLITE = importlib.util.find_spec("aiosqlite") is not None
+
+
+async def get(app, path: str, query_string: bytes = b"", headers=()) -> tuple:
+    """Run a GET request through an ASGI app, return status and JSON body.
+
+    With `headers=True`, the response headers are returned as well.
+    """
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query_string,
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+    }
+    await app(scope, receive, send)
+    start, body = messages
+    return (
+        start["status"],
+        json.loads(body["body"]) if body["body"] else None,
+        {name.decode(): value.decode() for name, value in start["headers"]},
+    )
+
+
+class AsyncUrlTest(TestCase):
+
+    def test_async_drivers(self):
+        """Database URLs get the asyncio driver of their backend"""
+        assert async_url("sqlite:///whohacks.sqlite") == (
+            "sqlite+aiosqlite:///whohacks.sqlite"
+        )
+        assert async_url("postgresql+psycopg2://user:secret@db/whohacks") == (
+            "postgresql+asyncpg://user:secret@db/whohacks"
+        )
+
+    def test_unsupported_backend(self):
+        """Backends without a known asyncio driver are rejected"""
+        with self.assertRaises(ValueError):
+            async_url("mysql://db/whohacks")
+
+
+@skipUnless(HAS_AIOSQLITE, "aiosqlite is not installed")
+class AsyncAppTest(TestCase):
+
+    def setUp(self):
+        from whois.asgi import AsyncWhohacksApp
+        from whois.data.db.async_database import AsyncDatabase
+
+        self.directory = tempfile.TemporaryDirectory()
+        db_url = f"sqlite:///{self.directory.name}/whohacks.sqlite"
+        self.db = Database(db_url)
+        users = UserRepository(self.db)
+        devices = DeviceRepository(self.db)
+        now = datetime.now(timezone.utc)
+        for index in range(3):
+            users.insert(User(username=f"user{index}", display_name=f"User {index}"))
+            devices.insert(
+                Device(f"aa:aa:aa:aa:aa:0{index}", "host", now, index + 1, None)
+            )
+        devices.insert(Device("aa:aa:aa:aa:aa:10", "host", now, None, None))
+        self.db.remove_session()
+
+        self.async_db = AsyncDatabase(db_url)
+        self.app = AsyncWhohacksApp(
+            app_settings, mikrotik_settings, self.async_db, logging.getLogger(__name__)
+        )
+
+    def tearDown(self):
+        self.db.engine.dispose()
+        self.db.write_engine.dispose()
+        self.directory.cleanup()
+
+    def run_async(self, awaitable):
+        """Run in a fresh event loop, closing the pooled connections of it."""
+
+        async def run():
+            try:
+                return await awaitable
+            finally:
+                await self.async_db.dispose()
+
+        return asyncio.run(run())
+
+    def test_now_at_space(self):
+        """/api/now answers the same as the synchronous app"""
+        status, data, _ = self.run_async(get(self.app, "/api/now"))
+
+        assert status == 200
+        assert data == {
+            "users": ["User 0", "User 1", "User 2"],
+            "headcount": 3,
+            "unknown_devices": 1,
+        }
+
+    def test_concurrent_pollers(self):
+        """Many concurrent requests share the connection pool"""
+
+        async def poll():
+            return await asyncio.gather(*(get(self.app, "/api/now") for _ in range(50)))
+
+        responses = asyncio.run(poll())
+
+        assert {status for status, _, _ in responses} == {200}
+        assert {data["headcount"] for _, data, _ in responses} == {3}
+
+    def test_unknown_path(self):
+        """Only the JSON endpoints are served"""
+        status, _, _ = self.run_async(get(self.app, "/devices"))
+
+        assert status == 404
+
+    def test_now_conditional_get(self):
+        """Pollers with the current ETag get a 304, writes change the ETag"""
+
+        async def poll():
+            _, _, headers = await get(self.app, "/api/now")
+            etag = headers["etag"]
+            not_modified = await get(
+                self.app, "/api/now", headers=[("if-none-match", etag)]
+            )
+            DeviceRepository(self.db).insert(
+                Device(
+                    "aa:aa:aa:aa:aa:11", "host", datetime.now(timezone.utc), None, None
+                )
+            )
+            self.db.remove_session()
+            changed = await get(self.app, "/api/now", headers=[("if-none-match", etag)])
+            return headers, not_modified, changed
+
+        headers, not_modified, changed = self.run_async(poll())
+
+        assert "max-age" in headers["cache-control"]
+        assert not_modified[:2] == (304, None)
+        assert changed[0] == 200
+        assert changed[1]["unknown_devices"] == 2
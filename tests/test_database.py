@@ -0,0 +1,123 @@
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from whois.data.db.database import Database, pool_options
+from whois.data.repository.device_repository import DeviceRepository
+from whois.data.repository.user_repository import UserRepository
+from whois.data.table.user import UserTable
+from whois.entity.user import User
+
+
+class DatabaseSessionTest(TestCase):
+    def setUp(self):
+        self.db = Database("sqlite://")
+
+    def test_session_shared_per_thread(self):
+        """Repositories used by one thread share a single session"""
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(self.db.session))
+        thread.start()
+        thread.join()
+
+        assert self.db.session is self.db.session
+        assert sessions[0] is not self.db.session
+
+    def test_remove_session_returns_connection(self):
+        """A used session holds one connection until it is removed"""
+        with tempfile.TemporaryDirectory() as directory:
+            db = Database(f"sqlite:///{directory}/test.sqlite", max_overflow=0)
+            UserRepository(db).get_all()
+            DeviceRepository(db).get_all()
+            assert db.engine.pool.checkedout() == 1
+
+            db.remove_session()
+            assert db.engine.pool.checkedout() == 0
+            db.engine.dispose()
+
+    def test_transaction_rolls_back(self):
+        """A failed write leaves the shared session usable"""
+        repository = UserRepository(self.db)
+        user = User(username="user", display_name="User")
+        repository.insert(user)
+        with self.assertRaises(Exception):
+            repository.insert(user)
+
+        assert [u.username for u in repository.get_all()] == ["user"]
+
+    def test_pool_options(self):
+        """File databases get a sized pool, in-memory SQLite does not"""
+        options = pool_options("postgresql://localhost/whois", pool_size=4)
+        assert options["pool_size"] == 4
+        assert options["pool_pre_ping"]
+        assert "pool_size" not in pool_options("sqlite://")
+
+
+class SqliteProfileTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{self.directory.name}/test.sqlite"
+        self.db = Database(self.url)
+
+    def tearDown(self):
+        self.db.remove_session()
+        self.db.engine.dispose()
+        self.db.write_engine.dispose()
+        self.directory.cleanup()
+
+    def test_pragmas(self):
+        """File databases run in WAL mode with relaxed syncing"""
+        with self.db.engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+            synchronous = connection.exec_driver_sql("PRAGMA synchronous").scalar()
+
+        assert journal_mode == "wal"
+        assert synchronous == 1
+
+    def test_reads_during_write(self):
+        """Readers are not blocked by an open write transaction"""
+        repository = DeviceRepository(self.db)
+        writing, done = threading.Event(), threading.Event()
+
+        def write():
+            with self.db.transaction() as session:
+                session.add(UserTable(username="user", display_name="User"))
+                session.flush()
+                writing.set()
+                done.wait(5)
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        writing.wait(5)
+        try:
+            assert repository.get_all() == []
+            assert UserRepository(self.db).get_all() == []
+        finally:
+            done.set()
+            thread.join()
+
+        assert [u.username for u in UserRepository(self.db).get_all()] == ["user"]
+
+    def test_writers_of_two_processes_wait_for_each_other(self):
+        """A second writer waits for the lock instead of failing"""
+        other = Database(self.url)
+        writing = threading.Event()
+
+        def write():
+            with self.db.transaction() as session:
+                session.add(UserTable(username="first", display_name="First"))
+                session.flush()
+                writing.set()
+                time.sleep(0.2)
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        writing.wait(5)
+        UserRepository(other).insert(User(username="second", display_name="Second"))
+        thread.join()
+        other.write_engine.dispose()
+        other.engine.dispose()
+
+        users = UserRepository(self.db).get_all()
+        assert sorted(u.username for u in users) == ["first", "second"]
@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+from tests.fakes import make_device
+from whois.data.db.database import Database
+from whois.data.repository.device_read_repository import DeviceReadRepository
+from whois.data.repository.device_repository import DeviceRepository
+from whois.data.repository.user_repository import UserRepository
+from whois.entity.bitfield import BitField
+from whois.entity.device import DeviceFlags
+from whois.entity.user import User, UserFlags
+
+
+class DeviceRepositoryUpsertTest(TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.repository = DeviceRepository(self.db)
+
+    def test_upsert_inserts_new_devices(self):
+        """Devices not present in the database are inserted"""
+        result = self.repository.upsert_many(
+            [make_device("aa:aa:aa:aa:aa:01"), make_device("aa:aa:aa:aa:aa:02")]
+        )
+
+        assert (result.inserted, result.updated, result.unchanged) == (2, 0, 0)
+        assert len(self.repository.get_all()) == 2
+
+    def test_upsert_reports_updated_and_unchanged(self):
+        """Only devices with a changed hostname or last_seen are updated"""
+        self.repository.upsert_many(
+            [make_device("aa:aa:aa:aa:aa:01"), make_device("aa:aa:aa:aa:aa:02")]
+        )
+
+        later = datetime(2024, 1, 1, 12, 5, tzinfo=timezone.utc)
+        result = self.repository.upsert_many(
+            [
+                make_device("aa:aa:aa:aa:aa:01"),
+                make_device("aa:aa:aa:aa:aa:02", last_seen=later),
+                make_device("aa:aa:aa:aa:aa:03"),
+            ]
+        )
+
+        assert (result.inserted, result.updated, result.unchanged) == (1, 1, 1)
+        last_seen = {d.mac_address: d.last_seen for d in self.repository.get_all()}
+        assert last_seen["aa:aa:aa:aa:aa:02"] == later.replace(tzinfo=None)
+
+    def test_upsert_keeps_owner(self):
+        """Upserting seen devices does not release claimed devices"""
+        self.repository.insert(make_device("aa:aa:aa:aa:aa:01", owner=1))
+
+        self.repository.upsert_many(
+            [make_device("aa:aa:aa:aa:aa:01", hostname="renamed")]
+        )
+
+        (device,) = self.repository.get_all()
+        assert device.owner == 1
+        assert device.hostname == "renamed"
+
+    def test_upsert_many_rows(self):
+        """Batches larger than a single statement chunk are written"""
+        base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        devices = [
+            make_device(f"aa:aa:aa:aa:{i // 256:02x}:{i % 256:02x}", last_seen=base)
+            for i in range(1000)
+        ]
+
+        result = self.repository.upsert_many(devices)
+
+        assert result.inserted == 1000
+        assert len(self.repository.get_all()) == 1000
+
+    def test_get_recent(self):
+        """Recently seen devices can be fetched after an upsert"""
+        now = datetime.now(timezone.utc)
+        self.repository.upsert_many(
+            [
+                make_device("aa:aa:aa:aa:aa:01", last_seen=now),
+                make_device("aa:aa:aa:aa:aa:02", last_seen=now - timedelta(hours=2)),
+            ]
+        )
+
+        recent = DeviceReadRepository(self.db).get_recent(timedelta(minutes=20))
+
+        assert [d.mac_address for d in recent] == ["aa:aa:aa:aa:aa:01"]
+
+    def test_set_owner_keeps_last_seen(self):
+        """Claiming a device does not overwrite what the worker wrote"""
+        later = datetime(2024, 1, 1, 13, tzinfo=timezone.utc)
+        self.repository.insert(make_device("aa:aa:aa:aa:aa:01"))
+        self.repository.upsert_many([make_device("aa:aa:aa:aa:aa:01", last_seen=later)])
+
+        self.repository.set_owner("aa:aa:aa:aa:aa:01", 1)
+
+        device = self.repository.get_by_mac_address("aa:aa:aa:aa:aa:01")
+        assert device.owner == 1
+        assert device.last_seen == later.replace(tzinfo=None)
+
+    def test_claim_only_unclaimed(self):
+        """Of two claims of the same device only the first one succeeds"""
+        self.repository.insert(make_device("aa:aa:aa:aa:aa:01"))
+
+        assert self.repository.claim("aa:aa:aa:aa:aa:01", 1)
+        assert not self.repository.claim("aa:aa:aa:aa:aa:01", 2)
+
+        assert self.repository.get_by_mac_address("aa:aa:aa:aa:aa:01").owner == 1
+
+
+def insert_devices_with_owners(db):
+    repository = DeviceRepository(db)
+    users = UserRepository(db)
+    hidden = BitField()
+    hidden.set_flag(UserFlags.is_hidden.value)
+    users.insert(User(username="visible", display_name="Visible"))
+    users.insert(User(username="hidden", display_name="Hidden", flags=hidden))
+
+    now = datetime.now(timezone.utc)
+    for mac_address, owner in (
+        ("aa:aa:aa:aa:aa:01", 1),
+        ("aa:aa:aa:aa:aa:02", 2),
+        ("aa:aa:aa:aa:aa:03", None),
+        ("aa:aa:aa:aa:aa:04", None),
+    ):
+        repository.insert(make_device(mac_address, last_seen=now, owner=owner))
+    repository.insert(
+        make_device("aa:aa:aa:aa:aa:05", last_seen=now - timedelta(days=1), owner=1)
+    )
+    device_hidden = BitField()
+    device_hidden.set_flag(DeviceFlags.is_hidden.value)
+    repository.set_flags("aa:aa:aa:aa:aa:04", device_hidden)
+
+
+class DeviceReadRepositoryOwnersTest(TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.repository = DeviceReadRepository(self.db)
+        insert_devices_with_owners(self.db)
+
+    def test_visible_devices_with_owners(self):
+        """Hidden devices and devices of hidden users are left out"""
+        rows = self.repository.get_recent_with_owners(timedelta(minutes=20))
+
+        owners = {device.mac_address: owner and str(owner) for device, owner in rows}
+        assert owners == {"aa:aa:aa:aa:aa:01": "Visible", "aa:aa:aa:aa:aa:03": None}
+
+    def test_all_devices_and_own_devices(self):
+        """Without visibility filtering, own devices are included even if old"""
+        rows = self.repository.get_recent_with_owners(
+            timedelta(minutes=20), visible_only=False, owner_id=1
+        )
+
+        assert sorted(device.mac_address for device, _ in rows) == [
+            "aa:aa:aa:aa:aa:01",
+            "aa:aa:aa:aa:aa:02",
+            "aa:aa:aa:aa:aa:03",
+            "aa:aa:aa:aa:aa:04",
+            "aa:aa:aa:aa:aa:05",
+        ]
+
+
+class DeviceReadRepositoryTest(TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.repository = DeviceRepository(self.db)
+        insert_devices_with_owners(self.db)
+        self.read_repository = DeviceReadRepository(self.db)
+
+    def test_records_match_orm_devices(self):
+        """Records carry the same values as the ORM read path"""
+        devices = {d.mac_address: d for d in self.repository.get_all()}
+        records = self.read_repository.get_all()
+
+        assert len(records) == len(devices)
+        for record in records:
+            device = devices[record.mac_address]
+            assert (record.hostname, record.last_seen, record.owner) == (
+                device.hostname,
+                device.last_seen,
+                device.owner,
+            )
+            assert record.is_hidden == device.is_hidden
+            assert record.flags.has_flag(DeviceFlags.is_hidden.value) == (
+                device.is_hidden
+            )
+
+    def test_recent_and_by_user_id(self):
+        """Recent and per user records"""
+        recent = self.read_repository.get_recent(timedelta(minutes=20))
+        own = self.read_repository.get_by_user_id(1)
+
+        assert len(recent) == 4
+        assert sorted(d.mac_address for d in own) == [
+            "aa:aa:aa:aa:aa:01",
+            "aa:aa:aa:aa:aa:05",
+        ]
@@ -57,3 +57,11 @@ class TestHelpers(TestCase):
         """
         assert helpers.ip_range("192.168.88.1-255", "192.168.88.123") is True
         assert helpers.ip_range("192.168.88.1-255", "192.168.80.100") is False
+
+    def test_ip_range_other_addresses(self):
+        """
+        IPv6 and unparsable addresses are outside, IPv4-mapped ones are checked
+        """
+        assert helpers.ip_range("127.0.0.1", "::1") is False
+        assert helpers.ip_range("127.0.0.1", "not an address") is False
+        assert helpers.ip_range("192.168.88.1-255", "::ffff:192.168.88.7") is True
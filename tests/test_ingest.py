@@ -0,0 +1,58 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import DeviceRepository
+from whois.ingest import LeaseEventBuffer, events_to_devices
+
+
+class IngestTest(TestCase):
+
+    def setUp(self):
+        self.repository = DeviceRepository(Database("sqlite://"))
+        self.buffer = LeaseEventBuffer(self.repository, 60, max_batch=100)
+
+    def test_events_to_devices(self):
+        """Single and batched events are accepted, unbind events are ignored"""
+        devices, ignored = events_to_devices(
+            {"mac-address": "aa:aa:aa:aa:aa:01", "host-name": "laptop"}
+        )
+        assert [d.mac_address for d in devices] == ["AA:AA:AA:AA:AA:01"]
+        assert ignored == 0
+
+        devices, ignored = events_to_devices(
+            [
+                {"mac-address": "AA:AA:AA:AA:AA:01", "bound": "1"},
+                {"mac-address": "AA:AA:AA:AA:AA:02", "bound": "0"},
+            ]
+        )
+        assert len(devices) == 1 and ignored == 1
+
+        with self.assertRaises(ValueError):
+            events_to_devices({"mac-address": "not a mac"})
+
+    def test_buffer_coalesces_events(self):
+        """Repeated events of a device are written once"""
+        with patch("threading.Thread"):
+            for hostname in ("first", "second", "third"):
+                devices, _ = events_to_devices(
+                    {"mac-address": "AA:AA:AA:AA:AA:01", "host-name": hostname}
+                )
+                self.buffer.add(devices)
+
+        result = self.buffer.flush()
+
+        assert result.inserted == 1
+        (device,) = self.repository.get_all()
+        assert device.hostname == "third"
+
+    def test_failed_flush_keeps_events(self):
+        """Events are retried on the next flush if the write failed"""
+        with patch("threading.Thread"):
+            self.buffer.add(events_to_devices({"mac-address": "AA:AA:AA:AA:AA:01"})[0])
+
+        with patch.object(self.repository, "upsert_many", side_effect=OSError):
+            with self.assertRaises(OSError):
+                self.buffer.flush()
+
+        assert self.buffer.flush().inserted == 1
@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+from whois.data.db.database import Database
+from whois.data.repository.user_repository import UserRepository
+from whois.entity.user import User
+
+
+class QueryInstrumentationTest(TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.instrumentation = self.db.instrumentation
+        self.repository = UserRepository(self.db)
+
+    def test_counts_statements_of_thread(self):
+        """Statements since the last reset are counted with their time"""
+        self.repository.insert(User(username="user", display_name="User"))
+        stats = self.instrumentation.reset()
+
+        self.repository.get_all()
+        self.repository.get_by_username("user")
+
+        assert stats.count == 2
+        assert stats.total_s > 0
+
+    def test_histograms_per_repository_method(self):
+        """Durations are aggregated per calling repository method"""
+        self.repository.get_all()
+        self.repository.get_all()
+
+        histogram = self.instrumentation.histograms["UserRepository.get_all"]
+        assert histogram.count == 2
+        assert list(histogram.cumulative())[-1] == ("+Inf", 2)
+
+    def test_slow_query_log(self):
+        """Statements above the threshold are logged with their caller"""
+        self.instrumentation.slow_query_s = 0.0
+
+        with self.assertLogs("slow-queries", level="WARNING") as logs:
+            self.repository.get_all()
+
+        assert "UserRepository.get_all" in logs.output[0]
+        assert "SELECT" in logs.output[0]
+
+    def test_rows_returned_by_reads(self):
+        """Rows fetched by SELECTs are counted, even where rowcount is -1"""
+        for index in range(3):
+            self.repository.insert(
+                User(username=f"user{index}", display_name=f"User {index}")
+            )
+
+        self.repository.get_all()
+
+        assert self.instrumentation.rows["UserRepository.get_all"] == 3
+        assert "UserRepository.get_all" in self.instrumentation.render_metrics()
@@ -1,8 +1,16 @@
 import logging
+import os
+import tempfile
+from datetime import datetime, timezone
 from unittest import TestCase
 
+from sqlalchemy import event
+
 from whois.app import WhohacksApp
 from whois.data.db.database import Database
+from whois.data.repository.state_repository import REFRESH_REQUESTED
+from whois.entity.device import Device
+from whois.entity.user import User
 from whois.settings.testing import app_settings, mikrotik_settings
 
 
@@ -16,15 +24,28 @@ class ApiTestCase(TestCase):
             level=logging.DEBUG,
             force=True,
         )
-        self.logger.addHandler(logging.FileHandler(f"{__name__}.log"))
+        # the log and database of a run do not end up in the working tree
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_handler = logging.FileHandler(
+            os.path.join(self.directory.name, f"{__name__}.log")
+        )
+        self.logger.addHandler(self.log_handler)
 
-        self.db = Database("sqlite:///whohacks.test.sqlite")
+        self.db = Database(f"sqlite:///{self.directory.name}/whohacks.test.sqlite")
         self.db.drop()
         self.db.create_db()
         self.whois = WhohacksApp(app_settings, mikrotik_settings, self.db, self.logger)
         self.app = self.whois.app.test_client()
         self.app.testing = True
 
+    def tearDown(self):
+        self.logger.removeHandler(self.log_handler)
+        self.log_handler.close()
+        self.db.remove_session()
+        self.db.engine.dispose()
+        self.db.write_engine.dispose()
+        self.directory.cleanup()
+
     def test_index(self):
         """User should be able to access the index page"""
         response = self.app.get("/")
@@ -33,6 +54,17 @@ class ApiTestCase(TestCase):
             response.status_code == 200
         ), f"Actual response code: {response.status_code}"
 
+    def test_ipv6_and_outside_clients(self):
+        """IPv6 clients are served, API responses to outside clients set no cookie"""
+        for path in ("/", "/api/now"):
+            response = self.app.get(path, environ_base={"REMOTE_ADDR": "::1"})
+            assert (
+                response.status_code == 200
+            ), f"Actual response code: {response.status_code}"
+
+        response = self.app.get("/api/now", environ_base={"REMOTE_ADDR": "10.0.0.1"})
+        assert "Set-Cookie" not in response.headers
+
     def test_login_page(self):
         """User should be able to access login page"""
         response = self.app.get("/login")
@@ -91,3 +123,163 @@ class ApiTestCase(TestCase):
         assert (
             login_response.status_code == 302
         ), f"Actual response code: {login_response.status_code}"
+
+    def test_request_refresh(self):
+        """Clients in the space can ask the worker for an immediate refresh"""
+        response = self.app.post("/api/refresh")
+
+        assert (
+            response.status_code == 202
+        ), f"Actual response code: {response.status_code}"
+        assert self.whois.state_repository.get(REFRESH_REQUESTED) == 1
+
+    def test_ingest_lease_requires_token(self):
+        """Lease events are rejected without the ingest token"""
+        response = self.app.post(
+            "/api/ingest/lease", json={"mac-address": "AA:AA:AA:AA:AA:01"}
+        )
+
+        assert (
+            response.status_code == 401
+        ), f"Actual response code: {response.status_code}"
+
+    def test_ingest_lease(self):
+        """Pushed lease events are written to the devices table"""
+        response = self.app.post(
+            "/api/ingest/lease",
+            json=[
+                {"mac-address": "AA:AA:AA:AA:AA:01", "host-name": "laptop"},
+                {"mac-address": "AA:AA:AA:AA:AA:02", "bound": False},
+            ],
+            headers={"Authorization": f"Bearer {mikrotik_settings.INGEST_TOKEN}"},
+        )
+
+        assert (
+            response.status_code == 202
+        ), f"Actual response code: {response.status_code}"
+        assert response.get_json() == {"accepted": 1, "ignored": 1}
+
+        self.whois.lease_buffer.flush()
+        (device,) = self.whois.device_repository.get_all()
+        assert device.hostname == "laptop"
+
+    def test_history_hourly(self):
+        """Hourly presence history is answered from the rollups"""
+        self.whois.presence_repository.refresh_rollups(
+            datetime(2024, 1, 1, 18), datetime(2024, 1, 1, 18)
+        )
+
+        response = self.app.get(
+            "/api/history/hourly?start=2024-01-01T17:30:00Z&end=2024-01-01T19:00:00Z"
+        )
+
+        assert (
+            response.status_code == 200
+        ), f"Actual response code: {response.status_code}"
+        assert response.get_json()["buckets"] == [
+            {"start": f"2024-01-01T{hour}:00:00Z", "devices": 0, "users": 0}
+            for hour in (17, 18, 19)
+        ]
+
+    def test_history_invalid_range(self):
+        """History ranges must be valid and bounded"""
+        for query in ("start=yesterday", "start=2020-01-01&end=2024-01-01"):
+            response = self.app.get(f"/api/history/hourly?{query}")
+
+            assert (
+                response.status_code == 400
+            ), f"Actual response code: {response.status_code}"
+
+    def test_now_is_served_from_snapshot(self):
+        """/api/now costs one join whatever the headcount, then a version check"""
+        now = datetime.now(timezone.utc)
+        for index in range(5):
+            user = User(username=f"user{index}", display_name=f"User {index}")
+            self.whois.user_repository.insert(user)
+            self.whois.device_repository.insert(
+                Device(f"aa:aa:aa:aa:aa:0{index}", "host", now, index + 1, None)
+            )
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(self.db.engine, "before_cursor_execute", listener)
+        try:
+            response = self.app.get("/api/now")
+            assert response.get_json()["headcount"] == 5
+            assert len(statements) == 2, statements
+
+            statements.clear()
+            response = self.app.get("/api/now")
+            assert response.get_json()["headcount"] == 5
+            assert len(statements) == 1, statements
+            assert "state" in statements[0]
+        finally:
+            event.remove(self.db.engine, "before_cursor_execute", listener)
+
+    def test_now_sees_new_devices(self):
+        """Devices written after a cached /api/now show up in the next one"""
+        assert self.app.get("/api/now").get_json()["unknown_devices"] == 0
+
+        self.whois.device_repository.upsert_many(
+            [
+                Device(
+                    "aa:aa:aa:aa:aa:01", "host", datetime.now(timezone.utc), None, None
+                )
+            ]
+        )
+
+        assert self.app.get("/api/now").get_json()["unknown_devices"] == 1
+
+    def test_now_conditional_get(self):
+        """Pollers with the current ETag get a 304 without body"""
+        now = datetime.now(timezone.utc)
+        self.whois.device_repository.insert(
+            Device("aa:aa:aa:aa:aa:01", "host", now, None, None)
+        )
+
+        response = self.app.get("/api/now")
+        etag = response.headers["ETag"]
+        assert response.status_code == 200
+        assert "max-age" in response.headers["Cache-Control"]
+        assert "public" in response.headers["Cache-Control"]
+        assert "Last-Modified" not in response.headers
+
+        response = self.app.get("/api/now", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.data == b""
+        assert response.headers["ETag"] == etag
+
+        # If-Modified-Since does not see departures or flag changes
+        response = self.app.get(
+            "/api/now", headers={"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+        )
+        assert response.status_code == 200
+
+        # a session cookie may be sent back, shared caches must not keep it
+        self.app.set_cookie("localhost", "session", "x")
+        response = self.app.get("/api/now")
+        assert "private" in response.headers["Cache-Control"]
+        assert "public" not in response.headers["Cache-Control"]
+        self.app.delete_cookie("localhost", "session")
+
+        self.whois.device_repository.insert(
+            Device("aa:aa:aa:aa:aa:02", "host", now, None, None)
+        )
+        response = self.app.get("/api/now", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    def test_debug_query_header_and_metrics(self):
+        """Debug responses count their queries, /metrics names the caller"""
+        self.whois.app.debug = True
+        response = self.app.get("/api/now")
+
+        # the presence version, then the snapshot
+        assert response.headers["X-DB-Query-Count"] == "2"
+        assert response.headers["Server-Timing"].startswith("db;dur=")
+
+        metrics = self.app.get("/metrics").get_data(as_text=True)
+        assert (
+            'whohacks_db_query_seconds_count{caller="'
+            'DeviceReadRepository.get_recent_with_owners"} 1'
+        ) in metrics
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+from tests.fakes import FakeClock
+from whois.data.db.database import Database
+from whois.leader import LeaseRowElection, make_election
+
+
+class LeaseRowElectionTest(TestCase):
+    def setUp(self):
+        self.database = Database("sqlite://")
+        self.database.create_db()
+        self.clock = FakeClock(datetime(2024, 1, 1, tzinfo=timezone.utc))
+        self.first, self.second = (
+            LeaseRowElection(
+                self.database,
+                "worker",
+                timedelta(seconds=30),
+                holder=holder,
+                clock=self.clock,
+            )
+            for holder in ("first", "second")
+        )
+
+    def test_only_one_holder(self):
+        """Only the first instance becomes leader, renewing keeps the lease"""
+        assert self.first.acquire()
+        assert not self.second.acquire()
+
+        self.clock.now += timedelta(seconds=20)
+        assert self.first.acquire()
+        self.clock.now += timedelta(seconds=20)
+        assert not self.second.acquire()
+
+    def test_takeover_after_expiry(self):
+        """A standby takes over once the leader stops renewing its lease"""
+        assert self.first.acquire()
+
+        self.clock.now += timedelta(seconds=31)
+        assert self.second.acquire()
+        assert not self.first.acquire()
+
+    def test_takeover_after_release(self):
+        """A released lease can be taken over immediately"""
+        assert self.first.acquire()
+        self.first.release()
+
+        self.clock.now += timedelta(seconds=1)
+        assert self.second.acquire()
+
+    def test_make_election_on_sqlite(self):
+        """SQLite has no advisory locks and uses the lease row"""
+        election = make_election(self.database, "worker", timedelta(seconds=30))
+        assert isinstance(election, LeaseRowElection)
+
+    def test_start_elects_right_away(self):
+        """The leader is known before the first tick, on_elected runs once"""
+        elected = []
+        self.first.start(3600, on_elected=lambda: elected.append(True))
+
+        assert self.first.is_leader
+        assert elected == [True]
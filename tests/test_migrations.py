@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from sqlalchemy import inspect, text
+
+from whois.data.db.database import Database
+from whois.data.db.migrations import LATEST_VERSION, current_version, migrate
+
+DEVICE_INDEXES = {
+    "ix_device_last_seen",
+    "ix_device_user_id_last_seen",
+    "ix_device_visible_last_seen",
+}
+
+
+class MigrationsTest(TestCase):
+    def setUp(self):
+        self.db = Database("sqlite://")
+
+    def device_indexes(self) -> set:
+        return {
+            index["name"] for index in inspect(self.db.engine).get_indexes("device")
+        }
+
+    def test_fresh_database_is_migrated(self):
+        """A new database gets all indexes and the latest version"""
+        assert current_version(self.db.engine) == LATEST_VERSION
+        assert self.device_indexes() == DEVICE_INDEXES
+
+    def test_downgrade_and_upgrade(self):
+        """Migrations can be reverted and applied again"""
+        assert migrate(self.db.engine, target=1) == 1
+        assert self.device_indexes() == {"ix_device_last_seen"}
+
+        assert migrate(self.db.engine) == LATEST_VERSION
+        assert self.device_indexes() == DEVICE_INDEXES
+
+    def test_existing_database_without_versions(self):
+        """Databases created before migrations existed are upgraded in place"""
+        with self.db.engine.begin() as connection:
+            connection.execute(text("DROP TABLE schema_version"))
+            connection.execute(text("DROP INDEX ix_device_visible_last_seen"))
+
+        self.db.create_db()
+
+        assert current_version(self.db.engine) == LATEST_VERSION
+        assert self.device_indexes() == DEVICE_INDEXES
+
+    def test_recent_query_uses_index(self):
+        """Looking up recently seen devices does not scan the whole table"""
+        with self.db.engine.connect() as connection:
+            plan = connection.execute(
+                text(
+                    "EXPLAIN QUERY PLAN SELECT * FROM device "
+                    "WHERE last_seen > '2024-01-01'"
+                )
+            ).all()
+
+        assert "ix_device_last_seen" in plan[0][-1]
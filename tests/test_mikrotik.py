@@ -1,7 +1,30 @@
+import io
+import json
+import socket
+import time
 from datetime import timedelta
 from unittest import TestCase
 
-from whois.mikrotik import parse_duration
+import requests
+
+from tests.benchmarks.payloads import make_leases
+from tests.routeros import FakeApiServer, FakeRestServer
+from whois.mikrotik import (
+    WORKER_PROPLIST,
+    RouterOSApiClient,
+    RouterOSApiError,
+    RouterOSClient,
+    encode_length,
+    encode_sentence,
+    iter_leases,
+    make_client,
+    parse_duration,
+    parse_lease,
+    parse_leases,
+    read_length,
+    read_sentence,
+    sentence_attributes,
+)
 
 
 class TestMikrotik(TestCase):
@@ -22,3 +45,182 @@ class TestMikrotik(TestCase):
         for case, expected in data:
             result = parse_duration(case)
             assert result == expected
+
+    def test_parse_duration_never(self):
+        assert parse_duration("never") is None
+        assert parse_lease({"last-seen": "never"}).last_seen is None
+
+    def test_iter_leases_matches_parse_leases(self):
+        leases = [
+            {
+                ".id": "*1",
+                "address": "192.168.88.10",
+                "mac-address": "AA:AA:AA:AA:AA:01",
+                "host-name": "laptop",
+                "last-seen": "1m10s",
+                "dynamic": "true",
+                "disabled": "false",
+            },
+            {"mac-address": "AA:AA:AA:AA:AA:02", "status": "waiting"},
+        ]
+        payload = json.dumps(leases, indent=1)
+
+        for size in (1, 7, len(payload)):
+            chunks = (payload[i : i + size] for i in range(0, len(payload), size))
+            assert list(iter_leases(chunks)) == parse_leases(leases)
+
+        lease = parse_leases(leases)[0]
+        assert lease.last_seen == timedelta(minutes=1, seconds=10)
+        assert lease.dynamic is True and lease.disabled is False
+        assert lease.client_id is None
+
+    def test_iter_leases_rejects_truncated_payload(self):
+        with self.assertRaises(ValueError):
+            list(iter_leases(['[{"mac-address": "AA:AA:AA:AA:AA:01"}, {"mac']))
+
+
+class TestRouterOSClient(TestCase):
+
+    leases = [
+        {
+            "mac-address": "AA:AA:AA:AA:AA:01",
+            "host-name": "laptop",
+            "last-seen": "10s",
+            "server": "defconf",
+        }
+    ]
+
+    def make_client(self, server, **kwargs):
+        client = RouterOSClient(server.url, "whois", "secret", **kwargs)
+        client.sleep = lambda delay: None
+        self.addCleanup(client.close)
+        return client
+
+    def test_connection_is_reused(self):
+        with FakeRestServer(self.leases) as server:
+            client = self.make_client(server)
+            for _ in range(3):
+                (lease,) = client.fetch_leases()
+
+        assert lease.host_name == "laptop"
+        assert server.connections == 1
+        assert client.metrics.requests == 3
+        assert client.metrics.last_response_bytes == len(json.dumps(self.leases))
+
+    def test_proplist_projection(self):
+        with FakeRestServer(self.leases) as server:
+            client = self.make_client(server, proplist=WORKER_PROPLIST)
+            (lease,) = client.fetch_leases()
+
+        _, query = server.requests[0]
+        assert query[".proplist"] == [",".join(WORKER_PROPLIST)]
+        assert lease.last_seen == timedelta(seconds=10)
+        assert lease.server is None
+
+    def test_retries_server_errors(self):
+        with FakeRestServer(self.leases, failures=2) as server:
+            client = self.make_client(server, retries=2)
+            assert len(client.fetch_leases()) == 1
+
+        assert client.metrics.failures == 2
+
+    def test_gives_up_after_retries(self):
+        with FakeRestServer(self.leases, failures=5) as server:
+            client = self.make_client(server, retries=1)
+            with self.assertRaises(requests.HTTPError):
+                client.fetch_leases()
+
+        assert len(server.requests) == 2
+
+    def test_retries_end_by_deadline(self):
+        """No retry is started whose backoff ends past the deadline"""
+        with FakeRestServer(self.leases, failures=5) as server:
+            client = self.make_client(server, retries=5, deadline_s=5)
+            client.backoff_delay = lambda attempt: 2.0 * 2**attempt
+            with self.assertRaises(requests.HTTPError):
+                client.fetch_leases()
+
+        # backoffs of 2s and 4s, the next one of 8s would end past 5s
+        assert len(server.requests) == 3
+        assert max(client.timeouts(time.monotonic())) <= 5
+
+    def test_backoff_is_jittered_and_bounded(self):
+        client = RouterOSClient("http://router.lan/", "whois", "secret")
+
+        for attempt in range(10):
+            delay = client.backoff_delay(attempt)
+            expected = min(client.max_backoff_s, client.backoff_s * 2**attempt)
+            assert expected / 2 <= delay <= expected
+
+
+class TestRouterOSApiClient(TestCase):
+
+    leases = TestRouterOSClient.leases
+
+    def make_client(self, server, password="secret", **kwargs):
+        client = make_client(server.url, "whois", password, **kwargs)
+        client.sleep = lambda delay: None
+        self.addCleanup(client.close)
+        return client
+
+    def test_length_encoding(self):
+        data = (
+            (0x7F, b"\x7f"),
+            (0x80, b"\x80\x80"),
+            (0x3FFF, b"\xbf\xff"),
+            (0x4000, b"\xc0\x40\x00"),
+            (0x200000, b"\xe0\x20\x00\x00"),
+            (0x10000000, b"\xf0\x10\x00\x00\x00"),
+        )
+
+        for length, expected in data:
+            assert encode_length(length) == expected
+            assert read_length(io.BytesIO(expected)) == length
+
+    def test_sentence_roundtrip(self):
+        words = ["!re", "=host-name=" + "x" * 300, "=comment=a=b"]
+
+        assert read_sentence(io.BytesIO(encode_sentence(words))) == words
+        assert sentence_attributes(words)["comment"] == "a=b"
+
+    def test_fetch_leases(self):
+        with FakeApiServer(self.leases) as server:
+            client = self.make_client(server, proplist=WORKER_PROPLIST)
+            assert isinstance(client, RouterOSApiClient)
+            for _ in range(2):
+                (lease,) = client.fetch_leases()
+
+        assert lease.mac_address == "AA:AA:AA:AA:AA:01"
+        assert lease.last_seen == timedelta(seconds=10)
+        assert lease.server is None
+        assert server.connections == 1
+        assert server.commands[-1] == [
+            "/ip/dhcp-server/lease/print",
+            "=.proplist=" + ",".join(WORKER_PROPLIST),
+        ]
+
+    def test_matches_rest_transport(self):
+        leases = make_leases(50)
+        with FakeApiServer(leases) as api, FakeRestServer(leases) as rest:
+            from_api = self.make_client(api).fetch_leases()
+            from_rest = self.make_client(rest).fetch_leases()
+
+        assert from_api == from_rest
+
+    def test_invalid_credentials(self):
+        with FakeApiServer(self.leases) as server:
+            client = self.make_client(server, password="wrong")
+            with self.assertRaises(RouterOSApiError):
+                client.fetch_leases()
+
+        assert client.socket is None
+
+    def test_reconnects_dropped_connection(self):
+        with FakeApiServer(self.leases) as server:
+            client = self.make_client(server)
+            client.fetch_leases()
+            client.socket.shutdown(socket.SHUT_RDWR)
+
+            assert len(client.fetch_leases()) == 1
+
+        assert server.connections == 2
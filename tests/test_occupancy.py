@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+from unittest import TestCase
+
+from whois.data.db.database import Database
+from whois.data.repository.presence_repository import (
+    PresenceRepository,
+    split_by_day,
+)
+from whois.entity.device import Device
+from whois.entity.occupancy import BITMAP_SIZE, OccupancyBitmap
+from whois.visit_tracker import VisitTracker
+
+
+class OccupancyBitmapTest(TestCase):
+    def test_minutes(self):
+        """Single minutes can be set and checked"""
+        bitmap = OccupancyBitmap()
+        bitmap.set_minute(0)
+        bitmap.set_minute(1439)
+
+        assert bitmap.has_minute(0) and bitmap.has_minute(1439)
+        assert not bitmap.has_minute(1)
+        assert bitmap.count() == 2
+        assert len(bytes(bitmap)) == BITMAP_SIZE
+
+    def test_set_range(self):
+        """Ranges include both ends"""
+        bitmap = OccupancyBitmap()
+        bitmap.set_range(58, 121)
+
+        assert bitmap.count() == 64
+        assert bitmap.counts(60)[:3] == [2, 60, 2]
+
+    def test_union(self):
+        """A union has the minutes set in any of the bitmaps"""
+        first, second = OccupancyBitmap(), OccupancyBitmap()
+        first.set_range(0, 9)
+        second.set_range(5, 14)
+
+        union = OccupancyBitmap.union([first, second])
+
+        assert union.count() == 15
+        assert union == first | second
+        assert OccupancyBitmap(bytes(union)) == union
+
+    def test_invalid_size(self):
+        """Buffers of the wrong size are rejected"""
+        with self.assertRaises(ValueError):
+            OccupancyBitmap(b"\0" * 10)
+
+
+class OccupancyRepositoryTest(TestCase):
+    def setUp(self):
+        self.repository = PresenceRepository(Database("sqlite://"))
+        self.tracker = VisitTracker(timedelta(minutes=30))
+
+    def record(self, mac_address, last_seen):
+        device = Device(mac_address, "host", last_seen, None, None)
+        visits = self.tracker.diff([device])
+        spans = self.tracker.spans(visits)
+        self.tracker.commit(self.repository.record_visits(visits, spans, last_seen))
+
+    def test_split_by_day(self):
+        """Spans crossing midnight are split into days"""
+        assert split_by_day(
+            datetime(2024, 1, 1, 23, 50), datetime(2024, 1, 2, 0, 9)
+        ) == [
+            (date(2024, 1, 1), 1430, 1439),
+            (date(2024, 1, 2), 0, 9),
+        ]
+
+    def test_space_occupancy(self):
+        """Minutes of all devices are merged per day"""
+        for minutes in (0, 20, 40):
+            self.record("aa:aa:aa:aa:aa:01", datetime(2024, 1, 1, 18, minutes))
+        self.record("aa:aa:aa:aa:aa:02", datetime(2024, 1, 1, 18, 30))
+        self.record("aa:aa:aa:aa:aa:02", datetime(2024, 1, 1, 18, 55))
+        self.record("aa:aa:aa:aa:aa:02", datetime(2024, 1, 1, 19, 15))
+        self.record("aa:aa:aa:aa:aa:02", datetime(2024, 1, 2, 8, 0))
+
+        days = self.repository.get_occupancy(date(2024, 1, 1), date(2024, 1, 31))
+
+        assert list(days) == [date(2024, 1, 1), date(2024, 1, 2)]
+        assert days[date(2024, 1, 1)].counts(60)[18:20] == [60, 16]
+        assert days[date(2024, 1, 2)].count() == 1
@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import DeviceRepository
+from whois.data.repository.presence_repository import PresenceRepository
+from whois.data.repository.user_repository import UserRepository
+from whois.entity.bitfield import BitField
+from whois.entity.device import Device
+from whois.entity.user import User, UserFlags
+from whois.visit_tracker import VisitTracker
+
+T0 = datetime(2024, 1, 1, 18, 10)
+
+
+def seen(mac_address, minutes, owner=None):
+    return Device(
+        mac_address=mac_address,
+        hostname="host",
+        last_seen=T0 + timedelta(minutes=minutes),
+        owner=owner,
+        flags=None,
+    )
+
+
+class VisitTrackerTest(TestCase):
+    def setUp(self):
+        self.tracker = VisitTracker(timedelta(minutes=30))
+
+    def observe(self, *devices):
+        visits = self.tracker.diff(devices)
+        for index, visit in enumerate(visits):
+            visit.id = visit.id or len(self.tracker) + index + 1
+        self.tracker.commit(visits)
+        return visits
+
+    def test_short_gaps_extend_the_visit(self):
+        """Observations closer than the gap belong to one visit"""
+        (first,) = self.observe(seen("aa:aa:aa:aa:aa:01", 0))
+        (extended,) = self.observe(seen("aa:aa:aa:aa:aa:01", 20))
+
+        assert extended.id == first.id
+        assert (extended.started_at, extended.ended_at) == (
+            T0,
+            T0 + timedelta(minutes=20),
+        )
+
+    def test_long_gaps_start_a_new_visit(self):
+        """A device back after the gap starts a new visit"""
+        (first,) = self.observe(seen("aa:aa:aa:aa:aa:01", 0))
+        (second,) = self.tracker.diff([seen("aa:aa:aa:aa:aa:01", 45)])
+
+        assert second.id is None
+        assert second.started_at == T0 + timedelta(minutes=45)
+
+    def test_old_observations_are_ignored(self):
+        """Observations within a visit do not change it"""
+        self.observe(seen("aa:aa:aa:aa:aa:01", 20))
+
+        assert self.tracker.diff([seen("aa:aa:aa:aa:aa:01", 10)]) == []
+
+    def test_spans(self):
+        """Extended visits newly cover the time since their previous end"""
+        self.observe(seen("aa:aa:aa:aa:aa:01", 0))
+        visits = self.tracker.diff(
+            [seen("aa:aa:aa:aa:aa:01", 20), seen("aa:aa:aa:aa:aa:02", 25)]
+        )
+
+        assert self.tracker.spans(visits) == [
+            ("aa:aa:aa:aa:aa:01", T0, T0 + timedelta(minutes=20)),
+            ("aa:aa:aa:aa:aa:02", *[T0 + timedelta(minutes=25)] * 2),
+        ]
+
+
+class PresenceRepositoryTest(TestCase):
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.repository = PresenceRepository(self.db)
+        self.tracker = VisitTracker(timedelta(minutes=30))
+
+        users = UserRepository(self.db)
+        hidden = BitField()
+        hidden.set_flag(UserFlags.is_hidden.value)
+        users.insert(User(username="visible", display_name="Visible"))
+        users.insert(User(username="hidden", display_name="Hidden", flags=hidden))
+        devices = DeviceRepository(self.db)
+        for mac_address, owner in (
+            ("aa:aa:aa:aa:aa:01", 1),
+            ("aa:aa:aa:aa:aa:02", 1),
+            ("aa:aa:aa:aa:aa:03", 2),
+            ("aa:aa:aa:aa:aa:04", None),
+        ):
+            devices.insert(seen(mac_address, 0, owner=owner))
+
+    def record(self, *devices):
+        visits = self.tracker.diff(devices)
+        spans = self.tracker.spans(visits)
+        until = max(visit.ended_at for visit in visits)
+        self.tracker.commit(self.repository.record_visits(visits, spans, until))
+
+    def test_rollups_count_unique_devices_and_visible_users(self):
+        """Hourly buckets count each device and visible owner once"""
+        self.record(seen("aa:aa:aa:aa:aa:01", 0), seen("aa:aa:aa:aa:aa:03", 0))
+        self.record(seen("aa:aa:aa:aa:aa:01", 20), seen("aa:aa:aa:aa:aa:02", 25))
+        self.record(seen("aa:aa:aa:aa:aa:01", 70), seen("aa:aa:aa:aa:aa:04", 75))
+
+        buckets = self.repository.get_hourly(T0, T0 + timedelta(hours=2))
+
+        assert [(b.start.hour, b.devices, b.users) for b in buckets] == [
+            (18, 3, 1),
+            (19, 2, 1),
+            (20, 0, 0),
+        ]
+        (day,) = self.repository.get_daily(T0, T0)
+        assert (day.devices, day.users) == (4, 1)
+
+    def test_visits_spanning_hours(self):
+        """A visit counts in every hour it overlaps"""
+        for minutes in range(0, 200, 20):
+            self.record(seen("aa:aa:aa:aa:aa:04", minutes))
+
+        buckets = self.repository.get_hourly(T0, T0 + timedelta(hours=3))
+
+        assert [b.devices for b in buckets] == [1, 1, 1, 1]
+        assert len(self.repository.get_visits_since(T0)) == 1
@@ -0,0 +1,105 @@
+from unittest import TestCase
+
+from tests.fakes import FakeClock
+from whois.entity.device import DeviceFlags
+from whois.entity.record import DeviceRecord, UserRecord
+from whois.entity.user import UserFlags
+from whois.presence_cache import PresenceCache, make_snapshot
+
+
+class FakeReadRepository:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def get_recent_with_owners(self, delta, visible_only=True):
+        self.calls += 1
+        return self.rows
+
+
+class FakeStateRepository:
+    def __init__(self):
+        self.version = 1
+
+    def get(self, key):
+        return self.version
+
+
+def device(mac_address, owner=None, flags=0):
+    return DeviceRecord(mac_address, "host", None, owner, flags)
+
+
+def user(id, flags=0):
+    return UserRecord(id, f"user{id}", f"User {id}", flags)
+
+
+class MakeSnapshotTest(TestCase):
+
+    def test_counts_visible_owners_only(self):
+        """Hidden devices and owners leave out the owner, not unclaimed devices"""
+        hidden = user(2, UserFlags.is_hidden.value)
+        anonymous = user(3, UserFlags.is_name_anonymous.value)
+        recent = [
+            (device("aa:01", 1), user(1)),
+            (device("aa:02", 1), user(1)),
+            (device("aa:03", 2), hidden),
+            (device("aa:04", 3), anonymous),
+            (device("aa:05"), None),
+            (device("aa:06", flags=DeviceFlags.is_hidden.value), None),
+        ]
+
+        snapshot = make_snapshot(7, recent)
+
+        assert [u.id for u in snapshot.users] == [1, 3]
+        assert [u.id for u in snapshot.named_users] == [1]
+        assert snapshot.headcount == 2
+        # hidden unclaimed devices are counted, like the views always did
+        assert snapshot.unknown_devices == 2
+        assert [d.mac_address for d in snapshot.unclaimed] == ["aa:05", "aa:06"]
+
+
+class PresenceCacheTest(TestCase):
+
+    def setUp(self):
+        self.devices = FakeReadRepository([(device("aa:01", 1), user(1))])
+        self.state = FakeStateRepository()
+        self.clock = FakeClock()
+        self.cache = PresenceCache(
+            self.devices,
+            self.state,
+            check_interval_s=2,
+            max_age_s=30,
+            clock=self.clock,
+        )
+        self.period = {"minutes": 20}
+
+    def test_snapshot_shared_until_version_changes(self):
+        """The snapshot is rebuilt once a newer version is seen"""
+        first = self.cache.get(self.period)
+        assert self.cache.get(self.period) is first
+
+        self.state.version = 2
+        self.clock.now = 1
+        assert self.cache.get(self.period) is first
+
+        self.clock.now = 2
+        assert self.cache.get(self.period) is not first
+        assert self.devices.calls == 2
+
+    def test_snapshot_expires(self):
+        """Devices leave the recent period without a write"""
+        first = self.cache.get(self.period)
+
+        self.clock.now = 30
+        assert self.cache.get(self.period) is not first
+
+    def test_periods_and_invalidate(self):
+        """Each period has its own snapshot, invalidate drops all of them"""
+        recent = self.cache.get(self.period)
+        day = self.cache.get({"days": 1})
+        assert day is not recent
+        assert self.devices.calls == 2
+
+        self.cache.invalidate()
+        self.cache.get(self.period)
+        assert self.devices.calls == 3
@@ -0,0 +1,181 @@
+import logging
+import os
+import tempfile
+from dataclasses import replace
+from datetime import datetime
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from whois import presence_file
+from whois.app import WhohacksApp
+from whois.data.db.database import Database
+from whois.data.repository.user_repository import UserRepository
+from whois.entity.record import DeviceRecord, UserRecord
+from whois.entity.user import User
+from whois.mikrotik import RouterOSClient, parse_leases
+from whois.presence_cache import make_snapshot
+from whois.presence_file import PresenceFile
+from whois.settings.testing import app_settings, mikrotik_settings
+from whois.worker import Worker
+
+PERIOD = {"minutes": 20}
+
+
+def snapshot(*owners):
+    last_seen = datetime(2024, 1, 1, 12)
+    return make_snapshot(
+        1,
+        [
+            (
+                DeviceRecord(f"aa:0{index}", "host", last_seen, owner, 0),
+                UserRecord(owner, f"user{owner}", f"User {owner}", 0),
+            )
+            for index, owner in enumerate(owners)
+        ],
+    )
+
+
+class PresenceFileTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.now = 1000.0
+        self.reader = PresenceFile(self.directory.name, clock=lambda: self.now)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def publish(self, generation, published, period=PERIOD):
+        presence_file.publish(
+            self.directory.name, generation, published, period, 60, now=1000.0
+        )
+
+    def test_round_trip(self):
+        """The published presence is read back, without the device list"""
+        published = snapshot(1, 2)
+        self.publish(1, published)
+
+        read = self.reader.get(PERIOD)
+
+        assert [str(user) for user in read.named_users] == ["User 1", "User 2"]
+        assert read.headcount == 2
+        assert read.fingerprint == published.fingerprint
+        assert os.listdir(self.directory.name) == [presence_file.FILE_NAME]
+
+    def test_parsed_once_per_generation(self):
+        """The file is parsed again only when a new generation replaced it"""
+        self.publish(1, snapshot(1))
+        first = self.reader.get(PERIOD)
+        assert self.reader.get(PERIOD) is first
+
+        self.publish(2, snapshot(1, 2))
+        assert self.reader.get(PERIOD).headcount == 2
+
+    def test_unusable_files(self):
+        """Missing, stale or files of another period are not used"""
+        assert self.reader.get(PERIOD) is None
+
+        self.publish(1, snapshot(1), period={"minutes": 5})
+        assert self.reader.get(PERIOD) is None
+
+        self.publish(2, snapshot(1))
+        self.now = 1061
+        assert self.reader.get(PERIOD) is None
+
+    def test_readable_by_others(self):
+        """Web processes of another user can read the published file"""
+        self.publish(1, snapshot(1))
+
+        path = os.path.join(self.directory.name, presence_file.FILE_NAME)
+        assert os.stat(path).st_mode & 0o777 == 0o644
+
+    def test_unreadable_file_logged_once(self):
+        """A file which cannot be read is only tried again once replaced"""
+        self.publish(1, snapshot(1))
+        with patch.object(
+            PresenceFile, "reload", side_effect=PermissionError("denied")
+        ) as reload:
+            with self.assertLogs(presence_file.logger, logging.ERROR) as logs:
+                assert self.reader.get(PERIOD) is None
+                assert self.reader.get(PERIOD) is None
+        assert reload.call_count == 1
+        assert len(logs.records) == 1
+
+        self.publish(2, snapshot(1))
+        assert self.reader.get(PERIOD) is not None
+
+    def test_other_version(self):
+        """A snapshot published before the last presence write is not used"""
+        self.publish(1, snapshot(1))
+
+        assert self.reader.get(PERIOD, version=1) is not None
+        assert self.reader.get(PERIOD, version=2) is None
+
+
+class PresenceFileAppTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        settings = replace(
+            mikrotik_settings,
+            MIKROTIK_URL="http://router.lan/",
+            MIKROTIK_USER="whois",
+            MIKROTIK_PASS="secret",
+            PRESENCE_FILE_DIR=self.directory.name,
+            PRESENCE_FILE_RECENT_TIME=app_settings.RECENT_TIME,
+        )
+        self.db = Database("sqlite://")
+        self.worker = Worker(self.db, settings)
+        self.whois = WhohacksApp(
+            app_settings, settings, self.db, logging.getLogger(__name__)
+        )
+        self.app = self.whois.app.test_client()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def tick(self, *macs):
+        leases = parse_leases(
+            [{"mac-address": mac, "host-name": "pc", "last-seen": "5s"} for mac in macs]
+        )
+        with patch.object(RouterOSClient, "fetch_leases", return_value=leases):
+            self.worker.tick()
+
+    def get_now(self):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(self.db.engine, "before_cursor_execute", listener)
+        try:
+            response = self.app.get("/api/now")
+        finally:
+            event.remove(self.db.engine, "before_cursor_execute", listener)
+        return response, statements
+
+    def test_now_served_from_published_file(self):
+        """After a tick /api/now only reads the presence version"""
+        UserRepository(self.db).insert(User(username="user", display_name="User"))
+        self.tick("AA:AA:AA:AA:AA:01")
+
+        response, statements = self.get_now()
+
+        assert response.get_json()["unknown_devices"] == 1
+        assert len(statements) == 1, statements
+        assert "state" in statements[0]
+
+    def test_stale_file_after_write(self):
+        """Writes of other processes are served before the file is published"""
+        self.tick("AA:AA:AA:AA:AA:01")
+        # e.g. pushed lease events written by another web process
+        with patch.object(self.worker, "publish_presence"):
+            self.tick("AA:AA:AA:AA:AA:01", "AA:AA:AA:AA:AA:02")
+
+        response, statements = self.get_now()
+        assert response.get_json()["unknown_devices"] == 2
+        assert len(statements) > 1
+
+        self.worker.publish_presence()
+        response, statements = self.get_now()
+        assert response.get_json()["unknown_devices"] == 2
+        assert len(statements) == 1, statements
@@ -0,0 +1,104 @@
+import tempfile
+from unittest import TestCase
+
+from whois.data.db.database import Database
+from whois.data.db.replicas import connect_args
+from whois.data.repository.user_repository import UserRepository
+from whois.entity.user import User
+
+
+class ReplicaRoutingTest(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.databases = []
+        self.replica_urls = []
+        # every replica has a user named after it, to tell where reads went
+        for name in ("replica1", "replica2"):
+            db_url = f"sqlite:///{self.directory.name}/{name}.sqlite"
+            replica = self.open(db_url)
+            UserRepository(replica).insert(User(username=name, display_name=name))
+            self.replica_urls.append(db_url)
+
+    def tearDown(self):
+        for database in self.databases:
+            database.remove_session()
+            database.engine.dispose()
+            database.write_engine.dispose()
+            for engine in database.replicas.engines if database.replicas else ():
+                engine.dispose()
+        self.directory.cleanup()
+
+    def open(self, db_url: str, replica_urls: list = ()) -> Database:
+        database = Database(db_url, replica_urls=list(replica_urls))
+        self.databases.append(database)
+        return database
+
+    def read_from(self, database: Database) -> list:
+        return [user.username for user in UserRepository(database).get_all()]
+
+    def test_reads_round_robin(self):
+        """Each session reads from the next replica"""
+        db = self.open(
+            f"sqlite:///{self.directory.name}/primary.sqlite", self.replica_urls
+        )
+
+        reads = []
+        for _ in range(4):
+            reads.extend(self.read_from(db))
+            db.remove_session()
+
+        assert reads == ["replica1", "replica2", "replica1", "replica2"]
+
+    def test_write_pins_session_to_primary(self):
+        """Reads after a write see it, until the session is removed"""
+        db = self.open(
+            f"sqlite:///{self.directory.name}/primary.sqlite", self.replica_urls
+        )
+        assert self.read_from(db) == ["replica1"]
+
+        UserRepository(db).insert(User(username="primary", display_name="primary"))
+        assert self.read_from(db) == ["primary"]
+
+        db.remove_session()
+        assert self.read_from(db) == ["replica2"]
+
+    def test_unhealthy_replica_is_skipped(self):
+        """Replicas failing their health check are left out, then the primary"""
+        missing = f"sqlite:///{self.directory.name}/missing/replica.sqlite"
+        db = self.open(
+            f"sqlite:///{self.directory.name}/primary.sqlite",
+            [missing, self.replica_urls[0]],
+        )
+        UserRepository(db).insert(User(username="primary", display_name="primary"))
+        db.remove_session()
+
+        assert self.read_from(db) == ["replica1"]
+        db.remove_session()
+        assert self.read_from(db) == ["replica1"]
+        db.remove_session()
+
+        db.replicas.healthy[db.replicas.engines[1]] = False
+        assert self.read_from(db) == ["primary"]
+
+    def test_one_health_check_at_a_time(self):
+        """Threads finding a check in progress go by the last result"""
+        db = self.open(
+            f"sqlite:///{self.directory.name}/primary.sqlite", self.replica_urls
+        )
+        replicas = db.replicas
+        engine = replicas.engines[0]
+        replicas.healthy[engine] = False
+        replicas.checking.add(engine)
+
+        assert not replicas.is_healthy(engine)
+        assert replicas.checked_at[engine] is None
+
+        replicas.checking.clear()
+        assert replicas.is_healthy(engine)
+        assert replicas.checking == set()
+
+    def test_replica_connect_timeout(self):
+        """Connecting to a PostgreSQL replica gives up after a short timeout"""
+        assert connect_args("postgresql://replica/whois", 2) == {"connect_timeout": 2}
+        assert connect_args("sqlite:///replica.sqlite", 2) == {}
@@ -0,0 +1,87 @@
+import tempfile
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+
+from sqlalchemy import select
+
+from tests.fakes import make_device
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import DeviceRepository
+from whois.data.table.device_archive import DeviceArchiveTable
+from whois.entity.bitfield import BitField
+from whois.entity.device import DeviceFlags
+from whois.retention import RetentionJob
+from whois.settings.testing import mikrotik_settings
+
+NOW = datetime(2024, 6, 1, tzinfo=timezone.utc)
+
+
+class RetentionJobTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db = Database(f"sqlite:///{self.directory.name}/test.sqlite")
+        self.repository = DeviceRepository(self.db)
+
+        infrastructure = BitField()
+        infrastructure.set_flag(DeviceFlags.is_infrastructure.value)
+        for device in (
+            make_device("00:00:00:00:00:01", last_seen=NOW - timedelta(days=1)),
+            make_device("00:00:00:00:00:02", last_seen=NOW - timedelta(days=100)),
+            make_device(
+                "00:00:00:00:00:03", last_seen=NOW - timedelta(days=100), owner=1
+            ),
+            make_device(
+                "00:00:00:00:00:04",
+                last_seen=NOW - timedelta(days=100),
+                flags=infrastructure,
+            ),
+            # randomized MAC addresses
+            make_device("02:00:00:00:00:05", last_seen=NOW - timedelta(days=20)),
+            make_device("0A:00:00:00:00:06", last_seen=NOW - timedelta(days=5)),
+        ):
+            self.repository.insert(device)
+
+    def tearDown(self):
+        self.db.remove_session()
+        self.db.engine.dispose()
+        self.db.write_engine.dispose()
+        self.directory.cleanup()
+
+    def remaining(self):
+        return sorted(d.mac_address for d in self.repository.get_all())
+
+    def test_stale_ghost_devices_are_removed(self):
+        """Only unclaimed, unflagged devices past their retention are removed"""
+        settings = replace(mikrotik_settings, RETENTION_BATCH_SIZE=1)
+
+        result = RetentionJob(self.db, settings).run(NOW)
+
+        assert (result.removed, result.archived, result.batches) == (2, 0, 3)
+        assert self.remaining() == [
+            "00:00:00:00:00:01",
+            "00:00:00:00:00:03",
+            "00:00:00:00:00:04",
+            "0A:00:00:00:00:06",
+        ]
+
+    def test_archive(self):
+        """Removed devices can be kept in the archive table"""
+        settings = replace(mikrotik_settings, RETENTION_ARCHIVE=True)
+
+        result = RetentionJob(self.db, settings).run(NOW)
+
+        assert result.archived == 2
+        archived = self.db.session.execute(
+            select(DeviceArchiveTable.mac_address)
+        ).scalars()
+        assert sorted(archived) == ["00:00:00:00:00:02", "02:00:00:00:00:05"]
+
+    def test_disabled(self):
+        """A retention of 0 days keeps all devices"""
+        settings = replace(mikrotik_settings, RETENTION_DAYS=0)
+
+        result = RetentionJob(self.db, settings).run(NOW)
+
+        assert result.removed == 0
+        assert len(self.remaining()) == 6
@@ -0,0 +1,73 @@
+from unittest import TestCase
+
+from tests.fakes import FakeClock
+from whois.scheduler import AdaptiveScheduler
+
+
+class AdaptiveSchedulerTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.scheduler = AdaptiveScheduler(
+            min_interval_s=60,
+            max_interval_s=300,
+            churn_window=3,
+            clock=self.clock,
+            sleep=self.clock.sleep,
+        )
+
+    def test_first_tick_is_immediate(self):
+        """The first tick starts right away"""
+        assert self.scheduler.next_tick(self.clock.now) == self.clock.now
+
+    def test_fixed_rate(self):
+        """Ticks are due relative to the previous tick start, not its end"""
+        self.scheduler.last_tick = 1000.0
+
+        assert self.scheduler.next_tick(1020.0) == 1060.0
+
+    def test_overrun_ticks_are_skipped(self):
+        """A tick longer than the interval skips the missed slots"""
+        self.scheduler.last_tick = 1000.0
+
+        assert self.scheduler.next_tick(1130.0) == 1180.0
+        assert self.scheduler.skipped == 2
+
+    def test_interval_adapts_to_churn(self):
+        """The interval grows when nothing changes and shrinks on churn"""
+        for _ in range(3):
+            self.scheduler.record(changed=0, total=100)
+        assert self.scheduler.interval_s == 300
+
+        self.scheduler.record(changed=30, total=100)
+        assert self.scheduler.interval_s == 60
+
+        self.scheduler.record(changed=0, total=100)
+        self.scheduler.record(changed=0, total=100)
+        self.scheduler.record(changed=0, total=0)
+        assert self.scheduler.interval_s == 300
+
+    def test_trigger_wakes_up_wait(self):
+        """A triggered refresh starts the next tick without waiting"""
+        self.scheduler.last_tick = self.clock.now - 120
+        self.scheduler.trigger()
+
+        assert self.scheduler.wait() is True
+        assert self.scheduler.last_tick == self.clock.now
+
+    def test_trigger_is_rate_limited(self):
+        """A refresh right after a tick waits for the minimum interval"""
+        self.scheduler.last_tick = self.clock.now - 20
+        self.scheduler.trigger()
+
+        assert self.scheduler.wait() is True
+        assert self.clock.now == 1040.0
+        assert self.scheduler.last_tick == 1040.0
+
+    def test_restart_is_not_rate_limited(self):
+        """A restart ticks right away, even right after a skipped tick"""
+        self.scheduler.last_tick = self.clock.now
+        self.scheduler.restart()
+
+        assert self.scheduler.wait() is True
+        assert self.scheduler.last_tick == self.clock.now
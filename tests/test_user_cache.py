@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+from tests.fakes import FakeClock
+from whois.data.db.database import Database
+from whois.data.repository.user_repository import UserRepository
+from whois.entity.user import User, UserFlags
+from whois.ttl_cache import TtlCache
+
+
+class TtlCacheTest(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = TtlCache(max_size=2, ttl_s=10, clock=self.clock)
+
+    def test_entries_expire(self):
+        """Entries are served until their TTL passed"""
+        self.cache.set("a", 1)
+        self.clock.now = 9.9
+        assert self.cache.get("a") == 1
+
+        self.clock.now = 10
+        assert self.cache.get("a") is None
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+    def test_least_recently_used_is_evicted(self):
+        """A full cache drops the entry read or written the longest ago"""
+        self.cache.set("a", 1)
+        self.cache.set("b", 2)
+        self.cache.get("a")
+        self.cache.set("c", 3)
+
+        assert self.cache.get("b") is None
+        assert (self.cache.get("a"), self.cache.get("c")) == (1, 3)
+        assert self.cache.evictions == 1
+
+
+class UserRepositoryCacheTest(TestCase):
+
+    def setUp(self):
+        self.db = Database("sqlite://")
+        self.cache = TtlCache(max_size=8, ttl_s=30)
+        self.repository = UserRepository(self.db, self.cache)
+        self.repository.insert(User(username="user", display_name="User"))
+
+    def test_get_by_id_is_cached(self):
+        """Repeated lookups by id, as int or str, hit the cache"""
+        self.repository.get_by_id(1)
+        self.repository.get_by_id("1")
+
+        assert (self.cache.hits, self.cache.misses) == (1, 1)
+
+    def test_update_invalidates(self):
+        """Flag changes are visible to the next lookup right away"""
+        user = self.repository.get_by_id(1)
+        user.flags.set_flag(UserFlags.is_hidden.value)
+        self.repository.update(user)
+
+        assert self.repository.get_by_id(1).is_hidden
+
+    def test_returns_copies(self):
+        """Changes to a returned user do not leak into the cache"""
+        user = self.repository.get_by_id(1)
+        user.display_name = "Changed"
+        user.flags.set_flag(UserFlags.is_hidden.value)
+
+        cached = self.repository.get_by_id(1)
+        assert cached.display_name == "User"
+        assert not cached.is_hidden
+
+    def test_profile_update_keeps_other_changes(self):
+        """A profile edit from a stale user does not revert other writes"""
+        stale = self.repository.get_by_id(1)
+        # e.g. another process changed the username and flags meanwhile
+        fresh = self.repository.get_by_id(1)
+        fresh.username = "renamed"
+        fresh.flags.set_flag(4)
+        UserRepository(self.db).update(fresh)
+
+        stale.flags.set_flag(UserFlags.is_hidden.value)
+        self.repository.update_profile(
+            stale.id, "New name", int(stale.flags), UserFlags.is_hidden.value
+        )
+
+        user = self.repository.get_by_id(1)
+        assert (user.username, user.display_name) == ("renamed", "New name")
+        assert user.is_hidden and user.flags.has_flag(4)
+        assert user.password == stale.password
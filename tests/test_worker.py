@@ -0,0 +1,186 @@
+import threading
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta, timezone
+from unittest import TestCase
+from unittest.mock import patch
+
+from whois.data.db.database import Database
+from whois.mikrotik import RouterOSClient, parse_leases
+from whois.settings.settings_template import RouterSettings
+from whois.settings.testing import mikrotik_settings
+from whois.worker import Worker
+
+settings = replace(
+    mikrotik_settings,
+    MIKROTIK_URL="http://router.lan/",
+    MIKROTIK_USER="whois",
+    MIKROTIK_PASS="secret",
+)
+
+
+def make_leases(*entries):
+    return parse_leases(
+        [
+            {"mac-address": mac, "host-name": hostname, "last-seen": last_seen}
+            for mac, hostname, last_seen in entries
+        ]
+    )
+
+
+class WorkerChangeCacheTest(TestCase):
+
+    def setUp(self):
+        self.database = Database("sqlite://")
+        self.worker = Worker(self.database, settings)
+        self.repository = self.worker.device_repository
+        self.worker.load_cache()
+
+    def update(self, *entries):
+        with patch.object(
+            RouterOSClient, "fetch_leases", return_value=make_leases(*entries)
+        ):
+            return self.worker.update_devices()
+
+    def test_new_devices_are_written(self):
+        """Devices missing from the cache are inserted"""
+        result = self.update(("aa:aa:aa:aa:aa:01", "laptop", "10s"))
+
+        assert result.inserted == 1
+        assert len(self.repository.get_all()) == 1
+
+    def test_small_last_seen_moves_are_skipped(self):
+        """last_seen moves below the granularity are not written"""
+        self.update(("aa:aa:aa:aa:aa:01", "laptop", "10s"))
+
+        with patch.object(self.repository, "upsert_many") as upsert_many:
+            upsert_many.return_value.unchanged = 0
+            self.update(("aa:aa:aa:aa:aa:01", "laptop", "5s"))
+
+        upsert_many.assert_called_once_with([])
+
+    def test_changes_are_written(self):
+        """Hostname changes and large last_seen moves are written"""
+        self.update(
+            ("aa:aa:aa:aa:aa:01", "laptop", "10s"),
+            ("aa:aa:aa:aa:aa:02", "phone", "1h"),
+        )
+
+        result = self.update(
+            ("aa:aa:aa:aa:aa:01", "renamed", "10s"),
+            ("aa:aa:aa:aa:aa:02", "phone", "1s"),
+        )
+
+        assert (result.inserted, result.updated) == (0, 2)
+
+    def test_present_devices_start_visits(self):
+        """Recently seen devices are recorded as visits and counted"""
+        self.update(
+            ("aa:aa:aa:aa:aa:01", "laptop", "10s"),
+            ("aa:aa:aa:aa:aa:02", "phone", "1d"),
+        )
+
+        presence = self.worker.presence_repository
+        now = datetime.now(timezone.utc)
+        (visit,) = presence.get_visits_since(now - timedelta(hours=1))
+        assert visit.mac_address == "aa:aa:aa:aa:aa:01"
+        (bucket,) = presence.get_hourly(visit.ended_at, visit.ended_at)
+        assert bucket.devices == 1
+
+    def test_visits_extended_every_tick(self):
+        """Visits follow small last_seen moves the devices table skips"""
+        self.update(("aa:aa:aa:aa:aa:01", "laptop", "120s"))
+        self.update(("aa:aa:aa:aa:aa:01", "laptop", "10s"))
+
+        now = datetime.now(timezone.utc)
+        (visit,) = self.worker.presence_repository.get_visits_since(
+            now - timedelta(hours=1)
+        )
+        assert visit.ended_at - visit.started_at >= timedelta(seconds=100)
+
+    def test_cache_is_loaded_from_database(self):
+        """A restarted worker does not rewrite devices it already knows"""
+        self.update(("aa:aa:aa:aa:aa:01", "laptop", "10s"))
+
+        worker = Worker(self.database, settings)
+        worker.load_cache()
+        leases = make_leases(("aa:aa:aa:aa:aa:01", "laptop", "10s"))
+        with patch.object(RouterOSClient, "fetch_leases", return_value=leases):
+            result = worker.update_devices()
+
+        assert worker.change_cache.granularity == timedelta(seconds=300)
+        assert (result.inserted, result.updated, result.unchanged) == (0, 0, 1)
+
+
+class WorkerMultiRouterTest(TestCase):
+
+    def setUp(self):
+        self.settings = replace(
+            settings,
+            MIKROTIK_ROUTERS=[
+                RouterSettings(URL="http://iot.lan/", USER="whois", PASS="secret"),
+                RouterSettings(URL="http://guest.lan/", USER="whois", PASS="secret"),
+            ],
+            MIKROTIK_TIMEOUT_S=0.5,
+        )
+        self.worker = Worker(Database("sqlite://"), self.settings)
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def fake_fetch(self, client):
+        url = client.url
+        if url == "http://guest.lan/":
+            self.release.wait()
+        return {
+            "http://router.lan/": make_leases(
+                ("aa:aa:aa:aa:aa:01", "laptop", "1h"),
+                ("aa:aa:aa:aa:aa:02", "phone", "1m"),
+            ),
+            "http://iot.lan/": make_leases(("aa:aa:aa:aa:aa:01", "laptop", "5s")),
+            "http://guest.lan/": make_leases(("aa:aa:aa:aa:aa:03", "guest", "5s")),
+        }[url]
+
+    def test_routers_are_polled_concurrently(self):
+        """A hung router does not delay leases from the other routers"""
+        with patch.object(
+            RouterOSClient, "fetch_leases", autospec=True, side_effect=self.fake_fetch
+        ):
+            started = time.monotonic()
+            leases = self.worker.fetch_all_leases()
+            elapsed = time.monotonic() - started
+
+        assert elapsed < 2 * self.settings.MIKROTIK_TIMEOUT_S
+        merged = {lease.mac_address: lease.last_seen for lease in leases}
+        assert merged == {
+            "aa:aa:aa:aa:aa:01": timedelta(seconds=5),
+            "aa:aa:aa:aa:aa:02": timedelta(minutes=1),
+        }
+
+    def test_no_router_answered(self):
+        """A tick fails when no router could be polled"""
+        with patch.object(
+            RouterOSClient, "fetch_leases", side_effect=OSError("unreachable")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.worker.fetch_all_leases()
+
+
+class WorkerScheduleTest(TestCase):
+
+    def test_pushed_events_back_off_to_reconciliation(self):
+        """With lease events the poll adapts between the frequency and reconcile"""
+        worker = Worker(Database("sqlite://"), settings)
+
+        assert worker.scheduler.min_interval_s == settings.WORKER_FREQUENCY_S
+        assert worker.scheduler.max_interval_s == settings.WORKER_RECONCILE_S
+
+    def test_ticks_too_far_apart(self):
+        """The worker does not start when devices would leave the recent period"""
+        worker = Worker(
+            Database("sqlite://"), replace(settings, WORKER_RECONCILE_S=900)
+        )
+
+        with self.assertRaises(ValueError):
+            worker.run()
@@ -1,17 +1,20 @@
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+import hmac
+from datetime import datetime, timedelta, timezone
 from logging import Logger
 
 from authlib.integrations.flask_client import OAuth
 from flask import (
     Flask,
+    Response,
     abort,
     flash,
     jsonify,
     redirect,
     render_template,
     request,
+    session,
     url_for,
 )
 from flask_cors import CORS
@@ -25,11 +28,25 @@ from flask_login import (
 from sqlalchemy.orm.exc import NoResultFound
 
 from whois.data.db.database import Database
-from whois.data.repository.device_repository import DeviceRepository
+from whois.data.repository.device_read_repository import DeviceReadRepository
+from whois.data.repository.device_repository import DeviceRepository, as_utc_naive
+from whois.data.repository.presence_repository import PresenceRepository
+from whois.data.repository.state_repository import REFRESH_REQUESTED, StateRepository
 from whois.data.repository.user_repository import UserRepository
+from whois.entity.device import DeviceFlags
+from whois.entity.presence import PresenceSnapshot
 from whois.entity.user import User, UserFlags
 from whois.helpers import Helpers
+from whois.ingest import LeaseEventBuffer, events_to_devices
+from whois.presence_cache import PresenceCache
+from whois.presence_file import PresenceFile
 from whois.settings.settings_template import AppSettings, MikrotikSettings
+from whois.ttl_cache import TtlCache
+
+# Longest range answered by /api/history, a quarter of hourly buckets
+MAX_HISTORY_BUCKETS = 24 * 92
+# Longest range answered by /api/history/occupancy, in days
+MAX_OCCUPANCY_DAYS = 366
 
 
 class WhohacksApp:
@@ -54,8 +71,38 @@ class WhohacksApp:
         self.app.config.from_object(mikrotik_settings)
 
         self.database = database
-        self.user_repository = UserRepository(database)
+        self.user_cache = None
+        if app_settings.USER_CACHE_SIZE:
+            self.user_cache = TtlCache(
+                app_settings.USER_CACHE_SIZE, app_settings.USER_CACHE_TTL_S
+            )
+        self.user_repository = UserRepository(database, self.user_cache)
         self.device_repository = DeviceRepository(database)
+        # read-only views render records built straight from rows
+        self.device_read_repository = DeviceReadRepository(database)
+        self.state_repository = StateRepository(database)
+        self.presence_repository = PresenceRepository(database)
+        # /api/now changes at most once per worker tick, or per flush of
+        # pushed lease events
+        self.now_max_age_s = (
+            mikrotik_settings.INGEST_FLUSH_S
+            if mikrotik_settings.INGEST_TOKEN
+            else mikrotik_settings.WORKER_FREQUENCY_S
+        )
+        self.presence_cache = PresenceCache(
+            self.device_read_repository,
+            self.state_repository,
+            check_interval_s=app_settings.PRESENCE_CHECK_S,
+            max_age_s=app_settings.PRESENCE_MAX_AGE_S,
+        )
+        self.presence_file = None
+        if mikrotik_settings.PRESENCE_FILE_DIR:
+            self.presence_file = PresenceFile(mikrotik_settings.PRESENCE_FILE_DIR)
+        self.lease_buffer = LeaseEventBuffer(
+            self.device_repository,
+            flush_interval_s=mikrotik_settings.INGEST_FLUSH_S,
+            max_batch=mikrotik_settings.INGEST_MAX_BATCH,
+        )
 
         self.login_manager = LoginManager()
         self.login_manager.init_app(self.app)
@@ -80,8 +127,9 @@ class WhohacksApp:
 
     def add_rules(self) -> None:
         self.login_manager.user_loader(self.load_user)
-        self.app.before_request = self.before_request
-        self.app.teardown_appcontext = self.after_request
+        self.app.before_request(self.before_request)
+        self.app.after_request(self.after_request)
+        self.app.teardown_appcontext(self.teardown)
 
     def add_template_filters(self) -> None:
         def local_time(dt: datetime):
@@ -93,9 +141,23 @@ class WhohacksApp:
         self.app.add_url_rule("/", view_func=self.index)
         self.app.add_url_rule("/devices", view_func=self.devices)
         self.app.add_url_rule("/api/now", view_func=self.now_at_space)
+        self.app.add_url_rule("/api/history/hourly", view_func=self.history_hourly)
+        self.app.add_url_rule("/api/history/daily", view_func=self.history_daily)
+        self.app.add_url_rule(
+            "/api/history/occupancy", view_func=self.history_occupancy
+        )
+        self.app.add_url_rule("/metrics", view_func=self.metrics)
+        self.app.add_url_rule(
+            "/api/ingest/lease", methods=["POST"], view_func=self.ingest_lease
+        )
         self.app.add_url_rule(
-            "/device",
-            endpoint="<mac_address>",
+            "/api/refresh",
+            methods=["POST"],
+            view_func=self.helpers.in_space_required(self.request_refresh),
+        )
+        self.app.add_url_rule(
+            "/device/<mac_address>",
+            endpoint="device_view",
             methods=["GET", "POST"],
             view_func=self.helpers.in_space_required(login_required(self.device_view)),
         )
@@ -123,8 +185,7 @@ class WhohacksApp:
             return None
 
     def before_request(self):
-        self.app.logger.info("connecting to db")
-        self.database.connect()
+        self.database.instrumentation.reset()
 
         if request.headers.getlist("X-Forwarded-For"):
             ip_addr = request.headers.getlist("X-Forwarded-For")[0]
@@ -136,61 +197,87 @@ class WhohacksApp:
         else:
             ip_addr = request.remote_addr
 
-        if not self.helpers.ip_range(self.app_settings.ip_mask, ip_addr):
+        if not self.helpers.ip_range(self.helpers.ip_mask, ip_addr):
             self.app.logger.error("%s", request.headers)
-            flash("Outside local network, some functions forbidden!", "outside-warning")
+            # flashing writes the session cookie, only HTML views show it
+            if self.is_html_view():
+                flash(
+                    "Outside local network, some functions forbidden!",
+                    "outside-warning",
+                )
 
-    def after_request(self, error):
-        if self.database.is_connected:
-            self.app.logger.info("Closing the database connection")
-            self.database.disconnect()
-        else:
-            self.app.logger.info("Database connection was already closed")
+    @staticmethod
+    def is_html_view() -> bool:
+        return not (
+            request.path.startswith("/api/")
+            or request.endpoint in ("static", "metrics", None)
+        )
+
+    def after_request(self, response):
+        if self.app.debug:
+            stats = self.database.instrumentation.stats
+            response.headers["Server-Timing"] = (
+                f'db;dur={stats.total_s * 1000:.2f};desc="{stats.count} queries"'
+            )
+            response.headers["X-DB-Query-Count"] = str(stats.count)
+        if response.cache_control.public and (
+            request.cookies
+            or self.app.session_interface.should_set_cookie(self.app, session)
+        ):
+            # shared caches must not hand a session cookie to other clients
+            response.cache_control.public = False
+            response.cache_control.private = True
+        return response
+
+    def teardown(self, error):
+        # returns the connection of the request session, if one was used
+        self.database.remove_session()
 
         if error:
             self.app.logger.error(error)
 
+    def shared_presence(self, period: dict) -> PresenceSnapshot:
+        """Presence published by the worker, from the database if unavailable"""
+        if self.presence_file is not None:
+            version = self.presence_cache.current_version()
+            snapshot = self.presence_file.get(period, version)
+            if snapshot is not None:
+                return snapshot
+        return self.presence_cache.get(period)
+
+    def presence_changed(self) -> None:
+        """Show a claim or profile change without waiting for the next tick"""
+        self.presence_cache.invalidate()
+
     # Routes for Flask App
     def index(self):
         """Serve list of people in hs, show panel for logged users"""
         self.logger.debug("Called '/'")
-        recent = self.device_repository.get_recent(
-            timedelta(**self.app_settings.RECENT_TIME)
-        )
-        visible_devices = self.helpers.filter_hidden(recent)
-        users = self.helpers.filter_hidden(
-            self.helpers.owners_from_devices(visible_devices)
-        )
+        snapshot = self.shared_presence(self.app_settings.RECENT_TIME)
 
         return render_template(
             "landing.html",
-            users=self.helpers.filter_anon_names(users),
-            headcount=len(users),
-            unknowncount=len(self.helpers.unclaimed_devices(recent)),
+            users=snapshot.named_users,
+            headcount=snapshot.headcount,
+            unknowncount=snapshot.unknown_devices,
             **self.common_vars_tpl,
         )
 
     @login_required
     def devices(self):
         self.logger.debug("Called '/devices'")
-        recent = self.device_repository.get_recent(
-            timedelta(**self.app_settings.RECENT_TIME)
-        )
-        visible_devices = self.helpers.filter_hidden(recent)
-        users = self.helpers.filter_hidden(
-            self.helpers.owners_from_devices(visible_devices)
-        )
+        snapshot = self.presence_cache.get(self.app_settings.RECENT_TIME)
 
         if current_user.is_authenticated:
-            unclaimed = self.helpers.unclaimed_devices(recent)
-            mine = self.device_repository.get_by_user_id(current_user.get_id())
             return render_template(
                 "devices.html",
-                unclaimed=unclaimed,
-                recent=recent,
-                my_devices=mine,
-                users=self.helpers.filter_anon_names(users),
-                headcount=len(users),
+                unclaimed=snapshot.unclaimed,
+                recent=snapshot.recent,
+                my_devices=self.device_read_repository.get_by_user_id(
+                    current_user.get_id()
+                ),
+                users=snapshot.named_users,
+                headcount=snapshot.headcount,
                 **self.common_vars_tpl,
             )
 
@@ -201,37 +288,150 @@ class WhohacksApp:
         requests should be from hsp.sh domain or from HSWAN
         """
         self.logger.debug("Called '/api/now'")
-        period = {**self.app_settings.RECENT_TIME}
+        snapshot = self.shared_presence(self.helpers.recent_period(request.args))
 
-        for key in ["days", "hours", "minutes"]:
-            if key in request.args:
-                period[key] = request.args.get(key, default=0, type=int)
+        if request.if_none_match.contains(snapshot.fingerprint):
+            response = Response(status=304)
+        else:
+            data = self.helpers.now_at_space(snapshot)
+            self.logger.info("sending request for /api/now {}".format(data))
+            response = jsonify(data)
+
+        # If-Modified-Since is ignored, no date changes along with the presence
+        response.set_etag(snapshot.fingerprint)
+        response.cache_control.public = True
+        response.cache_control.max_age = self.now_max_age_s
+        return response
+
+    def metrics(self):
+        """Query histograms and cache counters of this process, for Prometheus"""
+        metrics = self.database.instrumentation.render_metrics()
+        if self.user_cache is not None:
+            metrics += self.user_cache.render_metrics("user_cache")
+        return Response(metrics, mimetype="text/plain; version=0.0.4")
+
+    def history_hourly(self):
+        """Unique devices and users per UTC hour, the last day by default"""
+        self.logger.debug("Called '/api/history/hourly'")
+        return self.history(
+            self.presence_repository.get_hourly, timedelta(hours=1), timedelta(days=1)
+        )
 
-        recent = self.device_repository.get_recent(
-            timedelta(**self.app_settings.RECENT_TIME)
+    def history_daily(self):
+        """Unique devices and users per UTC day, the last 30 days by default"""
+        self.logger.debug("Called '/api/history/daily'")
+        return self.history(
+            self.presence_repository.get_daily, timedelta(days=1), timedelta(days=30)
         )
-        users = self.helpers.filter_hidden(self.helpers.owners_from_devices(recent))
 
-        data = {
-            "users": sorted(map(str, self.helpers.filter_anon_names(users))),
-            "headcount": len(users),
-            "unknown_devices": len(self.helpers.unclaimed_devices(recent)),
-        }
+    def history_occupancy(self):
+        """
+        Occupancy heatmap: minutes of each UTC hour in which any device was
+        present, per day, the last 30 days by default
+        """
+        self.logger.debug("Called '/api/history/occupancy'")
+        try:
+            end = self.parse_time_arg("end") or datetime.now(timezone.utc)
+            start = self.parse_time_arg("start") or end - timedelta(days=30)
+        except ValueError as exc:
+            self.logger.error("invalid occupancy range: {}".format(exc))
+            abort(400)
+
+        if start > end or (end - start).days > MAX_OCCUPANCY_DAYS:
+            abort(400)
+
+        days = self.presence_repository.get_occupancy(start.date(), end.date())
+        return jsonify(
+            {
+                "days": [
+                    {"day": day.isoformat(), "hours": bitmap.counts(60)}
+                    for day, bitmap in days.items()
+                ]
+            }
+        )
 
-        self.logger.info("sending request for /api/now {}".format(data))
+    def history(self, get_buckets, step: timedelta, default_range: timedelta):
+        """
+        Answer a range query from the presence rollups, the range is given by
+        `start` and `end` ISO 8601 query arguments
+        """
+        try:
+            end = self.parse_time_arg("end") or datetime.now(timezone.utc)
+            start = self.parse_time_arg("start") or end - default_range
+        except ValueError as exc:
+            self.logger.error("invalid history range: {}".format(exc))
+            abort(400)
+
+        if start > end or (end - start) / step > MAX_HISTORY_BUCKETS:
+            abort(400)
+
+        buckets = get_buckets(start, end)
+        return jsonify(
+            {
+                "buckets": [
+                    {
+                        "start": bucket.start.isoformat() + "Z",
+                        "devices": bucket.devices,
+                        "users": bucket.users,
+                    }
+                    for bucket in buckets
+                ]
+            }
+        )
 
-        return jsonify(data)
+    @staticmethod
+    def parse_time_arg(name: str) -> datetime | None:
+        """Parse an ISO 8601 query argument, naive times are taken as UTC"""
+        value = request.args.get(name)
+        if not value:
+            return None
+        return as_utc_naive(datetime.fromisoformat(value)).replace(tzinfo=timezone.utc)
+
+    def ingest_lease(self):
+        """
+        Accept lease events pushed by RouterOS lease scripts, a single event
+        or a list of them, authenticated with the ingest bearer token
+        """
+        self.logger.debug("Called '/api/ingest/lease'")
+        token = self.mikrotik_settings.INGEST_TOKEN
+        if not token:
+            abort(404)
+
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization, f"Bearer {token}"):
+            abort(401)
+
+        try:
+            devices, ignored = events_to_devices(request.get_json(force=True))
+        except (KeyError, TypeError, ValueError, AttributeError) as exc:
+            self.logger.error("invalid lease event: {}".format(exc))
+            abort(400)
+
+        self.lease_buffer.add(devices)
+        return jsonify({"accepted": len(devices), "ignored": ignored}), 202
+
+    def request_refresh(self):
+        """Ask the worker to poll the routers now instead of at its next tick"""
+        self.logger.debug("Called '/api/refresh'")
+        self.state_repository.increment(REFRESH_REQUESTED)
+        return jsonify({"refresh": "requested"}), 202
 
     def set_device_flags(self, device, new_flags):
-        if device.owner is not None and device.owner.get_id() != current_user.get_id():
+        if device.owner is not None and device.owner != current_user.get_id():
             self.logger.error("no permission for {}".format(current_user.username))
             flash("No permission!".format(device.mac_address), "error")
             return
-        device.is_hidden = "hidden" in new_flags
-        device.is_esp = "esp" in new_flags
-        device.is_infrastructure = "infrastructure" in new_flags
-        print(device.flags)
-        device.save()
+        for name, flag in (
+            ("hidden", DeviceFlags.is_hidden),
+            ("esp", DeviceFlags.is_esp),
+            ("infrastructure", DeviceFlags.is_infrastructure),
+        ):
+            if name in new_flags:
+                device.flags.set_flag(flag.value)
+            else:
+                device.flags.unset_flag(flag.value)
+        self.device_repository.set_flags(device.mac_address, device.flags)
+        self.presence_changed()
         self.logger.info(
             "{} changed {} flags to {}".format(
                 current_user.username, device.mac_address, device.flags
@@ -266,20 +466,25 @@ class WhohacksApp:
             self.logger.error("no permission for {}".format(current_user.username))
             flash("No permission!".format(device.mac_address), "error")
             return
+        if not self.device_repository.claim(device.mac_address, current_user.get_id()):
+            # claimed by someone else since the device was loaded
+            flash("{} is already claimed".format(device.mac_address), "error")
+            return
         device.owner = current_user.get_id()
-        device.save()
+        self.presence_changed()
         self.logger.info(
             "{} claim {}".format(current_user.username, device.mac_address)
         )
         flash("Claimed {}!".format(device.mac_address), "success")
 
     def unclaim_device(self, device):
-        if device.owner is not None and device.owner.get_id() != current_user.get_id():
+        if device.owner is not None and device.owner != current_user.get_id():
             self.logger.error("no permission for {}".format(current_user.username))
             flash("No permission!".format(device.mac_address), "error")
             return
         device.owner = None
-        device.save()
+        self.device_repository.set_owner(device.mac_address, None)
+        self.presence_changed()
         self.logger.info(
             "{} unclaim {}".format(current_user.username, device.mac_address)
         )
@@ -411,12 +616,14 @@ class WhohacksApp:
         self.logger.debug("Called '/profile'")
         if request.method == "POST":
             if current_user.auth(request.values.get("password", None)) is True:
+                new_password = None
                 try:
                     if (
                         request.form["new_password"] is not None
                         and len(request.form["new_password"]) > 0
                     ):
                         current_user.password = request.form["new_password"]
+                        new_password = current_user.password
                 except Exception as exc:
                     if exc.args[0] == "too_short":
                         flash("Password too short, minimum length is 3", "warning")
@@ -438,7 +645,17 @@ class WhohacksApp:
                     self.logger.info(
                         "flags: got {} set {:b}".format(new_flags, current_user.flags)
                     )
-                    self.user_repository.update(current_user)
+                    profile_flags = (
+                        UserFlags.is_hidden.value | UserFlags.is_name_anonymous.value
+                    )
+                    self.user_repository.update_profile(
+                        current_user.id,
+                        current_user.display_name,
+                        int(current_user.flags),
+                        profile_flags,
+                        password=new_password,
+                    )
+                    self.presence_changed()
 
                     flash("Saved", "success")
             else:
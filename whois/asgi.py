@@ -0,0 +1,126 @@
+import json
+from logging import Logger
+from urllib.parse import parse_qsl
+
+from werkzeug.http import parse_etags, quote_etag
+
+from whois.data.db.async_database import AsyncDatabase
+from whois.data.repository.async_device_repository import AsyncDeviceRepository
+from whois.data.repository.async_state_repository import AsyncStateRepository
+from whois.data.repository.async_user_repository import AsyncUserRepository
+from whois.helpers import Helpers
+from whois.presence_cache import AsyncPresenceCache
+from whois.settings.settings_template import AppSettings, MikrotikSettings
+
+
+class AsyncWhohacksApp:
+    """ASGI app serving the polled JSON endpoints of WhohacksApp.
+
+    A request waiting on the database only suspends its coroutine, so one
+    process serves many concurrent pollers of /api/now. The HTML views, login
+    and claiming stay with the synchronous WhohacksApp.
+    """
+
+    def __init__(
+        self,
+        app_settings: AppSettings,
+        mikrotik_settings: MikrotikSettings,
+        database: AsyncDatabase,
+        logger: Logger,
+    ):
+        self.logger = logger
+        self.app_settings = app_settings
+        self.database = database
+        self.user_repository = AsyncUserRepository(database)
+        self.device_repository = AsyncDeviceRepository(database)
+        self.state_repository = AsyncStateRepository(database)
+        self.helpers = Helpers(app_settings)
+        # see WhohacksApp.now_max_age_s
+        self.now_max_age_s = (
+            mikrotik_settings.INGEST_FLUSH_S
+            if mikrotik_settings.INGEST_TOKEN
+            else mikrotik_settings.WORKER_FREQUENCY_S
+        )
+        self.presence_cache = AsyncPresenceCache(
+            self.device_repository,
+            self.state_repository,
+            check_interval_s=app_settings.PRESENCE_CHECK_S,
+            max_age_s=app_settings.PRESENCE_MAX_AGE_S,
+        )
+
+        self.routes = {
+            "/api/now": self.now_at_space,
+        }
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle(scope, send)
+
+    async def lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.database.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope, send) -> None:
+        headers = []
+        view = self.routes.get(scope["path"])
+        if view is None:
+            status, data = 404, {"error": "Not found"}
+        elif scope["method"] not in ("GET", "HEAD"):
+            status, data = 405, {"error": "Method not allowed"}
+        else:
+            args = dict(parse_qsl(scope["query_string"].decode("latin-1")))
+            request_headers = {
+                name.decode("latin-1"): value.decode("latin-1")
+                for name, value in scope["headers"]
+            }
+            try:
+                status, data, headers = await view(args, request_headers)
+            except Exception:
+                self.logger.exception(f"Could not serve {scope['path']}")
+                status, data = 500, {"error": "Internal server error"}
+
+        body = b"" if status == 304 else json.dumps(data).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    # same as the CORS setup of WhohacksApp for /api/*
+                    (b"access-control-allow-origin", b"*"),
+                    *headers,
+                ],
+            }
+        )
+        await send(
+            {
+                "type": "http.response.body",
+                "body": body if scope["method"] != "HEAD" else b"",
+            }
+        )
+
+    async def now_at_space(self, args: dict, headers: dict) -> tuple:
+        """See WhohacksApp.now_at_space"""
+        self.logger.debug("Called '/api/now'")
+        snapshot = await self.presence_cache.get(self.helpers.recent_period(args))
+        response_headers = [
+            (b"etag", quote_etag(snapshot.fingerprint).encode()),
+            # the async app sets no cookies
+            (b"cache-control", f"public, max-age={self.now_max_age_s}".encode()),
+        ]
+
+        if parse_etags(headers.get("if-none-match")).contains(snapshot.fingerprint):
+            return 304, None, response_headers
+
+        data = self.helpers.now_at_space(snapshot)
+        self.logger.info("sending request for /api/now {}".format(data))
+        return 200, data, response_headers
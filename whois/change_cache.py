@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from whois.data.repository.device_repository import as_utc_naive
+from whois.entity.device import Device
+
+
+class DeviceChangeCache:
+    """In-memory snapshot of the device table kept by the worker.
+
+    Used to push only the leases that actually moved to the database: new
+    devices, hostname changes and last_seen changes of at least `granularity`.
+    """
+
+    def __init__(self, granularity: timedelta):
+        self.granularity = granularity
+        self._seen: Dict[str, Tuple[str, datetime]] = {}
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def load(self, devices: Iterable[Device]) -> None:
+        """Replace the snapshot with devices stored in the database."""
+        self._seen = {}
+        self.commit(devices)
+
+    def diff(self, devices: Iterable[Device]) -> List[Device]:
+        """Return devices which differ from the snapshot."""
+        changed = []
+        for device in devices:
+            hostname, last_seen = self._seen.get(device.mac_address, (None, None))
+            if last_seen is None:
+                changed.append(device)
+                continue
+
+            moved = as_utc_naive(device.last_seen) - last_seen
+            if hostname != device.hostname or abs(moved) >= self.granularity:
+                changed.append(device)
+        return changed
+
+    def commit(self, devices: Iterable[Device]) -> None:
+        """Record devices which were written to the database."""
+        for device in devices:
+            self._seen[device.mac_address] = (
+                device.hostname,
+                as_utc_naive(device.last_seen),
+            )
@@ -0,0 +1,75 @@
+"""Asyncio counterpart of Database for the async JSON app.
+
+Needs an asyncio driver next to the synchronous one: aiosqlite for SQLite,
+asyncpg for PostgreSQL. The schema is owned by the synchronous Database,
+which the worker creates and migrates, AsyncDatabase only connects to it.
+"""
+
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+import sqlalchemy as db
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from whois.data.db.database import env_int, pool_options
+from whois.data.db.sqlite import apply_pragmas, is_sqlite, is_sqlite_memory
+
+# asyncio drivers of the backends the synchronous Database supports
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def async_url(db_url: str) -> str:
+    """Swap the driver of a database URL for its asyncio counterpart."""
+    url = db.engine.make_url(db_url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No asyncio driver for {backend} databases")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(
+        hide_password=False
+    )
+
+
+class AsyncDatabase:
+    """Asyncio connection pool of the database.
+
+    Sessions are not shared, each request opens its own with `session` and
+    returns the connection when the block ends. The app only reads, writes
+    stay with the synchronous Database.
+
+    One process serves many concurrent pollers, so the pool is sized by
+    APP_ASYNC_DB_POOL_SIZE and APP_ASYNC_DB_POOL_MAX_OVERFLOW instead of the
+    small pool of a gunicorn worker.
+    """
+
+    def __init__(self, db_url: str = None, **pool_kwargs):
+        if not db_url:
+            db_url = os.environ.get("APP_DB_URL", "sqlite:///whohacks.sqlite")
+        self.db_name = db_url.split("/")[-1]
+        self.logger = logging.getLogger(f"async-db-{self.db_name}")
+
+        pool_kwargs.setdefault("pool_size", env_int("APP_ASYNC_DB_POOL_SIZE", 10))
+        pool_kwargs.setdefault(
+            "max_overflow", env_int("APP_ASYNC_DB_POOL_MAX_OVERFLOW", 10)
+        )
+
+        self.engine = create_async_engine(
+            async_url(db_url), **pool_options(db_url, **pool_kwargs)
+        )
+        if is_sqlite(db_url) and not is_sqlite_memory(db_url):
+            apply_pragmas(self.engine.sync_engine)
+
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        async with self.sessions() as session:
+            yield session
+
+    async def dispose(self) -> None:
+        """Close all pooled connections, e.g. on application shutdown."""
+        await self.engine.dispose()
@@ -1,21 +1,98 @@
 import logging
 import os
-from typing import Callable
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterator
 
 import sqlalchemy as db
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
 from whois.data.db.base import Base
+from whois.data.db.instrumentation import QueryInstrumentation
+from whois.data.db.migrations import migrate
+from whois.data.db.replicas import PINNED, ReplicaSet, RoutingSession, connect_args
+from whois.data.db.sqlite import (
+    apply_pragmas,
+    begin_immediate,
+    is_sqlite,
+    is_sqlite_memory,
+)
 from whois.data.table.device import DeviceTable
+from whois.data.table.device_archive import DeviceArchiveTable
+from whois.data.table.leader import LeaderTable
+from whois.data.table.occupancy import OccupancyTable
+from whois.data.table.presence import DailyPresenceTable, HourlyPresenceTable
+from whois.data.table.schema_version import SchemaVersionTable
+from whois.data.table.state import StateTable
 from whois.data.table.user import UserTable
+from whois.data.table.visit import VisitTable
+
+
+def env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, default))
+
+
+def pool_options(
+    db_url: str,
+    pool_size: int = None,
+    max_overflow: int = None,
+    pool_pre_ping: bool = None,
+    pool_recycle: int = None,
+) -> dict:
+    """Connection pool options, defaults can be overridden by APP_DB_POOL_*.
+
+    The defaults suit a gunicorn worker serving one request at a time: a small
+    pool, connections checked before use and recycled before server-side idle
+    timeouts close them.
+    """
+    if pool_pre_ping is None:
+        pool_pre_ping = os.environ.get("APP_DB_POOL_PRE_PING", "1") != "0"
+    options = {
+        "pool_pre_ping": pool_pre_ping,
+        "pool_recycle": (
+            pool_recycle
+            if pool_recycle is not None
+            else env_int("APP_DB_POOL_RECYCLE_S", 1800)
+        ),
+    }
+
+    if is_sqlite_memory(db_url):
+        # in-memory SQLite keeps a single connection per thread, no pool to size
+        return options
+
+    options["pool_size"] = (
+        pool_size if pool_size is not None else env_int("APP_DB_POOL_SIZE", 2)
+    )
+    options["max_overflow"] = (
+        max_overflow
+        if max_overflow is not None
+        else env_int("APP_DB_POOL_MAX_OVERFLOW", 3)
+    )
+    return options
 
 
 class Database:
-    """Represents the Database connection."""
+    """Represents the Database connection.
+
+    Repositories share one session per thread, i.e. per request in the web
+    app. It is created on first use and must be released with
+    `remove_session` when the request or worker tick is done.
+
+    Writes go through `transaction`. On SQLite they are serialized through a
+    single write connection, see `whois.data.db.sqlite`.
+
+    With `replica_urls` the session reads from read replicas until the first
+    write of the request or tick pins it to the primary, see
+    `whois.data.db.replicas`.
+
+    Statements of all engines are timed, see `whois.data.db.instrumentation`.
+    """
 
-    def __init__(self, db_url: str = None):
+    def __init__(self, db_url: str = None, replica_urls: list = None, **pool_kwargs):
         if not db_url:
             db_url = os.environ.get("APP_DB_URL", "sqlite:///whohacks.sqlite")
+        if replica_urls is None:
+            replica_urls = os.environ.get("APP_DB_REPLICA_URLS", "").split(",")
         self.db_name = db_url.split("/")[-1]
 
         self.logger = logging.getLogger(f"db-{self.db_name}")
@@ -26,36 +103,126 @@ class Database:
             force=True,
         )
 
-        self.engine = db.create_engine(db_url)
+        self.engine = db.create_engine(db_url, **pool_options(db_url, **pool_kwargs))
+        self.write_engine = self.engine
+        self.write_lock = nullcontext()
+        if is_sqlite(db_url) and not is_sqlite_memory(db_url):
+            apply_pragmas(self.engine)
+            self.write_engine = db.create_engine(
+                db_url, **pool_options(db_url, pool_size=1, max_overflow=0)
+            )
+            apply_pragmas(self.write_engine)
+            begin_immediate(self.write_engine)
+        if is_sqlite(db_url):
+            self.write_lock = threading.Lock()
+
+        self.replicas = None
+        replica_urls = [url.strip() for url in replica_urls if url.strip()]
+        if replica_urls:
+            self.replicas = ReplicaSet(
+                [
+                    db.create_engine(
+                        url,
+                        connect_args=connect_args(
+                            url, env_int("APP_DB_REPLICA_CONNECT_TIMEOUT_S", 2)
+                        ),
+                        **pool_options(url, **pool_kwargs),
+                    )
+                    for url in replica_urls
+                ],
+                check_interval_s=env_int("APP_DB_REPLICA_CHECK_S", 30),
+            )
+
+        self.instrumentation = QueryInstrumentation(
+            slow_query_s=env_int("APP_DB_SLOW_QUERY_MS", 200) / 1000
+        )
+        for engine in {self.engine, self.write_engine}:
+            self.instrumentation.attach(engine)
+        for engine in self.replicas.engines if self.replicas else ():
+            self.instrumentation.attach(engine)
+
         self.metadata = db.MetaData()
-        self.connection = None
+        self.sessions = scoped_session(
+            sessionmaker(
+                bind=self.engine,
+                class_=RoutingSession,
+                replicas=self.replicas,
+                expire_on_commit=False,
+            )
+        )
+        self.write_sessions = sessionmaker(
+            bind=self.write_engine, expire_on_commit=False
+        )
 
         self.user_table = UserTable()
         self.device_table = DeviceTable()
+        self.device_archive_table = DeviceArchiveTable()
+        self.leader_table = LeaderTable()
+        self.schema_version_table = SchemaVersionTable()
+        self.state_table = StateTable()
+        self.visit_table = VisitTable()
+        self.hourly_presence_table = HourlyPresenceTable()
+        self.daily_presence_table = DailyPresenceTable()
+        self.occupancy_table = OccupancyTable()
         self.create_db()
 
     @property
-    def is_connected(self) -> bool:
-        return self.connection is not None
+    def session(self) -> Session:
+        """Session of the current thread, created lazily."""
+        return self.sessions()
+
+    @contextmanager
+    def transaction(self) -> Iterator[Session]:
+        """Write session committed on exit and rolled back on error.
+
+        Writers of this process take turns, so a worker tick and a claim
+        never compete for the SQLite write lock. Reads of the thread's session
+        go to the primary from now on, so they see the write.
+        """
+        self.pin_primary()
+        with self.write_lock, self.write_sessions() as session, session.begin():
+            yield session
+
+    def pin_primary(self) -> None:
+        """Read from the primary for the rest of the current session."""
+        self.session.info[PINNED] = True
+
+    def remove_session(self) -> None:
+        """Close the session of the current thread, returning its connection."""
+        self.sessions.remove()
 
-    def connect(self) -> None:
-        self.logger.info(f"Connect to the database for {self.db_name}")
-        self.connection = self.engine.connect()
+    def vacuum(self, tables: list) -> None:
+        """Reclaim the space of deleted rows and refresh planner statistics.
 
-    def disconnect(self) -> None:
-        self.logger.info(f"Disconnect to the database for {self.db_name}")
-        if not self.connection:
-            raise RuntimeError("Cannot close database connection - already closed")
-        self.connection.close()
+        Both need to run outside of a transaction. SQLite can only vacuum the
+        whole file, writers wait for it like for any other write.
+        """
+        if self.engine.dialect.name == "postgresql":
+            with self.engine.connect().execution_options(
+                isolation_level="AUTOCOMMIT"
+            ) as connection:
+                for table in tables:
+                    connection.exec_driver_sql(
+                        f"VACUUM (ANALYZE) {table.__tablename__}"
+                    )
+        elif self.engine.dialect.name == "sqlite":
+            with self.write_lock:
+                # the raw DBAPI connection skips the BEGIN IMMEDIATE of writes
+                connection = self.write_engine.raw_connection()
+                try:
+                    connection.execute("VACUUM")
+                    connection.execute("ANALYZE")
+                finally:
+                    connection.close()
 
     def create_db(self) -> None:
         """Ensure that the database exists with given schema."""
         self.logger.info(f"Create database {self.db_name}")
         Base.metadata.create_all(self.engine)
+        migrate(self.engine)
 
     def drop(self) -> None:
         """WARNING: Drops the entire database."""
         self.logger.warning(f"Drop database {self.db_name}")
-        if not self.is_connected:
-            self.connect()
+        self.remove_session()
         Base.metadata.drop_all(self.engine)
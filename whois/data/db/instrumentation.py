@@ -0,0 +1,190 @@
+"""Timing of every SQL statement, through SQLAlchemy engine events.
+
+Statements are attributed to the repository method which ran them. Each
+thread, i.e. request or worker tick, keeps a count and the total time of its
+statements, statements slower than `slow_query_s` are logged, and durations
+are aggregated in histograms per repository method for /metrics.
+"""
+
+import bisect
+import logging
+import sys
+import threading
+import time
+from dataclasses import dataclass
+
+import sqlalchemy as db
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("slow-queries")
+
+REPOSITORY_PACKAGE = "whois.data.repository."
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS_S = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def repository_caller() -> str:
+    """Name of the innermost repository method on the stack, like Class.method."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith(REPOSITORY_PACKAGE):
+            owner = frame.f_locals.get("self")
+            name = frame.f_code.co_name
+            return f"{type(owner).__name__}.{name}" if owner is not None else name
+        frame = frame.f_back
+    return "other"
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    total_s: float = 0.0
+
+
+class Histogram:
+    """Cumulative duration histogram in the Prometheus exposition layout."""
+
+    def __init__(self, buckets_s=BUCKETS_S):
+        self.buckets_s = buckets_s
+        # the last slot counts observations above the largest bucket
+        self.counts = [0] * (len(buckets_s) + 1)
+        self.sum_s = 0.0
+
+    def observe(self, value_s: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets_s, value_s)] += 1
+        self.sum_s += value_s
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets_s, self.counts):
+            total += count
+            yield str(bound), total
+        yield "+Inf", total + self.counts[-1]
+
+
+class CountingCursor:
+    """DBAPI cursor counting the rows fetched from it.
+
+    Drivers like sqlite3 report a rowcount of -1 for SELECTs, so rows
+    returned are counted as the result reads them instead.
+    """
+
+    def __init__(self, cursor, count_rows):
+        self._cursor = cursor
+        self._count_rows = count_rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._count_rows(1)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._count_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._count_rows(len(rows))
+        return rows
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class QueryInstrumentation:
+
+    def __init__(self, slow_query_s: float):
+        self.slow_query_s = slow_query_s
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.histograms: dict[str, Histogram] = {}
+        self.rows: dict[str, int] = {}
+
+    def attach(self, engine: Engine) -> None:
+        @db.event.listens_for(engine, "before_cursor_execute")
+        def start_timer(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @db.event.listens_for(engine, "after_cursor_execute")
+        def stop_timer(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["query_started"].pop()
+            caller = repository_caller()
+            rows = None
+            if cursor.description is not None and context is not None:
+                # the result reads its rows from the execution context cursor
+                context.cursor = CountingCursor(
+                    cursor, lambda count: self.count_rows(caller, count)
+                )
+            elif cursor.rowcount >= 0:
+                rows = cursor.rowcount
+            self.record(statement, elapsed, rows, caller)
+
+    @property
+    def stats(self) -> QueryStats:
+        """Statements of the current thread since the last `reset`."""
+        if not hasattr(self.local, "stats"):
+            self.local.stats = QueryStats()
+        return self.local.stats
+
+    def reset(self) -> QueryStats:
+        """Start counting anew, e.g. at the start of a request."""
+        self.local.stats = QueryStats()
+        return self.local.stats
+
+    def count_rows(self, caller: str, rows: int) -> None:
+        with self.lock:
+            self.rows[caller] = self.rows.get(caller, 0) + rows
+
+    def record(self, statement: str, elapsed_s: float, rows, caller: str) -> None:
+        stats = self.stats
+        stats.count += 1
+        stats.total_s += elapsed_s
+
+        with self.lock:
+            self.histograms.setdefault(caller, Histogram()).observe(elapsed_s)
+        if rows is not None:
+            self.count_rows(caller, rows)
+
+        if elapsed_s >= self.slow_query_s:
+            logger.warning(
+                f"{elapsed_s * 1000:.1f}ms in {caller}, "
+                f"{'?' if rows is None else rows} rows: {' '.join(statement.split())}"
+            )
+
+    def render_metrics(self) -> str:
+        """Histograms and row counts in the Prometheus text format."""
+        lines = [
+            "# HELP whohacks_db_query_seconds Duration of SQL statements.",
+            "# TYPE whohacks_db_query_seconds histogram",
+        ]
+        with self.lock:
+            for caller, histogram in sorted(self.histograms.items()):
+                for bound, count in histogram.cumulative():
+                    lines.append(
+                        f'whohacks_db_query_seconds_bucket{{caller="{caller}",'
+                        f'le="{bound}"}} {count}'
+                    )
+                lines.append(
+                    f'whohacks_db_query_seconds_sum{{caller="{caller}"}} '
+                    f"{histogram.sum_s:.6f}"
+                )
+                lines.append(
+                    f'whohacks_db_query_seconds_count{{caller="{caller}"}} '
+                    f"{histogram.count}"
+                )
+            lines += [
+                "# HELP whohacks_db_query_rows_total Rows affected or returned.",
+                "# TYPE whohacks_db_query_rows_total counter",
+            ]
+            for caller, rows in sorted(self.rows.items()):
+                lines.append(
+                    f'whohacks_db_query_rows_total{{caller="{caller}"}} {rows}'
+                )
+        return "\n".join(lines) + "\n"
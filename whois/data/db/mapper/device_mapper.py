@@ -5,7 +5,7 @@ from whois.entity.device import Device
 def device_to_devicetable_mapper(device: Device) -> DeviceTable:
     return DeviceTable(
         mac_address=device.mac_address,
-        hostname=device.username,
+        hostname=device.hostname,
         last_seen=device.last_seen,
         owner=device.owner,
         flags=device.flags,
@@ -15,7 +15,7 @@ def device_to_devicetable_mapper(device: Device) -> DeviceTable:
 def devicetable_to_device_mapper(device: DeviceTable) -> Device:
     return Device(
         mac_address=device.mac_address,
-        hostname=device.username,
+        hostname=device.hostname,
         last_seen=device.last_seen,
         owner=device.owner,
         flags=device.flags,
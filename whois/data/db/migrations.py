@@ -0,0 +1,146 @@
+"""Versioned schema migrations applied on top of `Base.metadata.create_all`.
+
+`create_all` only creates missing tables, it never changes existing ones.
+Everything else, e.g. indexes, is added by a migration, so fresh and existing
+SQLite and PostgreSQL databases end up with the same schema. Applied versions
+are recorded in the `schema_version` table.
+
+Run with `python -m whois.data.db.migrations [--target VERSION]`.
+"""
+
+import argparse
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Tuple
+
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from whois.data.table.schema_version import SchemaVersionTable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    upgrade: Tuple[str, ...]
+    downgrade: Tuple[str, ...]
+
+
+MIGRATIONS = (
+    Migration(
+        1,
+        "Index devices by last_seen",
+        ("CREATE INDEX IF NOT EXISTS ix_device_last_seen ON device (last_seen)",),
+        ("DROP INDEX IF EXISTS ix_device_last_seen",),
+    ),
+    Migration(
+        2,
+        "Index devices by owner and last_seen",
+        (
+            "CREATE INDEX IF NOT EXISTS ix_device_user_id_last_seen "
+            "ON device (user_id, last_seen)",
+        ),
+        ("DROP INDEX IF EXISTS ix_device_user_id_last_seen",),
+    ),
+    Migration(
+        3,
+        "Partial index of devices not flagged as hidden",
+        (
+            # the predicate must match the query for the planner to use it,
+            # see DeviceFlags.is_hidden
+            "CREATE INDEX IF NOT EXISTS ix_device_visible_last_seen "
+            "ON device (last_seen) WHERE flags IS NULL OR (flags & 1) = 0",
+        ),
+        ("DROP INDEX IF EXISTS ix_device_visible_last_seen",),
+    ),
+    Migration(
+        4,
+        "Index visits by end and by device",
+        (
+            "CREATE INDEX IF NOT EXISTS ix_visit_ended_at ON visit (ended_at)",
+            "CREATE INDEX IF NOT EXISTS ix_visit_mac_address_ended_at "
+            "ON visit (mac_address, ended_at)",
+        ),
+        (
+            "DROP INDEX IF EXISTS ix_visit_ended_at",
+            "DROP INDEX IF EXISTS ix_visit_mac_address_ended_at",
+        ),
+    ),
+    Migration(
+        5,
+        "Index occupancy bitmaps by day",
+        ("CREATE INDEX IF NOT EXISTS ix_occupancy_day ON occupancy (day)",),
+        ("DROP INDEX IF EXISTS ix_occupancy_day",),
+    ),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(engine: Engine) -> int:
+    with engine.connect() as connection:
+        versions = connection.execute(select(SchemaVersionTable.version)).scalars()
+        return max(versions, default=0)
+
+
+def migrate(engine: Engine, target: int = LATEST_VERSION) -> int:
+    """Upgrade or downgrade the schema to `target`, return the reached version.
+
+    Each migration runs in its own transaction. Statements are idempotent, so
+    a process racing another one on startup only fails to record the version
+    a second time, which is ignored.
+    """
+    version = current_version(engine)
+
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            logger.info(f"Apply migration {migration.version}: {migration.description}")
+            try:
+                with engine.begin() as connection:
+                    for statement in migration.upgrade:
+                        connection.execute(text(statement))
+                    connection.execute(
+                        insert(SchemaVersionTable).values(
+                            version=migration.version,
+                            description=migration.description,
+                            applied_at=datetime.now(timezone.utc),
+                        )
+                    )
+            except IntegrityError:
+                logger.info(f"Migration {migration.version} was applied concurrently")
+
+    for migration in reversed(MIGRATIONS):
+        if target < migration.version <= version:
+            logger.info(
+                f"Revert migration {migration.version}: {migration.description}"
+            )
+            with engine.begin() as connection:
+                for statement in migration.downgrade:
+                    connection.execute(text(statement))
+                connection.execute(
+                    delete(SchemaVersionTable).where(
+                        SchemaVersionTable.version == migration.version
+                    )
+                )
+
+    return current_version(engine)
+
+
+if __name__ == "__main__":
+    import os
+
+    from sqlalchemy import create_engine
+
+    parser = argparse.ArgumentParser(description="Migrate the database schema")
+    parser.add_argument("--target", type=int, default=LATEST_VERSION)
+    args = parser.parse_args()
+
+    # Database() would upgrade to the latest version before reverting
+    engine = create_engine(os.environ.get("APP_DB_URL", "sqlite:///whohacks.sqlite"))
+    SchemaVersionTable.__table__.create(engine, checkfirst=True)
+    print(f"Schema version {migrate(engine, args.target)}")
@@ -0,0 +1,123 @@
+"""Routing of read-only queries to read replicas.
+
+Sessions of `Database.session` send their queries to one of the replicas,
+picked round robin among the healthy ones when the session first reads.
+Once the session is pinned, e.g. because the request wrote through
+`Database.transaction`, its reads go to the primary, which already has the
+write that replicas may still be replaying.
+"""
+
+import logging
+import threading
+import time
+
+import sqlalchemy as db
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Session.info key of sessions which read from the primary
+PINNED = "pinned"
+# Session.info key of the replica a session reads from
+REPLICA = "replica"
+
+
+def connect_args(url: str, connect_timeout_s: int) -> dict:
+    """DBAPI arguments bounding how long connecting to a replica may take."""
+    if db.engine.make_url(url).get_backend_name() == "postgresql":
+        return {"connect_timeout": connect_timeout_s}
+    return {}
+
+
+class ReplicaSet:
+    """Round robin over the replicas which passed their last health check.
+
+    A replica is checked with `SELECT 1` at most once per `check_interval_s`,
+    and marked down right away when one of its connections is lost. The check
+    runs in the request thread which found it due, other threads meanwhile go
+    by the last result instead of checking as well.
+    """
+
+    def __init__(
+        self, engines: list[Engine], check_interval_s: float, clock=time.monotonic
+    ):
+        self.engines = engines
+        self.check_interval_s = check_interval_s
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.index = 0
+        self.healthy = {engine: True for engine in engines}
+        self.checked_at = {engine: None for engine in engines}
+        self.checking = set()
+        for engine in engines:
+            self.watch_disconnects(engine)
+
+    def watch_disconnects(self, engine: Engine) -> None:
+        @db.event.listens_for(engine, "handle_error")
+        def mark_down(context):
+            if context.is_disconnect:
+                self.mark(engine, False)
+
+    def mark(self, engine: Engine, healthy: bool) -> None:
+        if healthy != self.healthy[engine]:
+            state = "up" if healthy else "down"
+            logger.warning(f"Replica {engine.url.host or engine.url} is {state}")
+        self.healthy[engine] = healthy
+        self.checked_at[engine] = self.clock()
+
+    def check(self, engine: Engine) -> bool:
+        try:
+            with engine.connect() as connection:
+                connection.execute(db.text("SELECT 1"))
+        except DBAPIError:
+            self.mark(engine, False)
+        else:
+            self.mark(engine, True)
+        return self.healthy[engine]
+
+    def is_healthy(self, engine: Engine) -> bool:
+        with self.lock:
+            checked_at = self.checked_at[engine]
+            due = (
+                checked_at is None or self.clock() - checked_at >= self.check_interval_s
+            ) and engine not in self.checking
+            if due:
+                self.checking.add(engine)
+        if not due:
+            return self.healthy[engine]
+
+        try:
+            return self.check(engine)
+        finally:
+            with self.lock:
+                self.checking.discard(engine)
+
+    def next(self) -> Engine | None:
+        """Next healthy replica, None when all of them are down."""
+        with self.lock:
+            start, self.index = self.index, self.index + 1
+        for offset in range(len(self.engines)):
+            engine = self.engines[(start + offset) % len(self.engines)]
+            if self.is_healthy(engine):
+                return engine
+        return None
+
+
+class RoutingSession(Session):
+    """Session reading from a replica until it is pinned to the primary."""
+
+    def __init__(self, replicas: ReplicaSet = None, **kwargs):
+        super().__init__(**kwargs)
+        self.replicas = replicas
+
+    def get_bind(self, mapper=None, **kwargs):
+        if self.replicas is None or self.info.get(PINNED) or self._flushing:
+            return super().get_bind(mapper, **kwargs)
+
+        # one replica per session, so a request sees a single snapshot
+        if REPLICA not in self.info:
+            self.info[REPLICA] = self.replicas.next()
+        return self.info[REPLICA] or super().get_bind(mapper, **kwargs)
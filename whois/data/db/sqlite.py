@@ -0,0 +1,62 @@
+"""Production profile for file-backed SQLite databases.
+
+The web app and the worker run in separate processes on the same file. With
+WAL readers never block the writer and are never blocked by it, writers wait
+for each other for up to `busy_timeout` instead of failing right away.
+"""
+
+import sqlalchemy as db
+from sqlalchemy.engine import Engine
+
+PRAGMAS = {
+    "journal_mode": "WAL",
+    # WAL stays consistent with NORMAL, only the last commits may be lost on
+    # power failure
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "mmap_size": 256 * 1024 * 1024,
+    # negative values are in KiB
+    "cache_size": -16 * 1024,
+}
+
+
+def is_sqlite(db_url: str) -> bool:
+    return db.engine.make_url(db_url).get_backend_name() == "sqlite"
+
+
+def is_sqlite_memory(db_url: str) -> bool:
+    url = db.engine.make_url(db_url)
+    return url.get_backend_name() == "sqlite" and url.database in (
+        None,
+        "",
+        ":memory:",
+    )
+
+
+def apply_pragmas(engine: Engine) -> None:
+    """Set PRAGMAS on every new connection of the engine."""
+
+    @db.event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def begin_immediate(engine: Engine) -> None:
+    """Start transactions of the engine with BEGIN IMMEDIATE.
+
+    pysqlite begins transactions lazily and takes the write lock only on the
+    first write, a transaction which read first then fails with "database is
+    locked" without waiting for busy_timeout. Taking the lock up front makes
+    writers queue up instead.
+    """
+
+    @db.event.listens_for(engine, "connect")
+    def disable_pysqlite_begin(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @db.event.listens_for(engine, "begin")
+    def emit_begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
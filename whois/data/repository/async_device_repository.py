@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+
+from whois.data.db.async_database import AsyncDatabase
+from whois.data.db.mapper.device_mapper import devicetable_to_device_mapper
+from whois.data.repository.device_read_repository import DEVICE_COLUMNS, USER_COLUMNS
+from whois.data.repository.device_repository import (
+    as_utc_naive,
+    recent_with_owners_filter,
+)
+from whois.data.table.device import DeviceTable
+from whois.data.table.user import UserTable
+from whois.entity.device import Device
+from whois.entity.record import DeviceRecord, UserRecord
+
+
+class AsyncDeviceRepository:
+    """Asyncio counterpart of DeviceRepository for the async JSON app.
+
+    Covers the reads of the web app, all writes stay with DeviceRepository.
+    """
+
+    def __init__(self, database: AsyncDatabase) -> None:
+        self.database = database
+
+    async def get_by_mac_address(self, mac_address: str) -> Device:
+        async with self.database.session() as session:
+            device_orm = (
+                await session.execute(
+                    select(DeviceTable).where(DeviceTable.mac_address == mac_address)
+                )
+            ).scalar_one()
+        return devicetable_to_device_mapper(device_orm)
+
+    async def get_all(self) -> List[Device]:
+        async with self.database.session() as session:
+            devices_orm = (await session.scalars(select(DeviceTable))).all()
+        return list(map(devicetable_to_device_mapper, devices_orm))
+
+    async def get_by_user_id(self, user_id: int) -> List[Device]:
+        async with self.database.session() as session:
+            devices_orm = (
+                await session.scalars(
+                    select(DeviceTable).where(DeviceTable.owner == user_id)
+                )
+            ).all()
+        return list(map(devicetable_to_device_mapper, devices_orm))
+
+    async def get_recent(self, delta: timedelta) -> List[Device]:
+        recent_time = as_utc_naive(datetime.now(timezone.utc) - delta)
+        async with self.database.session() as session:
+            devices_orm = (
+                await session.scalars(
+                    select(DeviceTable).where(DeviceTable.last_seen > recent_time)
+                )
+            ).all()
+        return list(map(devicetable_to_device_mapper, devices_orm))
+
+    async def get_recent_with_owners(
+        self,
+        delta: timedelta,
+        visible_only: bool = True,
+        owner_id: int = None,
+        now: datetime = None,
+    ) -> List[Tuple[DeviceRecord, Optional[UserRecord]]]:
+        """See DeviceReadRepository.get_recent_with_owners."""
+        query = (
+            select(*DEVICE_COLUMNS, *USER_COLUMNS)
+            .outerjoin(UserTable, UserTable.id == DeviceTable.owner)
+            .where(*recent_with_owners_filter(delta, visible_only, owner_id, now))
+        )
+        split = len(DEVICE_COLUMNS)
+        async with self.database.session() as session:
+            rows = (await session.execute(query)).all()
+        return [
+            (
+                DeviceRecord(*row[:split]),
+                UserRecord(*row[split:]) if row[split] is not None else None,
+            )
+            for row in rows
+        ]
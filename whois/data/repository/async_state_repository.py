@@ -0,0 +1,20 @@
+from sqlalchemy import select
+
+from whois.data.db.async_database import AsyncDatabase
+from whois.data.table.state import StateTable
+
+
+class AsyncStateRepository:
+    """Asyncio counterpart of the reads of StateRepository."""
+
+    def __init__(self, database: AsyncDatabase) -> None:
+        self.database = database
+
+    async def get(self, key: str) -> int:
+        async with self.database.session() as session:
+            value = (
+                await session.execute(
+                    select(StateTable.value).where(StateTable.key == key)
+                )
+            ).scalar()
+        return value or 0
@@ -0,0 +1,36 @@
+from typing import List
+
+from sqlalchemy import select
+
+from whois.data.db.async_database import AsyncDatabase
+from whois.data.db.mapper.user_mapper import usertable_to_user_mapper
+from whois.data.table.user import UserTable
+from whois.entity.user import User
+
+
+class AsyncUserRepository:
+    """Asyncio counterpart of the reads of UserRepository."""
+
+    def __init__(self, database: AsyncDatabase) -> None:
+        self.database = database
+
+    async def get_all(self) -> List[User]:
+        async with self.database.session() as session:
+            users_orm = (await session.scalars(select(UserTable))).all()
+        return list(map(usertable_to_user_mapper, users_orm))
+
+    async def get_by_username(self, username: str) -> User:
+        async with self.database.session() as session:
+            user_orm = (
+                await session.execute(
+                    select(UserTable).where(UserTable.username == username)
+                )
+            ).scalar_one()
+        return usertable_to_user_mapper(user_orm)
+
+    async def get_by_id(self, id: int) -> User:
+        async with self.database.session() as session:
+            user_orm = (
+                await session.execute(select(UserTable).where(UserTable.id == id))
+            ).scalar_one()
+        return usertable_to_user_mapper(user_orm)
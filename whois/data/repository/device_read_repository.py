@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Integer, select, type_coerce
+
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import (
+    as_utc_naive,
+    recent_with_owners_filter,
+)
+from whois.data.table.device import DeviceTable
+from whois.data.table.user import UserTable
+from whois.entity.record import DeviceRecord, UserRecord
+
+# flags are read as plain integers, the BitField type would build an object
+# per row
+DEVICE_COLUMNS = (
+    DeviceTable.mac_address,
+    DeviceTable.hostname,
+    DeviceTable.last_seen,
+    DeviceTable.owner,
+    type_coerce(DeviceTable.flags, Integer).label("device_flags"),
+)
+USER_COLUMNS = (
+    UserTable.id,
+    UserTable.username,
+    UserTable.display_name,
+    type_coerce(UserTable.flags, Integer).label("user_flags"),
+)
+
+
+class DeviceReadRepository:
+    """Read-only device queries returning DeviceRecords.
+
+    Runs Core selects of the needed columns and builds records straight from
+    the result tuples, for views which only render devices.
+    """
+
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    def _records(self, query) -> List[DeviceRecord]:
+        rows = self.database.session.execute(query)
+        return [DeviceRecord(*row) for row in rows]
+
+    def get_all(self) -> List[DeviceRecord]:
+        return self._records(select(*DEVICE_COLUMNS))
+
+    def get_by_user_id(self, user_id: int) -> List[DeviceRecord]:
+        return self._records(
+            select(*DEVICE_COLUMNS).where(DeviceTable.owner == user_id)
+        )
+
+    def get_recent(self, delta: timedelta) -> List[DeviceRecord]:
+        recent_time = as_utc_naive(datetime.now(timezone.utc) - delta)
+        return self._records(
+            select(*DEVICE_COLUMNS).where(DeviceTable.last_seen > recent_time)
+        )
+
+    def get_recent_with_owners(
+        self,
+        delta: timedelta,
+        visible_only: bool = True,
+        owner_id: int = None,
+        now: datetime = None,
+    ) -> List[Tuple[DeviceRecord, Optional[UserRecord]]]:
+        """Devices seen within `delta` and their owners, in a single query.
+
+        With `visible_only` hidden devices and devices of hidden users are
+        left out. Devices of `owner_id` are included even if not recent.
+        """
+        query = (
+            select(*DEVICE_COLUMNS, *USER_COLUMNS)
+            .outerjoin(UserTable, UserTable.id == DeviceTable.owner)
+            .where(*recent_with_owners_filter(delta, visible_only, owner_id, now))
+        )
+        split = len(DEVICE_COLUMNS)
+        return [
+            (
+                DeviceRecord(*row[:split]),
+                UserRecord(*row[split:]) if row[split] is not None else None,
+            )
+            for row in self.database.session.execute(query)
+        ]
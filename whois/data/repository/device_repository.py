@@ -1,6 +1,19 @@
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import List
+from typing import Dict, List, Tuple
 
+from sqlalchemy import (
+    and_,
+    case,
+    delete,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import Session
 
 from whois.data.db.database import Database
@@ -8,8 +21,83 @@ from whois.data.db.mapper.device_mapper import (
     device_to_devicetable_mapper,
     devicetable_to_device_mapper,
 )
+from whois.data.repository.state_repository import PRESENCE_VERSION, increment_counter
 from whois.data.table.device import DeviceTable
-from whois.entity.device import Device
+from whois.data.table.device_archive import DeviceArchiveTable
+from whois.data.table.user import UserTable
+from whois.entity.device import Device, DeviceFlags
+from whois.entity.user import UserFlags
+
+# Keeps multi-row statements below the SQLite bound parameter limit (999)
+UPSERT_CHUNK_SIZE = 300
+
+UPSERT_DIALECTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+@dataclass
+class UpsertResult:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+    @property
+    def total(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+
+def as_utc_naive(value: datetime) -> datetime:
+    """Normalize a datetime to the naive UTC form stored in the database."""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def flag_is_clear(column, flag):
+    """SQL condition of a BitField column not having `flag` set.
+
+    The mask is rendered inline, so the condition on device.flags matches the
+    predicate of the ix_device_visible_last_seen partial index.
+    """
+    return or_(
+        column.is_(None),
+        column.op("&")(literal_column(str(flag.value))) == literal_column("0"),
+    )
+
+
+def recent_with_owners_filter(
+    delta: timedelta, visible_only: bool, owner_id: int, now: datetime
+) -> list:
+    """Conditions of a device and user join, see get_recent_with_owners."""
+    recent_time = as_utc_naive((now or datetime.now(timezone.utc)) - delta)
+    condition = DeviceTable.last_seen > recent_time
+    if owner_id is not None:
+        condition = or_(condition, DeviceTable.owner == owner_id)
+    if not visible_only:
+        return [condition]
+    return [
+        condition,
+        flag_is_clear(DeviceTable.flags, DeviceFlags.is_hidden),
+        flag_is_clear(UserTable.flags, UserFlags.is_hidden),
+    ]
+
+
+def is_random_mac():
+    """Locally administered MAC addresses, used by phones with randomization."""
+    return func.upper(func.substr(DeviceTable.mac_address, 2, 1)).in_(
+        ["2", "6", "A", "E"]
+    )
+
+
+def is_newer(value: datetime, current: datetime) -> bool:
+    return value is not None and (current is None or value > current)
+
+
+def chunked(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
 
 
 class DeviceRepository:
@@ -18,12 +106,12 @@ class DeviceRepository:
         self.database = database
 
     def insert(self, device: Device) -> None:
-        with Session(self.database.engine) as session:
+        with self.database.transaction() as session:
             session.add(device_to_devicetable_mapper(device))
-            session.commit()
+            increment_counter(session, PRESENCE_VERSION)
 
     def update(self, device: Device) -> None:
-        with Session(self.database.engine) as session:
+        with self.database.transaction() as session:
             device_orm = (
                 session.query(DeviceTable)
                 .where(DeviceTable.mac_address == device.mac_address)
@@ -33,41 +121,195 @@ class DeviceRepository:
             device_orm.last_seen = device.last_seen
             device_orm.owner = device.owner
             device_orm.flags = device.flags
-            session.commit()
+            increment_counter(session, PRESENCE_VERSION)
 
-    def get_by_mac_address(self, mac_address: str) -> Device:
-        with Session(self.database.engine) as session:
-            device_orm = (
-                session.query(DeviceTable)
+    def set_owner(self, mac_address: str, owner: int) -> None:
+        """Claim or release a device without touching what the worker writes."""
+        with self.database.transaction() as session:
+            session.execute(
+                update(DeviceTable)
                 .where(DeviceTable.mac_address == mac_address)
-                .one()
+                .values(owner=owner)
             )
-            return map(devicetable_to_device_mapper, device_orm)
+            increment_counter(session, PRESENCE_VERSION)
 
-    def get_all(self) -> List[Device]:
-        with Session(self.database.engine) as session:
-            devices_orm = session.query(DeviceTable).all()
-            return list(map(devicetable_to_device_mapper, devices_orm))
+    def claim(self, mac_address: str, owner: int) -> bool:
+        """Claim an unclaimed device, False when it already has an owner.
 
-    def get_by_user_id(self, user_id: int) -> List[Device]:
-        with Session(self.database.engine) as session:
-            devices_orm = (
-                session.query(DeviceTable).where(DeviceTable.owner == user_id).all()
+        The check is part of the UPDATE, so of concurrent claims only one wins.
+        """
+        with self.database.transaction() as session:
+            result = session.execute(
+                update(DeviceTable)
+                .where(DeviceTable.mac_address == mac_address)
+                .where(DeviceTable.owner.is_(None))
+                .values(owner=owner)
             )
-            if len(devices_orm) > 0:
-                return list(map(devicetable_to_device_mapper, devices_orm))
-            else:
-                return list()
-
-    def get_recent(self, delta: timedelta) -> List[Device]:
-        with Session(self.database.engine) as session:
-            recent_time = datetime.now(timezone.utc) - delta
-            devices_orm = (
-                session.query(DeviceTable)
-                .filter(DeviceTable.last_seen > recent_time)
-                .all()
+            if result.rowcount:
+                increment_counter(session, PRESENCE_VERSION)
+        return bool(result.rowcount)
+
+    def set_flags(self, mac_address: str, flags) -> None:
+        with self.database.transaction() as session:
+            session.execute(
+                update(DeviceTable)
+                .where(DeviceTable.mac_address == mac_address)
+                .values(flags=flags)
             )
-            if len(devices_orm) > 0:
-                return list(map(devicetable_to_device_mapper, devices_orm))
-            else:
-                return list()
+            increment_counter(session, PRESENCE_VERSION)
+
+    def remove_stale(
+        self,
+        cutoff: datetime,
+        random_mac_cutoff: datetime,
+        limit: int,
+        archive: bool = False,
+    ) -> int:
+        """Remove a batch of unclaimed, unflagged devices not seen recently.
+
+        Devices are stale when last seen before `cutoff`, or before
+        `random_mac_cutoff` for randomized MAC addresses. Returns the number
+        of removed devices, less than `limit` once none are left.
+        """
+        cutoff, random_mac_cutoff = as_utc_naive(cutoff), as_utc_naive(
+            random_mac_cutoff
+        )
+        stale = and_(
+            DeviceTable.owner.is_(None),
+            or_(DeviceTable.flags.is_(None), DeviceTable.flags == 0),
+            or_(
+                DeviceTable.last_seen < cutoff,
+                and_(is_random_mac(), DeviceTable.last_seen < random_mac_cutoff),
+            ),
+        )
+
+        with self.database.transaction() as session:
+            batch = select(DeviceTable.mac_address).where(stale).limit(limit).subquery()
+            # the condition is checked again, a device may have been claimed
+            removed = session.execute(
+                delete(DeviceTable)
+                .where(DeviceTable.mac_address.in_(select(batch.c.mac_address)))
+                .where(stale)
+                .returning(
+                    DeviceTable.mac_address, DeviceTable.hostname, DeviceTable.last_seen
+                )
+            ).all()
+
+            if archive and removed:
+                archived_at = datetime.now(timezone.utc)
+                session.execute(
+                    insert(DeviceArchiveTable),
+                    [
+                        {
+                            "mac_address": mac_address,
+                            "hostname": hostname,
+                            "last_seen": last_seen,
+                            "archived_at": archived_at,
+                        }
+                        for mac_address, hostname, last_seen in removed
+                    ],
+                )
+        return len(removed)
+
+    def upsert_many(self, devices: List[Device]) -> UpsertResult:
+        """Insert or update seen devices in a single transaction.
+
+        Only hostname and last_seen are written, owner and flags are left
+        untouched, and last_seen never moves backwards. Rows whose values did
+        not change are not written at all.
+        """
+        result = UpsertResult()
+        devices_by_mac = {device.mac_address: device for device in devices}
+        if not devices_by_mac:
+            return result
+
+        with self.database.transaction() as session:
+            existing = self._get_seen_state(session, list(devices_by_mac))
+
+            rows = []
+            for mac_address, device in devices_by_mac.items():
+                row = {
+                    "mac_address": mac_address,
+                    "hostname": device.hostname,
+                    "last_seen": as_utc_naive(device.last_seen),
+                }
+                current = existing.get(mac_address)
+                if current is None:
+                    result.inserted += 1
+                elif current[0] == row["hostname"] and not is_newer(
+                    row["last_seen"], current[1]
+                ):
+                    result.unchanged += 1
+                    continue
+                else:
+                    result.updated += 1
+                rows.append(row)
+
+            if rows:
+                self._upsert_rows(session, rows)
+                increment_counter(session, PRESENCE_VERSION)
+
+        return result
+
+    def _get_seen_state(
+        self, session: Session, mac_addresses: List[str]
+    ) -> Dict[str, Tuple[str, datetime]]:
+        state = {}
+        for chunk in chunked(mac_addresses, UPSERT_CHUNK_SIZE):
+            query = select(
+                DeviceTable.mac_address, DeviceTable.hostname, DeviceTable.last_seen
+            ).where(DeviceTable.mac_address.in_(chunk))
+            for mac_address, hostname, last_seen in session.execute(query):
+                state[mac_address] = (hostname, as_utc_naive(last_seen))
+        return state
+
+    def _upsert_rows(self, session: Session, rows: List[dict]) -> None:
+        insert = UPSERT_DIALECTS.get(self.database.engine.dialect.name)
+        if insert is None:
+            for row in rows:
+                session.merge(DeviceTable(**row))
+            return
+
+        for chunk in chunked(rows, UPSERT_CHUNK_SIZE):
+            statement = insert(DeviceTable).values(chunk)
+            statement = statement.on_conflict_do_update(
+                index_elements=[DeviceTable.mac_address],
+                set_={
+                    "hostname": statement.excluded.hostname,
+                    # pushed lease events and polls may arrive out of order
+                    "last_seen": case(
+                        (
+                            or_(
+                                DeviceTable.last_seen.is_(None),
+                                statement.excluded.last_seen > DeviceTable.last_seen,
+                            ),
+                            statement.excluded.last_seen,
+                        ),
+                        else_=DeviceTable.last_seen,
+                    ),
+                },
+            )
+            session.execute(statement)
+
+    def get_by_mac_address(self, mac_address: str) -> Device:
+        device_orm = (
+            self.database.session.query(DeviceTable)
+            .where(DeviceTable.mac_address == mac_address)
+            .one()
+        )
+        return devicetable_to_device_mapper(device_orm)
+
+    def get_all(self) -> List[Device]:
+        devices_orm = self.database.session.query(DeviceTable).all()
+        return list(map(devicetable_to_device_mapper, devices_orm))
+
+    def get_by_user_id(self, user_id: int) -> List[Device]:
+        devices_orm = (
+            self.database.session.query(DeviceTable)
+            .where(DeviceTable.owner == user_id)
+            .all()
+        )
+        if len(devices_orm) > 0:
+            return list(map(devicetable_to_device_mapper, devices_orm))
+        else:
+            return list()
@@ -0,0 +1,268 @@
+from collections import defaultdict
+from dataclasses import replace
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import case, distinct, func, select, update
+from sqlalchemy.orm import Session
+
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import (
+    UPSERT_CHUNK_SIZE,
+    UPSERT_DIALECTS,
+    as_utc_naive,
+    chunked,
+    flag_is_clear,
+)
+from whois.data.table.device import DeviceTable
+from whois.data.table.occupancy import OccupancyTable
+from whois.data.table.presence import DailyPresenceTable, HourlyPresenceTable
+from whois.data.table.user import UserTable
+from whois.data.table.visit import VisitTable
+from whois.entity.occupancy import OccupancyBitmap
+from whois.entity.presence import PresenceBucket, Visit
+from whois.entity.user import UserFlags
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+
+def floor_hour(value: datetime) -> datetime:
+    return as_utc_naive(value).replace(minute=0, second=0, microsecond=0)
+
+
+def floor_day(value: datetime) -> datetime:
+    return floor_hour(value).replace(hour=0)
+
+
+ROLLUPS = (
+    (HourlyPresenceTable, floor_hour, HOUR),
+    (DailyPresenceTable, floor_day, DAY),
+)
+
+
+def bucket_starts(start: datetime, end: datetime, step: timedelta) -> List[datetime]:
+    """Starts of the buckets from `start` (already floored) up to `end`."""
+    starts = []
+    while start <= end:
+        starts.append(start)
+        start += step
+    return starts
+
+
+def split_by_day(start: datetime, end: datetime) -> List[Tuple[date, int, int]]:
+    """Split a time span into (day, first minute, last minute) of each UTC day."""
+    start, end = as_utc_naive(start), as_utc_naive(end)
+    days = []
+    while start.date() < end.date():
+        days.append((start.date(), start.hour * 60 + start.minute, 24 * 60 - 1))
+        start = datetime.combine(start.date() + DAY, time())
+    days.append(
+        (start.date(), start.hour * 60 + start.minute, end.hour * 60 + end.minute)
+    )
+    return days
+
+
+def visit_to_visittable(visit: Visit) -> VisitTable:
+    return VisitTable(
+        id=visit.id,
+        mac_address=visit.mac_address,
+        # owner of the device when the visit started, counted as a user
+        user_id=select(DeviceTable.owner)
+        .where(DeviceTable.mac_address == visit.mac_address)
+        .scalar_subquery(),
+        started_at=visit.started_at,
+        ended_at=visit.ended_at,
+    )
+
+
+def visittable_to_visit(visit: VisitTable) -> Visit:
+    return Visit(
+        id=visit.id,
+        mac_address=visit.mac_address,
+        started_at=visit.started_at,
+        ended_at=visit.ended_at,
+    )
+
+
+class PresenceRepository:
+    """Visits of devices and their hourly and daily rollups."""
+
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    def get_visits_since(self, since: datetime) -> List[Visit]:
+        visits_orm = (
+            self.database.session.query(VisitTable)
+            .where(VisitTable.ended_at >= as_utc_naive(since))
+            .all()
+        )
+        return list(map(visittable_to_visit, visits_orm))
+
+    def record_visits(
+        self,
+        visits: List[Visit],
+        spans: List[Tuple[str, datetime, datetime]],
+        until: datetime,
+    ) -> List[Visit]:
+        """Save new and extended visits, their occupancy and the rollups.
+
+        `spans` is the time newly covered by the visits, see VisitTracker.
+        Everything happens in one transaction, so rollups and occupancy never
+        lag behind visits. Returns the visits with the ids of the new ones.
+        """
+        with self.database.transaction() as session:
+            saved = self._save_visits(session, visits)
+            self._add_occupancy(session, spans)
+            since = min(start for _, start, _ in spans)
+            self._refresh_rollups(session, since, until)
+        return saved
+
+    def refresh_rollups(self, since: datetime, until: datetime) -> None:
+        """Recount the hourly and daily buckets between `since` and `until`."""
+        with self.database.transaction() as session:
+            self._refresh_rollups(session, since, until)
+
+    def _save_visits(self, session: Session, visits: List[Visit]) -> List[Visit]:
+        extended = [
+            {"id": visit.id, "ended_at": visit.ended_at}
+            for visit in visits
+            if visit.id is not None
+        ]
+        if extended:
+            session.execute(update(VisitTable), extended)
+
+        saved = []
+        for visit in visits:
+            if visit.id is None:
+                visit_orm = visit_to_visittable(visit)
+                session.add(visit_orm)
+                session.flush()
+                visit = replace(visit, id=visit_orm.id)
+            saved.append(visit)
+        return saved
+
+    def _add_occupancy(
+        self, session: Session, spans: List[Tuple[str, datetime, datetime]]
+    ) -> None:
+        # read, OR and write back: the elected worker is the only writer
+        bitmaps: Dict[Tuple[str, date], OccupancyBitmap] = {}
+        for mac_address, start, end in spans:
+            for day, first, last in split_by_day(start, end):
+                bitmaps.setdefault((mac_address, day), OccupancyBitmap()).set_range(
+                    first, last
+                )
+
+        existing = {}
+        for chunk in chunked(list(bitmaps), UPSERT_CHUNK_SIZE // 2):
+            days = {day for _, day in chunk}
+            macs = {mac_address for mac_address, _ in chunk}
+            query = select(
+                OccupancyTable.mac_address, OccupancyTable.day, OccupancyTable.minutes
+            ).where(OccupancyTable.mac_address.in_(macs), OccupancyTable.day.in_(days))
+            for mac_address, day, minutes in session.execute(query):
+                existing[(mac_address, day)] = OccupancyBitmap(minutes)
+
+        rows = [
+            {
+                "mac_address": mac_address,
+                "day": day,
+                "minutes": bytes(bitmap | existing.get((mac_address, day), bitmap)),
+            }
+            for (mac_address, day), bitmap in bitmaps.items()
+        ]
+        insert = UPSERT_DIALECTS.get(self.database.engine.dialect.name)
+        if insert is None:
+            for row in rows:
+                session.merge(OccupancyTable(**row))
+            return
+
+        for chunk in chunked(rows, UPSERT_CHUNK_SIZE):
+            statement = insert(OccupancyTable).values(chunk)
+            session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[OccupancyTable.mac_address, OccupancyTable.day],
+                    set_={"minutes": statement.excluded.minutes},
+                )
+            )
+
+    def _refresh_rollups(self, session: Session, since: datetime, until: datetime):
+        # only buckets touched by changed visits, usually the current hour and day
+        for table, floor, step in ROLLUPS:
+            for start in bucket_starts(floor(since), as_utc_naive(until), step):
+                devices, users = self._count(session, start, start + step)
+                self._upsert_bucket(session, table, start, devices, users)
+
+    def _count(self, session: Session, start: datetime, end: datetime) -> tuple:
+        visible_user = case(
+            (flag_is_clear(UserTable.flags, UserFlags.is_hidden), VisitTable.user_id)
+        )
+        query = (
+            select(
+                func.count(distinct(VisitTable.mac_address)),
+                func.count(distinct(visible_user)),
+            )
+            .select_from(VisitTable)
+            .outerjoin(UserTable, UserTable.id == VisitTable.user_id)
+            .where(VisitTable.started_at < end)
+            .where(VisitTable.ended_at >= start)
+        )
+        return session.execute(query).one()
+
+    def _upsert_bucket(
+        self, session: Session, table, start: datetime, devices: int, users: int
+    ) -> None:
+        row = {"bucket": start, "devices": devices, "users": users}
+        insert = UPSERT_DIALECTS.get(self.database.engine.dialect.name)
+        if insert is None:
+            session.merge(table(**row))
+            return
+
+        statement = insert(table).values(row)
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.bucket],
+                set_={"devices": devices, "users": users},
+            )
+        )
+
+    def get_hourly(self, start: datetime, end: datetime) -> List[PresenceBucket]:
+        return self._get_buckets(HourlyPresenceTable, floor_hour, HOUR, start, end)
+
+    def get_daily(self, start: datetime, end: datetime) -> List[PresenceBucket]:
+        return self._get_buckets(DailyPresenceTable, floor_day, DAY, start, end)
+
+    def _get_buckets(
+        self, table, floor, step: timedelta, start: datetime, end: datetime
+    ) -> List[PresenceBucket]:
+        """Buckets from `start` to `end`, hours or days without visits as zeros."""
+        starts = bucket_starts(floor(start), as_utc_naive(end), step)
+        if not starts:
+            return []
+
+        rows = self.database.session.execute(
+            select(table.bucket, table.devices, table.users)
+            .where(table.bucket >= starts[0])
+            .where(table.bucket <= starts[-1])
+        )
+        counts = {bucket: (devices, users) for bucket, devices, users in rows}
+        return [PresenceBucket(start, *counts.get(start, (0, 0))) for start in starts]
+
+    def get_occupancy(self, start: date, end: date) -> Dict[date, OccupancyBitmap]:
+        """Minutes of each day from `start` to `end` in which anyone was present.
+
+        Bitmaps of all devices of a day are OR-ed as integers, a month of a
+        busy space is a few thousand 180 bytes rows.
+        """
+        rows = self.database.session.execute(
+            select(OccupancyTable.day, OccupancyTable.minutes)
+            .where(OccupancyTable.day >= start)
+            .where(OccupancyTable.day <= end)
+        )
+        days = defaultdict(int)
+        for day, minutes in rows:
+            days[day] |= int.from_bytes(minutes, "little")
+        return {
+            day: OccupancyBitmap.from_int(minutes)
+            for day, minutes in sorted(days.items())
+        }
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from whois.data.db.database import Database
+from whois.data.table.state import StateTable
+
+# Bumped by the web app to ask the worker for an immediate tick
+REFRESH_REQUESTED = "refresh_requested"
+# Bumped by every write which changes who is present, see PresenceCache
+PRESENCE_VERSION = "presence_version"
+
+
+def increment_counter(session: Session, key: str) -> None:
+    """Increment a counter as part of the transaction of `session`."""
+    now = datetime.now(timezone.utc)
+    result = session.execute(
+        update(StateTable)
+        .where(StateTable.key == key)
+        .values(value=StateTable.value + 1, updated_at=now)
+    )
+    if result.rowcount == 0:
+        session.add(StateTable(key=key, value=1, updated_at=now))
+
+
+class StateRepository:
+    def __init__(self, database: Database) -> None:
+        self.database = database
+
+    def get(self, key: str) -> int:
+        value = self.database.session.execute(
+            select(StateTable.value).where(StateTable.key == key)
+        ).scalar()
+        return value or 0
+
+    def increment(self, key: str) -> None:
+        try:
+            self._increment(key)
+        except IntegrityError:
+            # the row was created concurrently, it can be updated now
+            self._increment(key)
+
+    def _increment(self, key: str) -> None:
+        with self.database.transaction() as session:
+            increment_counter(session, key)
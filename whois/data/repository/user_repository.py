@@ -1,49 +1,103 @@
+import copy
 from typing import List
 
-from sqlalchemy.orm import Session
-
 from whois.data.db.database import Database
 from whois.data.db.mapper.user_mapper import (
     user_to_usertable_mapper,
     usertable_to_user_mapper,
 )
+from whois.data.repository.state_repository import PRESENCE_VERSION, increment_counter
 from whois.data.table.user import UserTable
 from whois.entity.user import User
+from whois.ttl_cache import TtlCache
 
 
 class UserRepository:
-    def __init__(self, database: Database) -> None:
+    """Users, with `get_by_id` optionally served from a TtlCache.
+
+    The cache is kept per process: writes of this repository invalidate it,
+    those of other processes show up once the entry expired.
+    """
+
+    def __init__(self, database: Database, cache: TtlCache = None) -> None:
         self.database = database
+        self.cache = cache
 
     def insert(self, user: User) -> None:
-        with Session(self.database.engine) as session:
+        with self.database.transaction() as session:
             session.add(user_to_usertable_mapper(user))
-            session.commit()
+        if self.cache is not None:
+            self.cache.invalidate(str(user.id))
 
     def update(self, user: User) -> None:
-        with Session(self.database.engine) as session:
+        with self.database.transaction() as session:
             user_orm = session.query(UserTable).where(UserTable.id == user.id).one()
             user_orm.username = user.username
             user_orm.password = user.password
             user_orm.display_name = user.display_name
             user_orm.flags = user.flags
-            session.commit()
+            # names and flags of present users are part of the presence
+            increment_counter(session, PRESENCE_VERSION)
+        if self.cache is not None:
+            self.cache.invalidate(str(user.id))
 
-    def get_all(self) -> List[User]:
-        with Session(self.database.engine) as session:
-            users_orm = session.query(UserTable).all()
-            return list(map(usertable_to_user_mapper, users_orm))
+    def update_profile(
+        self,
+        id: int,
+        display_name: str,
+        flags: int,
+        flags_mask: int,
+        password: str = None,
+    ) -> None:
+        """Write the fields of the profile form only.
 
-    def get_by_username(self, username: str) -> User:
-        with Session(self.database.engine) as session:
+        The form edits a cached user, which misses changes of other processes,
+        so only the bits of `flags_mask` are taken from `flags` and `password`,
+        a hash, is only written when set.
+        """
+        with self.database.transaction() as session:
             user_orm = (
-                session.query(UserTable).where(UserTable.username == username).one()
+                session.query(UserTable)
+                .where(UserTable.id == id)
+                .with_for_update()
+                .one()
             )
+            user_orm.display_name = display_name
+            user_orm.flags = int(user_orm.flags) & ~flags_mask | flags & flags_mask
+            if password is not None:
+                user_orm.password = password
+            increment_counter(session, PRESENCE_VERSION)
+        if self.cache is not None:
+            self.cache.invalidate(str(id))
 
-            return usertable_to_user_mapper(user_orm)
+    def get_all(self) -> List[User]:
+        users_orm = self.database.session.query(UserTable).all()
+        return list(map(usertable_to_user_mapper, users_orm))
+
+    def get_by_username(self, username: str) -> User:
+        user_orm = (
+            self.database.session.query(UserTable)
+            .where(UserTable.username == username)
+            .one()
+        )
+
+        return usertable_to_user_mapper(user_orm)
 
     def get_by_id(self, id: int) -> User:
-        with Session(self.database.engine) as session:
-            user_orm = session.query(UserTable).where(UserTable.id == id).one()
+        if self.cache is None:
+            return self._get_by_id(id)
+
+        # Flask-Login passes ids as strings
+        user = self.cache.get(str(id))
+        if user is None:
+            user = self._get_by_id(id)
+            self.cache.set(str(id), user)
+        # callers modify users, e.g. the profile form edits current_user
+        return copy.deepcopy(user)
+
+    def _get_by_id(self, id: int) -> User:
+        user_orm = (
+            self.database.session.query(UserTable).where(UserTable.id == id).one()
+        )
 
-            return usertable_to_user_mapper(user_orm)
+        return usertable_to_user_mapper(user_orm)
@@ -0,0 +1,27 @@
+from sqlalchemy import Column
+from sqlalchemy.types import VARCHAR, Integer, String
+
+from whois.data.db.base import Base
+from whois.data.type.iso_date_time_field import IsoDateTimeField
+
+
+class DeviceArchiveTable(Base):
+    """Represents the 'device_archive' table in the database.
+
+    Devices removed by the retention job, if archiving is enabled.
+
+    Columns:
+        id: int (Primary key)
+        mac_address: str(17)
+        hostname: str
+        last_seen: IsoDateTimeField
+        archived_at: IsoDateTimeField
+    """
+
+    __tablename__ = "device_archive"
+
+    id = Column(Integer, primary_key=True)
+    mac_address = Column(VARCHAR(17), nullable=False)
+    hostname = Column(String, nullable=True)
+    last_seen = Column(IsoDateTimeField)
+    archived_at = Column(IsoDateTimeField, nullable=False)
@@ -0,0 +1,24 @@
+from sqlalchemy import Column
+from sqlalchemy.types import String
+
+from whois.data.db.base import Base
+from whois.data.type.iso_date_time_field import IsoDateTimeField
+
+
+class LeaderTable(Base):
+    """Represents the 'worker_leader' table in the database.
+
+    Lease rows used for worker leader election on databases without advisory
+    locks.
+
+    Columns:
+        name: str (Primary key)
+        holder: str
+        expires_at: IsoDateTimeField
+    """
+
+    __tablename__ = "worker_leader"
+
+    name = Column(String, primary_key=True)
+    holder = Column(String, nullable=False)
+    expires_at = Column(IsoDateTimeField, nullable=False)
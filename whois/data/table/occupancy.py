@@ -0,0 +1,22 @@
+from sqlalchemy import Column
+from sqlalchemy.types import VARCHAR, Date, LargeBinary
+
+from whois.data.db.base import Base
+
+
+class OccupancyTable(Base):
+    """Represents the 'occupancy' table in the database.
+
+    Minutes of a UTC day in which a device was present, see OccupancyBitmap.
+
+    Columns:
+        mac_address: str(17) (Primary key)
+        day: date (Primary key)
+        minutes: bytes(180)
+    """
+
+    __tablename__ = "occupancy"
+
+    mac_address = Column(VARCHAR(17), primary_key=True)
+    day = Column(Date, primary_key=True)
+    minutes = Column(LargeBinary(180), nullable=False)
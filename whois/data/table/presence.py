@@ -0,0 +1,41 @@
+from sqlalchemy import Column
+from sqlalchemy.types import Integer
+
+from whois.data.db.base import Base
+from whois.data.type.iso_date_time_field import IsoDateTimeField
+
+
+class HourlyPresenceTable(Base):
+    """Represents the 'presence_hourly' table in the database.
+
+    Rollup of the visit table, maintained by the worker.
+
+    Columns:
+        bucket: IsoDateTimeField (Primary key, start of the UTC hour)
+        devices: int (unique devices seen)
+        users: int (unique visible users seen)
+    """
+
+    __tablename__ = "presence_hourly"
+
+    bucket = Column(IsoDateTimeField, primary_key=True)
+    devices = Column(Integer, nullable=False, default=0)
+    users = Column(Integer, nullable=False, default=0)
+
+
+class DailyPresenceTable(Base):
+    """Represents the 'presence_daily' table in the database.
+
+    Rollup of the visit table, maintained by the worker.
+
+    Columns:
+        bucket: IsoDateTimeField (Primary key, start of the UTC day)
+        devices: int (unique devices seen)
+        users: int (unique visible users seen)
+    """
+
+    __tablename__ = "presence_daily"
+
+    bucket = Column(IsoDateTimeField, primary_key=True)
+    devices = Column(Integer, nullable=False, default=0)
+    users = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column
+from sqlalchemy.types import Integer, String
+
+from whois.data.db.base import Base
+from whois.data.type.iso_date_time_field import IsoDateTimeField
+
+
+class SchemaVersionTable(Base):
+    """Represents the 'schema_version' table in the database.
+
+    One row per applied migration, see `whois.data.db.migrations`.
+
+    Columns:
+        version: int (Primary key)
+        description: str
+        applied_at: IsoDateTimeField
+    """
+
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    description = Column(String, nullable=False)
+    applied_at = Column(IsoDateTimeField, nullable=False)
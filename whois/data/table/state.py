@@ -0,0 +1,23 @@
+from sqlalchemy import Column
+from sqlalchemy.types import Integer, String
+
+from whois.data.db.base import Base
+from whois.data.type.iso_date_time_field import IsoDateTimeField
+
+
+class StateTable(Base):
+    """Represents the 'state' table in the database.
+
+    Named counters shared by the web app and the worker.
+
+    Columns:
+        key: str (Primary key)
+        value: int
+        updated_at: IsoDateTimeField
+    """
+
+    __tablename__ = "state"
+
+    key = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(IsoDateTimeField)
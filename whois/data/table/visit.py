@@ -0,0 +1,28 @@
+from sqlalchemy import Column
+from sqlalchemy.types import VARCHAR, Integer
+
+from whois.data.db.base import Base
+from whois.data.type.iso_date_time_field import IsoDateTimeField
+
+
+class VisitTable(Base):
+    """Represents the 'visit' table in the database.
+
+    Visits outlive the devices and users they refer to, so there are no
+    foreign keys.
+
+    Columns:
+        id: int (Primary key)
+        mac_address: str(17)
+        user_id: int (Nullable, owner of the device when the visit started)
+        started_at: IsoDateTimeField
+        ended_at: IsoDateTimeField
+    """
+
+    __tablename__ = "visit"
+
+    id = Column(Integer, primary_key=True)
+    mac_address = Column(VARCHAR(17), nullable=False)
+    user_id = Column(Integer, nullable=True)
+    started_at = Column(IsoDateTimeField, nullable=False)
+    ended_at = Column(IsoDateTimeField, nullable=False)
@@ -1,18 +1,21 @@
 import sqlalchemy.types as types
 from sqlalchemy.ext.mutable import Mutable
 
-from whois.entity.bitfield import BitField
+from whois.entity import bitfield
 
 
-class BitField(BitField, types.TypeDecorator, Mutable):
+class BitField(bitfield.BitField, types.TypeDecorator, Mutable):
     impl = types.Integer()
+    cache_ok = True
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def process_bind_param(self, value, dialect):
         """Convert BitField to integer before storing in the database."""
-        if isinstance(value, BitField):
+        # checks the entity class, flags of entities are not instances of this
+        # column type
+        if isinstance(value, bitfield.BitField):
             return int(value)
         elif isinstance(value, int):
             return value
@@ -20,7 +23,7 @@ class BitField(BitField, types.TypeDecorator, Mutable):
 
     def process_result_value(self, value, dialect):
         """Convert integer from database back into a BitField instance."""
-        bitfield = BitField()
+        flags = bitfield.BitField()
         if value is not None:
-            bitfield._flags = value  # directly set flags based on stored integer
-        return bitfield
+            flags._flags = value  # directly set flags based on stored integer
+        return flags
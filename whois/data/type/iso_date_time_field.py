@@ -5,3 +5,4 @@ import sqlalchemy.types as types
 
 class IsoDateTimeField(types.TypeDecorator):
     impl = types.DATETIME
+    cache_ok = True
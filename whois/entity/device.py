@@ -20,3 +20,18 @@ class Device:
     last_seen: IsoDateTimeField
     owner: int
     flags: BitField
+
+    def has_flag(self, flag: DeviceFlags) -> bool:
+        return self.flags is not None and self.flags.has_flag(flag.value)
+
+    @property
+    def is_hidden(self) -> bool:
+        return self.has_flag(DeviceFlags.is_hidden)
+
+    @property
+    def is_infrastructure(self) -> bool:
+        return self.has_flag(DeviceFlags.is_infrastructure)
+
+    @property
+    def is_esp(self) -> bool:
+        return self.has_flag(DeviceFlags.is_esp)
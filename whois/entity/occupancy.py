@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+from functools import reduce
+from operator import or_
+from typing import Iterable, List
+
+MINUTES_PER_DAY = 24 * 60
+BITMAP_SIZE = MINUTES_PER_DAY // 8
+
+
+class OccupancyBitmap:
+    """Presence during one UTC day, one bit per minute.
+
+    Like BitField, but 1440 bits wide and backed by a 180 bytes buffer, which
+    is stored as is. Minute `m` is bit `m % 8` of byte `m // 8`, so the buffer
+    read as a little endian integer has minute `m` at bit `m`. Aggregations
+    work on those integers, an OR or a popcount covers a whole day at once.
+    """
+
+    __slots__ = ("_minutes",)
+
+    def __init__(self, data: bytes = None):
+        if data is None:
+            data = bytes(BITMAP_SIZE)
+        if len(data) != BITMAP_SIZE:
+            raise ValueError(f"Occupancy bitmaps are {BITMAP_SIZE} bytes long")
+        self._minutes = bytearray(data)
+
+    @classmethod
+    def from_int(cls, value: int) -> OccupancyBitmap:
+        return cls(value.to_bytes(BITMAP_SIZE, "little"))
+
+    @classmethod
+    def union(cls, bitmaps: Iterable[OccupancyBitmap]) -> OccupancyBitmap:
+        """Minutes in which any of the bitmaps is set."""
+        return cls.from_int(reduce(or_, map(int, bitmaps), 0))
+
+    def has_minute(self, minute: int) -> bool:
+        """Check if the minute of the day is set"""
+        return bool(self._minutes[minute >> 3] & (1 << (minute & 7)))
+
+    def set_minute(self, minute: int) -> None:
+        """Set a minute of the day"""
+        self._minutes[minute >> 3] |= 1 << (minute & 7)
+
+    def set_range(self, first: int, last: int) -> None:
+        """Set the minutes from `first` to `last`, both included"""
+        if not 0 <= first <= last < MINUTES_PER_DAY:
+            raise ValueError(f"Invalid minute range {first}-{last}")
+        mask = ((1 << (last - first + 1)) - 1) << first
+        self._minutes[:] = (int(self) | mask).to_bytes(BITMAP_SIZE, "little")
+
+    def count(self) -> int:
+        """Number of minutes set"""
+        return int(self).bit_count()
+
+    def counts(self, period: int = 60) -> List[int]:
+        """Number of minutes set in each `period` minutes, e.g. per hour"""
+        value, mask = int(self), (1 << period) - 1
+        return [
+            (value >> start & mask).bit_count()
+            for start in range(0, MINUTES_PER_DAY, period)
+        ]
+
+    def __int__(self) -> int:
+        return int.from_bytes(self._minutes, "little")
+
+    def __bytes__(self) -> bytes:
+        return bytes(self._minutes)
+
+    def __or__(self, other: OccupancyBitmap) -> OccupancyBitmap:
+        return OccupancyBitmap.from_int(int(self) | int(other))
+
+    def __eq__(self, other: OccupancyBitmap) -> bool:
+        return isinstance(other, OccupancyBitmap) and self._minutes == other._minutes
+
+    def __repr__(self) -> str:
+        return f"OccupancyBitmap({self.count()} minutes)"
@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass
+class Visit:
+    """Continuous presence of a device, gaps shorter than the visit gap merged."""
+
+    mac_address: str
+    started_at: datetime
+    ended_at: datetime
+    id: int = None
+
+
+@dataclass
+class PresenceBucket:
+    """Unique devices and users present during an hour or a day."""
+
+    start: datetime
+    devices: int
+    users: int
+
+
+@dataclass
+class PresenceSnapshot:
+    """Who is at the space, computed once per data version for all views.
+
+    `recent` holds the (device, owner) pairs seen within the recent period,
+    hidden devices and owners included. The rest only counts visible ones.
+    `fingerprint` changes whenever what /api/now reports does.
+    """
+
+    version: int
+    recent: list
+    users: list
+    unknown_devices: int
+    fingerprint: str = None
+
+    @property
+    def headcount(self) -> int:
+        return len(self.users)
+
+    @property
+    def named_users(self) -> list:
+        return [user for user in self.users if not user.is_name_anonymous]
+
+    @property
+    def unclaimed(self) -> list:
+        return [device for device, _ in self.recent if device.owner is None]
@@ -0,0 +1,94 @@
+"""Read-only counterparts of Device and User for read-heavy views.
+
+Built straight from result rows by the read repositories: no ORM instance,
+no mapper copy, and flags stay an integer until `flags` is accessed.
+"""
+
+from datetime import datetime
+
+from whois.entity.bitfield import BitField
+from whois.entity.device import DeviceFlags
+from whois.entity.user import UserFlags
+
+
+def make_bitfield(flags: int) -> BitField:
+    bitfield = BitField()
+    bitfield._flags = flags or 0
+    return bitfield
+
+
+class DeviceRecord:
+    __slots__ = ("mac_address", "hostname", "last_seen", "owner", "_flags")
+
+    def __init__(
+        self,
+        mac_address: str,
+        hostname: str,
+        last_seen: datetime,
+        owner: int,
+        flags: int,
+    ):
+        self.mac_address = mac_address
+        self.hostname = hostname
+        self.last_seen = last_seen
+        self.owner = owner
+        self._flags = flags or 0
+
+    @property
+    def flags(self) -> BitField:
+        return make_bitfield(self._flags)
+
+    def has_flag(self, flag: DeviceFlags) -> bool:
+        return self._flags & flag.value == flag.value
+
+    @property
+    def is_hidden(self) -> bool:
+        return self.has_flag(DeviceFlags.is_hidden)
+
+    @property
+    def is_infrastructure(self) -> bool:
+        return self.has_flag(DeviceFlags.is_infrastructure)
+
+    @property
+    def is_esp(self) -> bool:
+        return self.has_flag(DeviceFlags.is_esp)
+
+    def __repr__(self) -> str:
+        return f"DeviceRecord({self.mac_address})"
+
+
+class UserRecord:
+    __slots__ = ("id", "username", "display_name", "_flags")
+
+    def __init__(self, id: int, username: str, display_name: str, flags: int):
+        self.id = id
+        self.username = username
+        self.display_name = display_name
+        self._flags = flags or 0
+
+    def __str__(self):
+        if self.is_name_anonymous or self.is_hidden:
+            return "anonymous"
+        else:
+            return self.display_name
+
+    def get_id(self) -> int:
+        return self.id
+
+    @property
+    def flags(self) -> BitField:
+        return make_bitfield(self._flags)
+
+    def has_flag(self, flag: UserFlags) -> bool:
+        return self._flags & flag.value == flag.value
+
+    @property
+    def is_hidden(self) -> bool:
+        return self.has_flag(UserFlags.is_hidden)
+
+    @property
+    def is_name_anonymous(self) -> bool:
+        return self.has_flag(UserFlags.is_name_anonymous)
+
+    def __repr__(self) -> str:
+        return f"UserRecord({self.username})"
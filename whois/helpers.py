@@ -1,3 +1,4 @@
+import ipaddress
 import logging
 from datetime import datetime, timedelta, timezone
 from functools import wraps
@@ -22,6 +23,28 @@ class Helpers:
     def owners_from_devices(self, devices):
         return set(filter(None, map(lambda d: d.owner, devices)))
 
+    def recent_period(self, args) -> dict:
+        """RECENT_TIME overridden by days, hours or minutes query arguments.
+
+        Values which are not integers count as 0, like Flask's `type=int`.
+        """
+        period = {**self.app_settings.RECENT_TIME}
+        for key in ["days", "hours", "minutes"]:
+            if key in args:
+                try:
+                    period[key] = int(args.get(key))
+                except (TypeError, ValueError):
+                    period[key] = 0
+        return period
+
+    def now_at_space(self, snapshot) -> dict:
+        """Body of /api/now from a PresenceSnapshot"""
+        return {
+            "users": sorted(map(str, snapshot.named_users)),
+            "headcount": snapshot.headcount,
+            "unknown_devices": snapshot.unknown_devices,
+        }
+
     def filter_hidden(self, entities):
         return list(filter(lambda e: not e.is_hidden, entities))
 
@@ -42,16 +65,26 @@ class Helpers:
         """
         Checks if given address is in space defined by mask
         :param mask: string for ex. '192.168.88.1-255'
-        :param address:
+        :param address: IPv4 or IPv6 address, anything else is outside
         :return: boolean
         """
-        ip_parts = address.split(".")
+        try:
+            ip = ipaddress.ip_address(address.strip())
+        except (AttributeError, ValueError):
+            return False
+        if ip.version == 6:
+            # IPv6 clients are only inside as IPv4-mapped addresses
+            if ip.ipv4_mapped is None:
+                return False
+            ip = ip.ipv4_mapped
+
+        ip_parts = ip.packed
         for index, current_range in enumerate(mask.split(".")):
             if "-" in current_range:
                 mini, maxi = map(int, current_range.split("-"))
             else:
                 mini = maxi = int(current_range)
-            if not (mini <= int(ip_parts[index]) <= maxi):
+            if not (mini <= ip_parts[index] <= maxi):
                 return False
         return True
 
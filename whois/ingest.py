@@ -0,0 +1,110 @@
+import atexit
+import logging
+import re
+import threading
+from datetime import datetime, timezone
+
+from whois.data.repository.device_repository import DeviceRepository, UpsertResult
+from whois.entity.device import Device
+
+logger = logging.getLogger(__name__)
+
+mac_address_re = re.compile(r"^([0-9A-F]{2}:){5}[0-9A-F]{2}$")
+
+
+def event_to_device(event: dict, now: datetime) -> Device | None:
+    """Turn a lease event pushed by a RouterOS lease script into a device.
+
+    Events look like {"mac-address": "AA:BB:..", "host-name": "..", "bound": true}.
+    Unbind events return None, the device keeps the last_seen of its last bind
+    or poll until the next reconciliation.
+    """
+    mac_address = str(event["mac-address"]).upper()
+    if not mac_address_re.match(mac_address):
+        raise ValueError(f"Invalid MAC address: {mac_address}")
+
+    if str(event.get("bound", True)).lower() in ("0", "false"):
+        return None
+
+    return Device(
+        mac_address=mac_address,
+        hostname=event.get("host-name") or None,
+        last_seen=now,
+        owner=None,
+        flags=None,
+    )
+
+
+def events_to_devices(payload) -> tuple[list[Device], int]:
+    """Parse a single event or a list of events, return devices and ignored count."""
+    events = payload if isinstance(payload, list) else [payload]
+    now = datetime.now(timezone.utc)
+    devices = [event_to_device(event, now) for event in events]
+    accepted = [device for device in devices if device is not None]
+    return accepted, len(devices) - len(accepted)
+
+
+class LeaseEventBuffer:
+    """Coalesces pushed lease events per MAC address and writes them in batches.
+
+    Events are flushed by a background thread every `flush_interval_s`, or as
+    soon as `max_batch` devices are pending. The thread is started on the first
+    event, so it is created in each forked web worker process.
+    """
+
+    def __init__(
+        self,
+        device_repository: DeviceRepository,
+        flush_interval_s: float,
+        max_batch: int,
+    ):
+        self.device_repository = device_repository
+        self.flush_interval_s = flush_interval_s
+        self.max_batch = max_batch
+
+        self.pending: dict[str, Device] = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+
+    def add(self, devices: list[Device]) -> None:
+        with self.lock:
+            for device in devices:
+                self.pending[device.mac_address] = device
+            if len(self.pending) >= self.max_batch:
+                self.wakeup.set()
+            if self.thread is None:
+                self.thread = threading.Thread(
+                    target=self.run, name="lease-event-buffer", daemon=True
+                )
+                self.thread.start()
+                atexit.register(self.flush)
+
+    def flush(self) -> UpsertResult:
+        with self.lock:
+            devices, self.pending = self.pending, {}
+
+        try:
+            return self.device_repository.upsert_many(list(devices.values()))
+        except Exception:
+            # keep the events for the next flush, unless newer ones arrived
+            with self.lock:
+                self.pending = {**devices, **self.pending}
+            raise
+        finally:
+            self.device_repository.database.remove_session()
+
+    def run(self) -> None:
+        while True:
+            self.wakeup.wait(self.flush_interval_s)
+            self.wakeup.clear()
+            try:
+                result = self.flush()
+            except Exception:
+                logger.exception("Could not write pushed lease events")
+                continue
+            if result.total:
+                logger.info(
+                    f"Wrote pushed lease events: {result.inserted} inserted, "
+                    f"{result.updated} updated, {result.unchanged} unchanged"
+                )
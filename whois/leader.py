@@ -0,0 +1,181 @@
+import abc
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import insert, text, update
+from sqlalchemy.exc import DBAPIError, IntegrityError
+
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import as_utc_naive
+from whois.data.table.leader import LeaderTable
+
+logger = logging.getLogger(__name__)
+
+
+def make_holder_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElection(abc.ABC):
+    """Makes sure only one of several worker instances is active at a time.
+
+    `acquire` is called once by `start` and then periodically by a heartbeat
+    thread: it becomes or stays the leader if possible, and `is_leader` holds
+    the latest outcome.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.is_leader = False
+
+    @abc.abstractmethod
+    def acquire(self) -> bool: ...
+
+    @abc.abstractmethod
+    def release(self) -> None: ...
+
+    def elect(self, on_elected=None) -> None:
+        try:
+            is_leader = self.acquire()
+        except Exception:
+            logger.exception("Leader election failed")
+            is_leader = False
+
+        if is_leader != self.is_leader:
+            logger.info(f"{'Became' if is_leader else 'Lost'} {self.name} leader")
+        was_leader, self.is_leader = self.is_leader, is_leader
+        if is_leader and not was_leader and on_elected is not None:
+            on_elected()
+
+    def heartbeat(self, interval_s: float, on_elected=None) -> None:
+        while True:
+            time.sleep(interval_s)
+            self.elect(on_elected)
+
+    def start(self, interval_s: float, on_elected=None) -> None:
+        """Elect right away, so the first tick knows if it is the leader."""
+        self.elect(on_elected)
+        threading.Thread(
+            target=self.heartbeat,
+            args=(interval_s, on_elected),
+            name="leader-election",
+            daemon=True,
+        ).start()
+
+
+class AdvisoryLockElection(LeaderElection):
+    """PostgreSQL session advisory lock held on a dedicated connection.
+
+    The lock is released by the server as soon as the leader's connection
+    goes away, so a standby takes over on its next heartbeat.
+    """
+
+    def __init__(self, database: Database, name: str):
+        super().__init__(name)
+        self.database = database
+        self.lock_id = zlib.crc32(name.encode())
+        self.connection = None
+
+    def acquire(self) -> bool:
+        if self.connection is not None:
+            try:
+                self.connection.execute(text("SELECT 1"))
+                self.connection.commit()
+                return True
+            except DBAPIError:
+                logger.warning("Lost the connection holding the leader lock")
+                self.connection.invalidate()
+                self.connection = None
+
+        connection = self.database.engine.connect()
+        acquired = connection.execute(
+            text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": self.lock_id}
+        ).scalar()
+        connection.commit()
+        if acquired:
+            self.connection = connection
+        else:
+            connection.close()
+        return bool(acquired)
+
+    def release(self) -> None:
+        if self.connection is not None:
+            self.connection.execute(
+                text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": self.lock_id}
+            )
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+        self.is_leader = False
+
+
+class LeaseRowElection(LeaderElection):
+    """Lease row with an expiry renewed by the leader's heartbeat.
+
+    Used on databases without advisory locks, like SQLite. A standby takes over
+    once the lease of a dead leader expires, i.e. within `ttl` plus one
+    heartbeat interval.
+    """
+
+    def __init__(
+        self,
+        database: Database,
+        name: str,
+        ttl: timedelta,
+        holder: str = None,
+        clock=lambda: datetime.now(timezone.utc),
+    ):
+        super().__init__(name)
+        self.database = database
+        self.ttl = ttl
+        self.holder = holder or make_holder_id()
+        self.clock = clock
+
+    def acquire(self) -> bool:
+        now = as_utc_naive(self.clock())
+        with self.database.transaction() as session:
+            renewed = session.execute(
+                update(LeaderTable)
+                .where(LeaderTable.name == self.name)
+                .where(
+                    (LeaderTable.holder == self.holder) | (LeaderTable.expires_at < now)
+                )
+                .values(holder=self.holder, expires_at=now + self.ttl)
+            )
+            if renewed.rowcount:
+                return True
+
+        try:
+            with self.database.transaction() as session:
+                session.execute(
+                    insert(LeaderTable).values(
+                        name=self.name, holder=self.holder, expires_at=now + self.ttl
+                    )
+                )
+        except IntegrityError:
+            # held by another live instance
+            return False
+        return True
+
+    def release(self) -> None:
+        with self.database.transaction() as session:
+            session.execute(
+                update(LeaderTable)
+                .where(LeaderTable.name == self.name)
+                .where(LeaderTable.holder == self.holder)
+                .values(expires_at=as_utc_naive(self.clock()))
+            )
+        self.is_leader = False
+
+
+def make_election(database: Database, name: str, ttl: timedelta) -> LeaderElection:
+    """Pick the election mechanism supported by the configured database."""
+    if database.engine.dialect.name == "postgresql":
+        return AdvisoryLockElection(database, name)
+    return LeaseRowElection(database, name, ttl)
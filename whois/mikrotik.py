@@ -1,13 +1,24 @@
+import abc
+import codecs
+import hashlib
+import itertools
+import json
+import random
 import re
+import socket
+import ssl
+import time
 from dataclasses import dataclass, fields
 from datetime import timedelta
-from urllib.parse import urljoin
+from typing import Any, Iterable, Iterator
+from urllib.parse import urljoin, urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 
 
-@dataclass
+@dataclass(slots=True)
 class MikrotikDhcpLease:
     # flags
     disabled: bool
@@ -31,43 +42,448 @@ class MikrotikDhcpLease:
     host_name: str
 
 
+READ_CHUNK_SIZE = 64 * 1024
+JSON_SEPARATORS = frozenset(" \t\r\n,")
+
+
+# Lease properties the worker needs, used as the REST `.proplist` projection
+WORKER_PROPLIST = ("mac-address", "host-name", "last-seen", "address", "status")
+
+
+@dataclass
+class ClientMetrics:
+    requests: int = 0
+    failures: int = 0
+    last_response_bytes: int = 0
+    last_latency_s: float = 0.0
+
+
+class RouterClient(abc.ABC):
+    """Common parts of the RouterOS transports.
+
+    With `deadline_s`, retries of a request stop once their backoff would end
+    past the deadline, counted from the first attempt, and the timeouts of an
+    attempt are shortened to end by then.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        connect_timeout_s: float = 5.0,
+        read_timeout_s: float = 30.0,
+        retries: int = 2,
+        backoff_s: float = 1.0,
+        max_backoff_s: float = 30.0,
+        proplist: Iterable[str] | None = None,
+        deadline_s: float | None = None,
+    ):
+        self.url = url
+        self.connect_timeout_s = connect_timeout_s
+        self.read_timeout_s = read_timeout_s
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.deadline_s = deadline_s
+        self.proplist = ",".join(proplist) if proplist else None
+        self.metrics = ClientMetrics()
+        self.sleep = time.sleep
+
+    def close(self) -> None:
+        pass
+
+    def backoff_delay(self, attempt: int) -> float:
+        delay = min(self.max_backoff_s, self.backoff_s * 2**attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def retry_delay(self, attempt: int, started: float) -> float | None:
+        """Backoff before the next attempt, None when there is none."""
+        if attempt == self.retries:
+            return None
+        delay = self.backoff_delay(attempt)
+        if (
+            self.deadline_s is not None
+            and time.monotonic() - started + delay >= self.deadline_s
+        ):
+            return None
+        return delay
+
+    def timeouts(self, started: float) -> tuple[float, float]:
+        """Connect and read timeouts of an attempt started after `started`."""
+        if self.deadline_s is None:
+            return self.connect_timeout_s, self.read_timeout_s
+        remaining = max(0.0, self.deadline_s - (time.monotonic() - started))
+        return (
+            min(self.connect_timeout_s, remaining),
+            min(self.read_timeout_s, remaining),
+        )
+
+    @abc.abstractmethod
+    def stream_leases(self) -> Iterator[MikrotikDhcpLease]: ...
+
+    def fetch_leases(self) -> list[MikrotikDhcpLease]:
+        return list(self.stream_leases())
+
+
+class RouterOSClient(RouterClient):
+    """REST client for a single RouterOS router.
+
+    Keeps a pooled keep-alive session between requests, applies connect and
+    read timeouts and retries failed requests with jittered exponential backoff.
+    """
+
+    def __init__(self, url: str, user: str, password: str, **kwargs):
+        super().__init__(url, **kwargs)
+
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(user, password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self) -> None:
+        self.session.close()
+
+    def get(self, path: str) -> requests.Response:
+        params = {".proplist": self.proplist} if self.proplist else None
+        started = time.monotonic()
+        for attempt in range(self.retries + 1):
+            self.metrics.requests += 1
+            try:
+                resp = self.session.get(
+                    urljoin(self.url, path),
+                    params=params,
+                    stream=True,
+                    timeout=self.timeouts(started),
+                )
+                if resp.status_code < 500:
+                    resp.raise_for_status()
+                    return resp
+                resp.close()
+                error = requests.HTTPError(f"{resp.status_code} from {self.url}")
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                error = exc
+
+            self.metrics.failures += 1
+            delay = self.retry_delay(attempt, started)
+            if delay is None:
+                raise error
+            self.sleep(delay)
+
+    def stream_leases(self) -> Iterator[MikrotikDhcpLease]:
+        """Fetch DHCP leases, parsing them while the response is being read."""
+        started = time.perf_counter()
+        self.metrics.last_response_bytes = 0
+        with self.get("rest/ip/dhcp-server/lease") as resp:
+            chunks = codecs.iterdecode(self._count(resp), "utf-8")
+            yield from iter_leases(chunks)
+        self.metrics.last_latency_s = time.perf_counter() - started
+
+    def _count(self, resp: requests.Response) -> Iterator[bytes]:
+        for chunk in resp.iter_content(READ_CHUNK_SIZE):
+            self.metrics.last_response_bytes += len(chunk)
+            yield chunk
+
+
+class RouterOSApiError(Exception):
+    """Error (`!trap` or `!fatal`) returned by the RouterOS API."""
+
+
+def encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return length.to_bytes(1, "big")
+    if length < 0x4000:
+        return (length | 0x8000).to_bytes(2, "big")
+    if length < 0x200000:
+        return (length | 0xC00000).to_bytes(3, "big")
+    if length < 0x10000000:
+        return (length | 0xE0000000).to_bytes(4, "big")
+    return b"\xf0" + length.to_bytes(4, "big")
+
+
+def encode_sentence(words: Iterable[str]) -> bytes:
+    encoded = b""
+    for word in words:
+        data = word.encode()
+        encoded += encode_length(len(data)) + data
+    return encoded + b"\x00"
+
+
+def read_length(stream) -> int:
+    first = read_exactly(stream, 1)[0]
+    if first < 0x80:
+        return first
+    if first < 0xC0:
+        extra, value = 1, first & 0x3F
+    elif first < 0xE0:
+        extra, value = 2, first & 0x1F
+    elif first < 0xF0:
+        extra, value = 3, first & 0x0F
+    else:
+        extra, value = 4, 0
+    return (value << 8 * extra) + int.from_bytes(read_exactly(stream, extra), "big")
+
+
+def read_sentence(stream) -> list[str]:
+    words = []
+    while length := read_length(stream):
+        words.append(read_exactly(stream, length).decode(errors="replace"))
+    return words
+
+
+def read_exactly(stream, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise ConnectionError("RouterOS API connection closed")
+    return data
+
+
+def sentence_attributes(words: list[str]) -> dict:
+    """Turn `=key=value` words of a reply sentence into a dict."""
+    attributes = {}
+    for word in words[1:]:
+        if word.startswith("="):
+            key, _, value = word[1:].partition("=")
+            attributes[key] = value
+    return attributes
+
+
+class RouterOSApiClient(RouterClient):
+    """Client for the binary RouterOS API sentence protocol.
+
+    Selected with an `api://host[:8728]` or `api-ssl://host[:8729]` router URL.
+    Lease replies are parsed while they are being received, without the router
+    having to build a JSON document. The connection stays logged in between
+    fetches and is re-established with backoff after a failure.
+    """
+
+    def __init__(self, url: str, user: str, password: str, **kwargs):
+        super().__init__(url, **kwargs)
+        self.user = user
+        self.password = password
+
+        parsed = urlparse(url)
+        self.use_tls = parsed.scheme == "api-ssl"
+        self.address = (
+            parsed.hostname,
+            parsed.port or (API_SSL_PORT if self.use_tls else API_PORT),
+        )
+        self.socket = None
+        self.stream = None
+
+    def close(self) -> None:
+        if self.socket is not None:
+            self.socket.close()
+        self.socket = self.stream = None
+
+    def connect(self, timeouts: tuple[float, float] = None) -> None:
+        connect_timeout_s, read_timeout_s = timeouts or self.timeouts(time.monotonic())
+        sock = socket.create_connection(self.address, timeout=connect_timeout_s)
+        if self.use_tls:
+            context = ssl.create_default_context()
+            sock = context.wrap_socket(sock, server_hostname=self.address[0])
+        sock.settimeout(read_timeout_s)
+        self.socket = sock
+        self.stream = sock.makefile("rb")
+
+        reply = self.talk(
+            ["/login", f"=name={self.user}", f"=password={self.password}"]
+        )
+        challenge = sentence_attributes(reply[-1]).get("ret")
+        if challenge:
+            # RouterOS before 6.43 answers with an MD5 challenge
+            digest = hashlib.md5(
+                b"\x00" + self.password.encode() + bytes.fromhex(challenge)
+            ).hexdigest()
+            self.talk(["/login", f"=name={self.user}", f"=response=00{digest}"])
+
+    def ensure_connected(self) -> None:
+        started = time.monotonic()
+        for attempt in range(self.retries + 1):
+            if self.socket is not None:
+                return
+            self.metrics.requests += 1
+            try:
+                self.connect(self.timeouts(started))
+            except RouterOSApiError:
+                self.close()
+                raise
+            except OSError:
+                self.close()
+                self.metrics.failures += 1
+                delay = self.retry_delay(attempt, started)
+                if delay is None:
+                    raise
+                self.sleep(delay)
+
+    def send(self, words: list[str]) -> None:
+        self.socket.sendall(encode_sentence(words))
+
+    def replies(self) -> Iterator[list[str]]:
+        """Yield reply sentences of the last command until `!done`."""
+        while True:
+            sentence = read_sentence(self.stream)
+            self.metrics.last_response_bytes += sum(map(len, sentence)) + 1
+            reply = sentence[0] if sentence else ""
+            if reply in ("!trap", "!fatal"):
+                message = sentence_attributes(sentence).get("message", reply)
+                if reply == "!trap":
+                    # the command is still terminated by `!done`
+                    for _ in self.replies():
+                        pass
+                raise RouterOSApiError(message)
+            yield sentence
+            if reply == "!done":
+                return
+
+    def talk(self, words: list[str]) -> list[list[str]]:
+        self.send(words)
+        return list(self.replies())
+
+    def command(self, words: list[str]) -> Iterator[list[str]]:
+        """Send a command and return its reply sentences.
+
+        A kept-alive connection may have been dropped by the router since the
+        last fetch, in that case the command is retried on a new connection.
+        """
+        reused = self.socket is not None
+        self.ensure_connected()
+        try:
+            self.send(words)
+            replies = self.replies()
+            first = next(replies)
+        except OSError:
+            self.close()
+            if not reused:
+                raise
+            self.ensure_connected()
+            self.send(words)
+            replies = self.replies()
+            first = next(replies)
+        return itertools.chain([first], replies)
+
+    def stream_leases(self) -> Iterator[MikrotikDhcpLease]:
+        started = time.perf_counter()
+        self.metrics.last_response_bytes = 0
+
+        command = ["/ip/dhcp-server/lease/print"]
+        if self.proplist:
+            command.append(f"=.proplist={self.proplist}")
+
+        completed = False
+        try:
+            for sentence in self.command(command):
+                if sentence[0] == "!re":
+                    yield parse_lease(sentence_attributes(sentence))
+            completed = True
+        finally:
+            # unread replies would be taken as answers to the next command
+            if not completed:
+                self.close()
+        self.metrics.last_latency_s = time.perf_counter() - started
+
+
+API_PORT = 8728
+API_SSL_PORT = 8729
+API_SCHEMES = ("api", "api-ssl")
+
+
+def make_client(url: str, user: str, password: str, **kwargs) -> RouterClient:
+    """Create a client for the transport selected by the router URL scheme."""
+    if urlparse(url).scheme in API_SCHEMES:
+        return RouterOSApiClient(url, user, password, **kwargs)
+    return RouterOSClient(url, user, password, **kwargs)
+
+
 def fetch_leases(url: str, user: str, password: str) -> list[MikrotikDhcpLease]:
-    auth = HTTPBasicAuth(user, password)
-    resp = requests.get(urljoin(url, "rest/ip/dhcp-server/lease"), auth=auth)
-    assert resp.ok
+    client = make_client(url, user, password)
+    try:
+        return client.fetch_leases()
+    finally:
+        client.close()
 
-    return parse_leases(resp.json())
 
+def merge_leases(
+    lease_lists: Iterable[Iterable[MikrotikDhcpLease]],
+) -> list[MikrotikDhcpLease]:
+    """Merge leases from several routers by MAC address, newest last_seen wins."""
+    merged = {}
+    for leases in lease_lists:
+        for lease in leases:
+            current = merged.get(lease.mac_address)
+            if current is None or (
+                lease.last_seen is not None
+                and (current.last_seen is None or lease.last_seen < current.last_seen)
+            ):
+                merged[lease.mac_address] = lease
+    return list(merged.values())
 
-def parse_leases(leases: dict) -> list[MikrotikDhcpLease]:
-    dhcp_leases = []
 
-    for lease in leases:
-        data = {
-            key.replace("-", "_"): value for key, value in lease.items() if key != ".id"
-        }
+def iter_leases(chunks: Iterable[str]) -> Iterator[MikrotikDhcpLease]:
+    """Parse leases from chunks of a RouterOS REST lease list."""
+    return map(parse_lease, iter_json_array(chunks))
 
-        parsed = {
-            field.name: parse_value(data.get(field.name), field.type)
-            for field in fields(MikrotikDhcpLease)
-        }
 
-        dhcp_leases.append(MikrotikDhcpLease(**parsed))
+def parse_leases(leases: list[dict]) -> list[MikrotikDhcpLease]:
+    return list(map(parse_lease, leases))
 
-    return dhcp_leases
 
+def parse_lease(lease: dict) -> MikrotikDhcpLease:
+    get = lease.get
+    return MikrotikDhcpLease(*[convert(get(key)) for key, convert in LEASE_PLAN])
 
-def parse_value(value: str | None, field_type: type) -> str | timedelta | None:
-    if not value:
-        return
 
-    if field_type is timedelta:
-        return parse_duration(value)
+def iter_json_array(chunks: Iterable[str]) -> Iterator[Any]:
+    """Incrementally decode the elements of a top-level JSON array.
+
+    Only the chunk being decoded is kept in memory, so memory use does not
+    depend on the number of elements.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, pos = "", 0
+    opened = False
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in JSON_SEPARATORS:
+            pos += 1
+
+        if pos == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise ValueError("Unexpected end of JSON array")
+            buffer, pos = chunk, 0
+            continue
+
+        if not opened:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array")
+            opened = True
+            pos += 1
+            continue
+
+        if buffer[pos] == "]":
+            return
 
-    if field_type is bool:
-        return value == "true"
+        try:
+            value, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            chunk = next(chunks, None)
+            if chunk is None:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
 
-    return value
+        yield value
+
+
+def parse_str(value: str | None) -> str | None:
+    return value or None
+
+
+def parse_bool(value: str | None) -> bool | None:
+    if not value:
+        return
+    return value == "true"
 
 
 duration_re = re.compile(
@@ -82,7 +498,8 @@ def parse_duration(duration_str: str | None) -> timedelta | None:
     if not duration_str:
         return
 
-    parts = duration_re.match(duration_str)
+    # e.g. "never" for static leases, which would otherwise match as 0s
+    parts = duration_re.fullmatch(duration_str)
     if not parts:
         return
     parts = parts.groupdict()
@@ -95,3 +512,15 @@ def parse_duration(duration_str: str | None) -> timedelta | None:
     time_params.pop("weeks", None)
 
     return timedelta(**time_params)
+
+
+VALUE_PARSERS = {
+    bool: parse_bool,
+    timedelta: parse_duration,
+}
+
+# (REST key, converter) for each MikrotikDhcpLease field, in field order
+LEASE_PLAN = tuple(
+    (field.name.replace("_", "-"), VALUE_PARSERS.get(field.type, parse_str))
+    for field in fields(MikrotikDhcpLease)
+)
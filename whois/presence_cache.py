@@ -0,0 +1,175 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from whois.data.repository.device_read_repository import DeviceReadRepository
+from whois.data.repository.state_repository import PRESENCE_VERSION, StateRepository
+from whois.entity.presence import PresenceSnapshot
+
+# Snapshots of distinct recent periods kept at a time, /api/now takes any
+MAX_PERIODS = 16
+
+
+def make_snapshot(version: int, recent: list) -> PresenceSnapshot:
+    """Build a snapshot from recent (device, owner) pairs of all devices.
+
+    Unclaimed devices are all counted, hidden ones included, as / and /api/now
+    always did. Only owners are left out by hidden devices and owners.
+    """
+    users = {}
+    unknown_devices = 0
+    for device, owner in recent:
+        if device.owner is None:
+            unknown_devices += 1
+        elif owner is not None and not device.is_hidden and not owner.is_hidden:
+            users.setdefault(owner.id, owner)
+
+    snapshot = PresenceSnapshot(
+        version=version,
+        recent=recent,
+        users=list(users.values()),
+        unknown_devices=unknown_devices,
+    )
+    reported = (
+        sorted(map(str, snapshot.named_users)),
+        snapshot.headcount,
+        snapshot.unknown_devices,
+    )
+    snapshot.fingerprint = hashlib.sha1(repr(reported).encode()).hexdigest()[:20]
+    return snapshot
+
+
+class PresenceCache:
+    """Presence snapshots shared by the views of a web app process.
+
+    A snapshot is rebuilt once PRESENCE_VERSION changed, which every write
+    changing who is present bumps, checked at most every `check_interval_s`.
+    Devices also leave the recent period without any write, so snapshots are
+    rebuilt when older than `max_age_s` as well.
+    """
+
+    def __init__(
+        self,
+        device_read_repository: DeviceReadRepository,
+        state_repository: StateRepository,
+        check_interval_s: float,
+        max_age_s: float,
+        clock=time.monotonic,
+    ):
+        self.device_read_repository = device_read_repository
+        self.state_repository = state_repository
+        self.check_interval_s = check_interval_s
+        self.max_age_s = max_age_s
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.version = None
+        self.checked_at = None
+        self._snapshots: OrderedDict[tuple, tuple[float, PresenceSnapshot]] = (
+            OrderedDict()
+        )
+
+    def invalidate(self) -> None:
+        """Drop all snapshots, e.g. after a write of this process."""
+        with self.lock:
+            self.version = self.checked_at = None
+            self._snapshots.clear()
+
+    def check_version(self, now: float) -> int:
+        if self.checked_at is None or now - self.checked_at >= self.check_interval_s:
+            version = self.state_repository.get(PRESENCE_VERSION)
+            with self.lock:
+                if version != self.version:
+                    self._snapshots.clear()
+                self.version, self.checked_at = version, now
+        return self.version
+
+    def current_version(self) -> int:
+        """PRESENCE_VERSION, read at most every `check_interval_s`."""
+        return self.check_version(self.clock())
+
+    def get(self, period: dict) -> PresenceSnapshot:
+        """Snapshot of devices seen within `period`, like RECENT_TIME."""
+        now = self.clock()
+        version = self.check_version(now)
+        key = tuple(sorted(period.items()))
+
+        with self.lock:
+            cached = self._snapshots.get(key)
+        if cached is not None and now - cached[0] < self.max_age_s:
+            return cached[1]
+
+        snapshot = make_snapshot(
+            version,
+            self.device_read_repository.get_recent_with_owners(
+                timedelta(**period), visible_only=False
+            ),
+        )
+        with self.lock:
+            if self.version == version:
+                self._snapshots[key] = (now, snapshot)
+                self._snapshots.move_to_end(key)
+                while len(self._snapshots) > MAX_PERIODS:
+                    self._snapshots.popitem(last=False)
+        return snapshot
+
+
+class AsyncPresenceCache:
+    """Asyncio counterpart of PresenceCache for the async JSON app.
+
+    All coroutines of a process run on one thread, so no lock is needed. The
+    app never writes, new presence shows up through PRESENCE_VERSION.
+    """
+
+    def __init__(
+        self,
+        device_repository,
+        state_repository,
+        check_interval_s: float,
+        max_age_s: float,
+        clock=time.monotonic,
+    ):
+        self.device_repository = device_repository
+        self.state_repository = state_repository
+        self.check_interval_s = check_interval_s
+        self.max_age_s = max_age_s
+        self.clock = clock
+
+        self.version = None
+        self.checked_at = None
+        self._snapshots: OrderedDict[tuple, tuple[float, PresenceSnapshot]] = (
+            OrderedDict()
+        )
+
+    async def check_version(self, now: float) -> int:
+        if self.checked_at is None or now - self.checked_at >= self.check_interval_s:
+            version = await self.state_repository.get(PRESENCE_VERSION)
+            if version != self.version:
+                self._snapshots.clear()
+            self.version, self.checked_at = version, now
+        return self.version
+
+    async def get(self, period: dict) -> PresenceSnapshot:
+        """See PresenceCache.get"""
+        now = self.clock()
+        version = await self.check_version(now)
+        key = tuple(sorted(period.items()))
+
+        cached = self._snapshots.get(key)
+        if cached is not None and now - cached[0] < self.max_age_s:
+            return cached[1]
+
+        snapshot = make_snapshot(
+            version,
+            await self.device_repository.get_recent_with_owners(
+                timedelta(**period), visible_only=False
+            ),
+        )
+        if self.version == version:
+            self._snapshots[key] = (now, snapshot)
+            self._snapshots.move_to_end(key)
+            while len(self._snapshots) > MAX_PERIODS:
+                self._snapshots.popitem(last=False)
+        return snapshot
@@ -0,0 +1,157 @@
+"""Presence snapshot shared by the worker with all web app processes.
+
+After each tick the worker publishes the presence of the recent period to a
+file, replaced atomically. Web app processes memory-map it and parse it only
+when its generation changed, so `/` and `/api/now` are served without
+reading the devices. The file starts with a fixed header, followed by JSON:
+
+    magic (4 bytes) | generation (uint64) | published_at | expires_at
+
+Both times are float64 epoch seconds, a file is expired once the next tick of
+the worker is overdue.
+"""
+
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from whois.entity.presence import PresenceSnapshot
+from whois.entity.record import UserRecord
+
+logger = logging.getLogger(__name__)
+
+FILE_NAME = "presence.snapshot"
+MAGIC = b"WHPS"
+HEADER = struct.Struct("<4sQdd")
+
+
+def encode(snapshot: PresenceSnapshot, period: dict) -> bytes:
+    """JSON body of a snapshot, without the recent devices."""
+    return json.dumps(
+        {
+            "period": period,
+            "version": snapshot.version,
+            "users": [
+                [user.id, user.username, user.display_name, int(user.flags)]
+                for user in snapshot.users
+            ],
+            "unknown_devices": snapshot.unknown_devices,
+            "fingerprint": snapshot.fingerprint,
+        },
+        separators=(",", ":"),
+    ).encode()
+
+
+def decode(body: bytes) -> tuple[dict, PresenceSnapshot]:
+    data = json.loads(body)
+    snapshot = PresenceSnapshot(
+        version=data["version"],
+        recent=[],
+        users=[UserRecord(*user) for user in data["users"]],
+        unknown_devices=data["unknown_devices"],
+        fingerprint=data["fingerprint"],
+    )
+    return data["period"], snapshot
+
+
+def publish(
+    directory: str,
+    generation: int,
+    snapshot: PresenceSnapshot,
+    period: dict,
+    max_age_s: float,
+    now: float = None,
+) -> None:
+    """Replace the presence file of `directory` atomically.
+
+    Readers stop using it `max_age_s` after `now`, by then the worker should
+    have published it again.
+    """
+    now = time.time() if now is None else now
+    header = HEADER.pack(MAGIC, generation, now, now + max_age_s)
+    with tempfile.NamedTemporaryFile(
+        dir=directory, prefix=f".{FILE_NAME}.", delete=False
+    ) as file:
+        try:
+            file.write(header + encode(snapshot, period))
+            file.flush()
+            os.fsync(file.fileno())
+            # temporary files are private, web processes may run as another user
+            os.chmod(file.name, 0o644)
+            os.replace(file.name, os.path.join(directory, FILE_NAME))
+        except BaseException:
+            os.unlink(file.name)
+            raise
+
+
+class PresenceFile:
+    """Reader of the presence file published by the worker.
+
+    `get` returns None when the file is missing, expired, of another period or
+    of another PRESENCE_VERSION than the database, the caller then falls back
+    to the database.
+    """
+
+    def __init__(self, directory: str, clock=time.time):
+        self.path = os.path.join(directory, FILE_NAME)
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.file_id = None
+        # a file which could not be read, not tried again until replaced
+        self.failed_id = None
+        self.generation = None
+        self.published_at = None
+        self.expires_at = None
+        self.period = None
+        self.snapshot = None
+
+    def reload(self, file_id: tuple) -> None:
+        with open(self.path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                magic, generation, published_at, expires_at = HEADER.unpack_from(mapped)
+                if magic != MAGIC:
+                    raise ValueError(f"{self.path} is not a presence file")
+                if generation != self.generation:
+                    self.period, self.snapshot = decode(mapped[HEADER.size :])
+                    self.generation = generation
+        self.published_at = published_at
+        self.expires_at = expires_at
+        self.file_id = file_id
+
+    def get(self, period: dict, version: int = None) -> PresenceSnapshot | None:
+        """Published snapshot of `period`, if still current.
+
+        With `version`, a snapshot published before the last write changing
+        the presence, e.g. pushed lease events or a hidden device, is not used.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+
+        with self.lock:
+            # a replaced file is a new inode
+            file_id = (stat.st_ino, stat.st_mtime_ns)
+            if file_id != self.file_id:
+                if file_id == self.failed_id:
+                    return None
+                try:
+                    self.reload(file_id)
+                except (OSError, ValueError, KeyError, struct.error):
+                    logger.exception(f"Could not read {self.path}")
+                    self.failed_id = file_id
+                    return None
+
+            if self.clock() > self.expires_at:
+                return None
+            if self.period != period:
+                return None
+            if version is not None and self.snapshot.version != version:
+                return None
+            return self.snapshot
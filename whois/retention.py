@@ -0,0 +1,69 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from whois.data.db.database import Database
+from whois.data.repository.device_repository import DeviceRepository
+from whois.data.table.device import DeviceTable
+from whois.data.table.device_archive import DeviceArchiveTable
+from whois.settings.settings_template import MikrotikSettings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionResult:
+    removed: int = 0
+    archived: int = 0
+    batches: int = 0
+
+
+class RetentionJob:
+    """Removes ghost devices, mostly phones with randomized MAC addresses.
+
+    Unclaimed devices without flags which were not seen for RETENTION_DAYS,
+    or RETENTION_RANDOM_MAC_DAYS for randomized MAC addresses, are deleted or
+    archived in batches. Owned and flagged, e.g. infrastructure, devices are
+    kept forever. Visits and occupancy of removed devices are kept.
+    """
+
+    def __init__(self, database: Database, mikrotik_settings: MikrotikSettings):
+        self.database = database
+        self.device_repository = DeviceRepository(database)
+        self.max_age = timedelta(days=mikrotik_settings.RETENTION_DAYS)
+        self.random_mac_max_age = timedelta(
+            days=min(
+                mikrotik_settings.RETENTION_RANDOM_MAC_DAYS
+                or mikrotik_settings.RETENTION_DAYS,
+                mikrotik_settings.RETENTION_DAYS,
+            )
+        )
+        self.archive = mikrotik_settings.RETENTION_ARCHIVE
+        self.batch_size = mikrotik_settings.RETENTION_BATCH_SIZE
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age > timedelta(0)
+
+    def run(self, now: datetime) -> RetentionResult:
+        result = RetentionResult()
+        if not self.enabled:
+            return result
+
+        while True:
+            removed = self.device_repository.remove_stale(
+                now - self.max_age,
+                now - self.random_mac_max_age,
+                limit=self.batch_size,
+                archive=self.archive,
+            )
+            result.batches += 1
+            result.removed += removed
+            if self.archive:
+                result.archived += removed
+            if removed < self.batch_size:
+                break
+
+        if result.removed:
+            self.database.vacuum([DeviceTable, DeviceArchiveTable])
+        return result
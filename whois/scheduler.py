@@ -0,0 +1,90 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class AdaptiveScheduler:
+    """Fixed-rate clock for worker ticks.
+
+    Ticks are scheduled relative to the previous tick start, so the period does
+    not drift by the tick duration, and slots missed by an overrunning tick are
+    skipped instead of being run back to back. The interval moves between
+    `min_interval_s` and `max_interval_s` with the lease churn of the last
+    `churn_window` ticks: churn of `churn_threshold` or more polls at the
+    minimum interval, no churn at all at the maximum one.
+    """
+
+    def __init__(
+        self,
+        min_interval_s: float,
+        max_interval_s: float,
+        churn_window: int = 5,
+        churn_threshold: float = 0.05,
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        self.min_interval_s = min_interval_s
+        self.max_interval_s = max(min_interval_s, max_interval_s)
+        self.churn_threshold = churn_threshold
+        self.clock = clock
+        # sleeps in the time of `clock`
+        self.sleep = sleep
+
+        self.interval_s = min_interval_s
+        self.churn = deque(maxlen=churn_window)
+        self.last_tick = None
+        self.skipped = 0
+        self.refresh = threading.Event()
+
+    def record(self, changed: int, total: int) -> None:
+        """Record the number of changed leases of a finished tick."""
+        self.churn.append(changed / total if total else 0.0)
+        ratio = sum(self.churn) / len(self.churn)
+        weight = min(1.0, ratio / self.churn_threshold)
+        span = self.max_interval_s - self.min_interval_s
+        self.interval_s = self.max_interval_s - span * weight
+
+    def trigger(self) -> None:
+        """Request an immediate tick, e.g. after a refresh from the web app."""
+        self.refresh.set()
+
+    def restart(self) -> None:
+        """Tick right away and start over, e.g. once elected leader.
+
+        Ticks skipped on standby do not rate limit this one.
+        """
+        self.last_tick = None
+        self.refresh.set()
+
+    def next_tick(self, now: float) -> float:
+        """Return when the next tick is due, skipping slots already missed."""
+        if self.last_tick is None:
+            return now
+
+        due = self.last_tick + self.interval_s
+        if due < now:
+            missed = math.ceil((now - due) / self.interval_s)
+            self.skipped += missed
+            due += missed * self.interval_s
+        return due
+
+    def wait(self) -> bool:
+        """Block until the next tick should start.
+
+        Returns True when woken up by `trigger`. Refreshes are still rate
+        limited to one per `min_interval_s`.
+        """
+        now = self.clock()
+        due = self.next_tick(now)
+        triggered = self.refresh.wait(max(0.0, due - now))
+        if not triggered:
+            self.last_tick = due
+            return False
+
+        self.refresh.clear()
+        if self.last_tick is not None:
+            earliest = self.last_tick + self.min_interval_s
+            self.sleep(max(0.0, earliest - self.clock()))
+        self.last_tick = self.clock()
+        return True
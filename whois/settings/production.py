@@ -2,11 +2,16 @@ import os
 
 from pytz import timezone
 
-from whois.settings.settings_template import AppSettings, MikrotikSettings
+from whois.settings.settings_template import (
+    AppSettings,
+    MikrotikSettings,
+    routers_from_json,
+)
 
 try:
     from importlib.metadata import version
-    _version = version('whois')
+
+    _version = version("whois")
 except Exception:
     _version = "unknown"
 
@@ -33,6 +38,10 @@ app_settings = AppSettings(
     IP_MASK=os.environ.get("APP_IP_MASK", None),
     OIDC_ENABLED=True,
     RECENT_TIME={"minutes": 20},
+    PRESENCE_CHECK_S=float(os.environ.get("APP_PRESENCE_CHECK_S", 2)),
+    PRESENCE_MAX_AGE_S=float(os.environ.get("APP_PRESENCE_MAX_AGE_S", 30)),
+    USER_CACHE_TTL_S=float(os.environ.get("APP_USER_CACHE_TTL_S", 30)),
+    USER_CACHE_SIZE=int(os.environ.get("APP_USER_CACHE_SIZE", 512)),
 )
 
 
@@ -45,4 +54,25 @@ mikrotik_settings = MikrotikSettings(
     USER_FLAGS={1: "hidden", 2: "name_anonymous"},
     DEVICE_FLAGS={1: "hidden", 2: "new", 4: "infrastructure", 8: "esp", 16: "laptop"},
     WORKER_FREQUENCY_S=60,
+    WORKER_LAST_SEEN_GRANULARITY_S=300,
+    MIKROTIK_ROUTERS=routers_from_json(os.environ.get("APP_MIKROTIK_ROUTERS")),
+    MIKROTIK_TIMEOUT_S=30,
+    MIKROTIK_CONNECT_TIMEOUT_S=5,
+    MIKROTIK_RETRIES=2,
+    WORKER_MAX_INTERVAL_S=300,
+    WORKER_CHURN_WINDOW=5,
+    WORKER_REFRESH_POLL_S=2,
+    INGEST_TOKEN=os.environ.get("APP_INGEST_TOKEN"),
+    INGEST_FLUSH_S=2,
+    INGEST_MAX_BATCH=500,
+    WORKER_RECONCILE_S=600,
+    WORKER_LEADER_TTL_S=30,
+    WORKER_VISIT_GAP_S=1800,
+    RETENTION_DAYS=int(os.environ.get("APP_RETENTION_DAYS", 90)),
+    RETENTION_RANDOM_MAC_DAYS=int(os.environ.get("APP_RETENTION_RANDOM_MAC_DAYS", 14)),
+    RETENTION_ARCHIVE=os.environ.get("APP_RETENTION_ARCHIVE", "0") == "1",
+    RETENTION_BATCH_SIZE=500,
+    RETENTION_INTERVAL_S=24 * 3600,
+    PRESENCE_FILE_DIR=os.environ.get("APP_PRESENCE_FILE_DIR"),
+    PRESENCE_FILE_RECENT_TIME=app_settings.RECENT_TIME,
 )
@@ -1,9 +1,27 @@
+import json
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from pytz import timezone
 
 
+@dataclass
+class RouterSettings:
+    URL: str
+    USER: str
+    PASS: str
+
+
+def routers_from_json(value: str | None) -> list[RouterSettings]:
+    """Parse a JSON list of {"url": ..., "user": ..., "password": ...} objects."""
+    if not value:
+        return []
+    return [
+        RouterSettings(URL=router["url"], USER=router["user"], PASS=router["password"])
+        for router in json.loads(value)
+    ]
+
+
 @dataclass
 class MikrotikSettings:
     MIKROTIK_URL: str
@@ -15,7 +33,78 @@ class MikrotikSettings:
     USER_FLAGS: dict
     DEVICE_FLAGS: dict
 
+    # Shortest interval between worker ticks, used while leases churn
     WORKER_FREQUENCY_S: int
+    # last_seen moves smaller than this are not written to the database
+    WORKER_LAST_SEEN_GRANULARITY_S: int = 300
+
+    # Additional routers polled concurrently with MIKROTIK_URL
+    MIKROTIK_ROUTERS: list[RouterSettings] = field(default_factory=list)
+    # Longest time a tick waits for any single router
+    MIKROTIK_TIMEOUT_S: int = 30
+    MIKROTIK_CONNECT_TIMEOUT_S: int = 5
+    # Retries of a failed request, with jittered exponential backoff, as long as
+    # they end within MIKROTIK_TIMEOUT_S
+    MIKROTIK_RETRIES: int = 2
+
+    # Longest interval between worker ticks, used while nothing changes
+    WORKER_MAX_INTERVAL_S: int = 300
+    # Number of recent ticks the lease churn is averaged over
+    WORKER_CHURN_WINDOW: int = 5
+    # How often the worker checks for refreshes requested by the web app
+    WORKER_REFRESH_POLL_S: int = 2
+
+    # Bearer token of /api/ingest/lease, pushed lease events are disabled if unset
+    INGEST_TOKEN: str = None
+    # Pushed events are written at least this often, or once INGEST_MAX_BATCH pend
+    INGEST_FLUSH_S: int = 2
+    INGEST_MAX_BATCH: int = 500
+    # Longest interval between worker ticks while lease events are pushed, the
+    # poll then mostly reconciles. Keep it below half of RECENT_TIME, present
+    # devices only get a newer last_seen from polls
+    WORKER_RECONCILE_S: int = 600
+    # A standby worker takes over this long after the leader stopped renewing
+    WORKER_LEADER_TTL_S: int = 30
+    # Absences shorter than this are merged into one visit, keep it above
+    # WORKER_RECONCILE_S when lease events are pushed
+    WORKER_VISIT_GAP_S: int = 1800
+
+    # Unclaimed, unflagged devices not seen for this many days are removed,
+    # 0 keeps them forever
+    RETENTION_DAYS: int = 90
+    # Same for randomized (locally administered) MAC addresses of phones
+    RETENTION_RANDOM_MAC_DAYS: int = 14
+    # Copy removed devices to the device_archive table instead of dropping them
+    RETENTION_ARCHIVE: bool = False
+    # Devices removed per transaction, writes of the web app run in between
+    RETENTION_BATCH_SIZE: int = 500
+    RETENTION_INTERVAL_S: int = 24 * 3600
+
+    # Directory of the presence file the worker publishes after each tick and
+    # each write changing the presence, for the web app to serve / and /api/now from, disabled if unset
+    PRESENCE_FILE_DIR: str = None
+    # Recent period of the published presence, RECENT_TIME of the web app, the
+    # worker refuses to start with ticks further apart than half of it
+    PRESENCE_FILE_RECENT_TIME: dict = field(default_factory=lambda: {"minutes": 20})
+
+    @property
+    def max_interval_s(self) -> int:
+        """Longest interval between worker ticks."""
+        if self.INGEST_TOKEN:
+            return max(self.WORKER_MAX_INTERVAL_S, self.WORKER_RECONCILE_S)
+        return self.WORKER_MAX_INTERVAL_S
+
+    @property
+    def routers(self) -> list[RouterSettings]:
+        routers = list(self.MIKROTIK_ROUTERS)
+        if self.MIKROTIK_URL:
+            main = RouterSettings(
+                URL=self.MIKROTIK_URL,
+                USER=self.MIKROTIK_USER,
+                PASS=self.MIKROTIK_PASS,
+            )
+            routers.insert(0, main)
+        return routers
 
 
 @dataclass
@@ -40,3 +129,13 @@ class AppSettings:
 
     IP_MASK: str
     OIDC_ENABLED: bool
+
+    # Presence shown by /, /devices and /api/now is rebuilt when the worker
+    # changed it, checked at most this often, or once it is this old
+    PRESENCE_CHECK_S: float = 2
+    PRESENCE_MAX_AGE_S: float = 30
+
+    # Users loaded by Flask-Login are cached per process for this long, the
+    # cache is disabled with a size of 0
+    USER_CACHE_TTL_S: float = 30
+    USER_CACHE_SIZE: int = 512
@@ -2,7 +2,11 @@ import os
 
 from pytz import timezone
 
-from whois.settings.settings_template import AppSettings, MikrotikSettings
+from whois.settings.settings_template import (
+    AppSettings,
+    MikrotikSettings,
+    routers_from_json,
+)
 
 app_settings = AppSettings(
     SECRET_KEY="test_key_123",
@@ -20,6 +24,8 @@ app_settings = AppSettings(
     IP_MASK="127.0.0.1",
     OIDC_ENABLED=False,
     RECENT_TIME={"minutes": 20},
+    # tests write and read right away
+    PRESENCE_CHECK_S=0,
 )
 
 
@@ -32,4 +38,23 @@ mikrotik_settings = MikrotikSettings(
     USER_FLAGS={1: "hidden", 2: "name_anonymous"},
     DEVICE_FLAGS={1: "hidden", 2: "new", 4: "infrastructure", 8: "esp", 16: "laptop"},
     WORKER_FREQUENCY_S=60,
+    WORKER_LAST_SEEN_GRANULARITY_S=300,
+    MIKROTIK_ROUTERS=routers_from_json(os.environ.get("APP_MIKROTIK_ROUTERS")),
+    MIKROTIK_TIMEOUT_S=30,
+    MIKROTIK_CONNECT_TIMEOUT_S=5,
+    MIKROTIK_RETRIES=2,
+    WORKER_MAX_INTERVAL_S=300,
+    WORKER_CHURN_WINDOW=5,
+    WORKER_REFRESH_POLL_S=2,
+    INGEST_TOKEN="test_ingest_token",
+    INGEST_FLUSH_S=2,
+    INGEST_MAX_BATCH=500,
+    WORKER_RECONCILE_S=600,
+    WORKER_LEADER_TTL_S=30,
+    WORKER_VISIT_GAP_S=1800,
+    RETENTION_DAYS=90,
+    RETENTION_RANDOM_MAC_DAYS=14,
+    RETENTION_ARCHIVE=False,
+    RETENTION_BATCH_SIZE=500,
+    RETENTION_INTERVAL_S=24 * 3600,
 )
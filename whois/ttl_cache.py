@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TtlCache:
+    """Bounded in-memory cache whose entries expire after `ttl_s`.
+
+    The least recently used entry is evicted when `max_size` is reached. Hit,
+    miss and eviction counters help to size it.
+    """
+
+    def __init__(self, max_size: int, ttl_s: float, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl_s = ttl_s
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached value of `key`, None when missing or expired."""
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None or self.clock() >= entry[0]:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value) -> None:
+        with self.lock:
+            self._entries[key] = (self.clock() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key) -> None:
+        with self.lock:
+            self._entries.pop(key, None)
+
+    def render_metrics(self, name: str) -> str:
+        """Counters and size in the Prometheus text format."""
+        lines = []
+        for counter in ("hits", "misses", "evictions"):
+            metric = f"whohacks_{name}_{counter}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {getattr(self, counter)}"]
+        lines += [
+            f"# TYPE whohacks_{name}_size gauge",
+            f"whohacks_{name}_size {len(self)}",
+        ]
+        return "\n".join(lines) + "\n"
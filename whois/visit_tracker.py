@@ -0,0 +1,71 @@
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Tuple
+
+from whois.data.repository.device_repository import as_utc_naive
+from whois.entity.device import Device
+from whois.entity.presence import Visit
+
+
+class VisitTracker:
+    """Turns device observations of the worker into visits.
+
+    Keeps the latest visit of each device seen within `gap`. An observation
+    less than `gap` after the end of that visit extends it, a later one starts
+    a new visit.
+    """
+
+    def __init__(self, gap: timedelta):
+        self.gap = gap
+        self._latest: Dict[str, Visit] = {}
+
+    def __len__(self) -> int:
+        return len(self._latest)
+
+    def load(self, visits: Iterable[Visit]) -> None:
+        """Replace the tracked visits with visits stored in the database."""
+        self._latest = {}
+        self.commit(visits)
+
+    def diff(self, devices: Iterable[Device]) -> List[Visit]:
+        """Return new and extended visits, new ones have no id yet."""
+        visits = {}
+        for device in devices:
+            seen = as_utc_naive(device.last_seen)
+            visit = visits.get(device.mac_address) or self._latest.get(
+                device.mac_address
+            )
+            if visit is not None and seen <= visit.ended_at:
+                continue
+            if visit is not None and seen - visit.ended_at <= self.gap:
+                visits[device.mac_address] = replace(visit, ended_at=seen)
+            else:
+                visits[device.mac_address] = Visit(device.mac_address, seen, seen)
+        return list(visits.values())
+
+    def spans(self, visits: Iterable[Visit]) -> List[Tuple[str, datetime, datetime]]:
+        """Time newly covered by each visit, as (mac_address, start, end)."""
+        spans = []
+        for visit in visits:
+            latest = self._latest.get(visit.mac_address)
+            if visit.id is not None and latest is not None and latest.id == visit.id:
+                spans.append((visit.mac_address, latest.ended_at, visit.ended_at))
+            else:
+                spans.append((visit.mac_address, visit.started_at, visit.ended_at))
+        return spans
+
+    def commit(self, visits: Iterable[Visit]) -> None:
+        """Record visits which were written to the database."""
+        for visit in visits:
+            latest = self._latest.get(visit.mac_address)
+            if latest is None or visit.ended_at >= latest.ended_at:
+                self._latest[visit.mac_address] = visit
+
+    def prune(self, now: datetime) -> None:
+        """Forget visits which can not be extended anymore."""
+        oldest = as_utc_naive(now) - self.gap
+        self._latest = {
+            mac_address: visit
+            for mac_address, visit in self._latest.items()
+            if visit.ended_at >= oldest
+        }
@@ -0,0 +1,11 @@
+import logging
+
+from whois.asgi import AsyncWhohacksApp
+from whois.data.db.async_database import AsyncDatabase
+from whois.settings.production import app_settings, mikrotik_settings
+
+database = AsyncDatabase()
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+app = AsyncWhohacksApp(app_settings, mikrotik_settings, database, logger)
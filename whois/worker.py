@@ -1,52 +1,349 @@
 import logging
+import threading
 import time
-from datetime import datetime, timezone
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
 
-from whois.data.db.database import Device, db
-from whois.mikrotik import fetch_leases
-from whois.settings import production
+from whois import presence_file
+from whois.change_cache import DeviceChangeCache
+from whois.data.db.database import Database
+from whois.data.repository.device_read_repository import DeviceReadRepository
+from whois.data.repository.device_repository import DeviceRepository, UpsertResult
+from whois.data.repository.presence_repository import PresenceRepository
+from whois.data.repository.state_repository import (
+    PRESENCE_VERSION,
+    REFRESH_REQUESTED,
+    StateRepository,
+)
+from whois.entity.device import Device
+from whois.leader import make_election
+from whois.mikrotik import (
+    WORKER_PROPLIST,
+    MikrotikDhcpLease,
+    make_client,
+    merge_leases,
+)
+from whois.presence_cache import make_snapshot
+from whois.retention import RetentionJob
+from whois.scheduler import AdaptiveScheduler
+from whois.settings.settings_template import MikrotikSettings, RouterSettings
+from whois.visit_tracker import VisitTracker
 
 logger = logging.getLogger("mikrotik-worker")
 
 
-def update_devices() -> int:
-    leases = fetch_leases(
-        production.MIKROTIK_URL, production.MIKROTIK_USER, production.MIKROTIK_PASS
+def lease_to_device(lease: MikrotikDhcpLease, now: datetime) -> Device:
+    return Device(
+        mac_address=lease.mac_address,
+        hostname=lease.host_name,
+        last_seen=now - lease.last_seen,
+        owner=None,
+        flags=None,
     )
 
-    for lease in leases:
-        with db.atomic():
-            last_seen_date = datetime.now(timezone.utc) - lease.last_seen
-            Device.update_or_create(
-                mac_address=lease.mac_address,
-                last_seen=last_seen_date,
-                hostname=lease.host_name,
+
+class Worker:
+
+    def __init__(self, database: Database, mikrotik_settings: MikrotikSettings):
+        self.database = database
+        self.device_repository = DeviceRepository(database)
+        self.device_read_repository = DeviceReadRepository(database)
+        self.state_repository = StateRepository(database)
+        self.presence_repository = PresenceRepository(database)
+        self.mikrotik_settings = mikrotik_settings
+        # With pushed lease events a quiet network is only polled to reconcile
+        self.scheduler = AdaptiveScheduler(
+            min_interval_s=mikrotik_settings.WORKER_FREQUENCY_S,
+            max_interval_s=mikrotik_settings.max_interval_s,
+            churn_window=mikrotik_settings.WORKER_CHURN_WINDOW,
+        )
+        self.change_cache = DeviceChangeCache(
+            timedelta(seconds=mikrotik_settings.WORKER_LAST_SEEN_GRANULARITY_S)
+        )
+        self.visit_tracker = VisitTracker(
+            timedelta(seconds=mikrotik_settings.WORKER_VISIT_GAP_S)
+        )
+        self.election = make_election(
+            database,
+            "mikrotik-worker",
+            timedelta(seconds=mikrotik_settings.WORKER_LEADER_TTL_S),
+        )
+        self.cache_is_stale = True
+        self.retention = RetentionJob(database, mikrotik_settings)
+        self.retention_due = 0.0
+        # One thread per router, so a hung router only ever delays itself
+        self.executors = {
+            router.URL: ThreadPoolExecutor(max_workers=1, thread_name_prefix="router")
+            for router in mikrotik_settings.routers
+        }
+        self.pending: dict[str, Future] = {}
+        self.publish_lock = threading.Lock()
+        self.published_version = None
+        self.clients = {
+            router.URL: make_client(
+                router.URL,
+                router.USER,
+                router.PASS,
+                connect_timeout_s=mikrotik_settings.MIKROTIK_CONNECT_TIMEOUT_S,
+                read_timeout_s=mikrotik_settings.MIKROTIK_TIMEOUT_S,
+                retries=mikrotik_settings.MIKROTIK_RETRIES,
+                proplist=WORKER_PROPLIST,
+                # a tick waits this long, later retries would be dropped
+                deadline_s=mikrotik_settings.MIKROTIK_TIMEOUT_S,
             )
+            for router in mikrotik_settings.routers
+        }
+
+    def load_cache(self) -> None:
+        self.change_cache.load(self.device_repository.get_all())
+        logger.info(f"Loaded {len(self.change_cache)} devices into change cache")
+        self.visit_tracker.load(
+            self.presence_repository.get_visits_since(
+                datetime.now(timezone.utc) - self.visit_tracker.gap
+            )
+        )
+        logger.info(f"Loaded {len(self.visit_tracker)} open visits")
+
+    def fetch_router(self, router: RouterSettings) -> Future:
+        future = self.pending.get(router.URL)
+        if future is None or future.done():
+            future = self.executors[router.URL].submit(
+                self.clients[router.URL].fetch_leases
+            )
+            self.pending[router.URL] = future
+        return future
+
+    def fetch_all_leases(self) -> list[MikrotikDhcpLease]:
+        """Fetch leases from all routers concurrently and merge them.
+
+        Routers which do not answer within MIKROTIK_TIMEOUT_S are skipped for
+        this tick. Their request is left running and no new one is sent while
+        it is, a late answer is dropped though: its last-seen times are relative
+        to when it arrived, so the next tick asks the router again.
+        """
+        futures = {
+            self.fetch_router(router): router
+            for router in self.mikrotik_settings.routers
+        }
+        done, not_done = wait(
+            futures, timeout=self.mikrotik_settings.MIKROTIK_TIMEOUT_S
+        )
+
+        lease_lists = []
+        for future in done:
+            url = futures[future].URL
+            try:
+                lease_lists.append(future.result())
+            except Exception:
+                logger.exception(f"Could not fetch leases from {url}")
+            else:
+                metrics = self.clients[url].metrics
+                logger.info(
+                    f"Fetched {len(lease_lists[-1])} leases from {url}: "
+                    f"{metrics.last_response_bytes} bytes "
+                    f"in {metrics.last_latency_s:.2f}s"
+                )
+            self.pending.pop(url, None)
 
-    return len(leases)
+        for future in not_done:
+            logger.error(f"Timed out fetching leases from {futures[future].URL}")
 
+        if not lease_lists:
+            raise RuntimeError("Could not fetch leases from any router")
+
+        return merge_leases(lease_lists)
+
+    def update_devices(self) -> UpsertResult:
+        leases = self.fetch_all_leases()
+
+        now = datetime.now(timezone.utc)
+        devices = [
+            lease_to_device(lease, now)
+            for lease in leases
+            if lease.mac_address and lease.last_seen is not None
+        ]
+
+        changed = self.change_cache.diff(devices)
+        result = self.device_repository.upsert_many(changed)
+        self.change_cache.commit(changed)
+        # visits follow every tick, not only the last_seen moves written above
+        self.update_history(devices, now)
+
+        result.unchanged += len(devices) - len(changed)
+        return result
+
+    def update_history(self, devices: list[Device], now: datetime) -> None:
+        """Extend or start visits of present devices and refresh the rollups.
+
+        Leases seen longer than the visit gap ago are not presence anymore, so
+        history starts with the first tick and old leases do not backfill it.
+        """
+        present = [
+            device
+            for device in devices
+            if now - device.last_seen <= self.visit_tracker.gap
+        ]
+        visits = self.visit_tracker.diff(present)
+        if visits:
+            spans = self.visit_tracker.spans(visits)
+            self.visit_tracker.commit(
+                self.presence_repository.record_visits(visits, spans, now)
+            )
+        self.visit_tracker.prune(now)
 
-def run_worker():
-    if not all(
-        [production.MIKROTIK_URL, production.MIKROTIK_USER, production.MIKROTIK_PASS]
-    ):
-        raise ValueError("Mikrotik settings not set")
+    def watch_refresh_requests(self) -> None:
+        """Trigger a tick whenever the web app bumps the refresh counter.
 
-    while True:
+        The presence file is published again as soon as another process
+        changed the presence, e.g. with pushed lease events or a claim.
+        """
+        seen = self.state_repository.get(REFRESH_REQUESTED)
+        while True:
+            time.sleep(self.mikrotik_settings.WORKER_REFRESH_POLL_S)
+            try:
+                requested = self.state_repository.get(REFRESH_REQUESTED)
+                version = self.state_repository.get(PRESENCE_VERSION)
+            except Exception:
+                logger.exception("Could not check for refresh requests")
+                continue
+            finally:
+                self.database.remove_session()
+            if requested != seen:
+                seen = requested
+                logger.info("Refresh requested by the web app")
+                self.scheduler.trigger()
+            elif (
+                self.mikrotik_settings.PRESENCE_FILE_DIR
+                and self.election.is_leader
+                and self.published_version is not None
+                and version != self.published_version
+            ):
+                self.publish_presence()
+
+    def on_elected(self) -> None:
+        # the previous leader kept writing while this instance was on standby
+        self.cache_is_stale = True
+        self.scheduler.restart()
+
+    def run(self) -> None:
+        settings = self.mikrotik_settings
+        if not settings.routers or not all(
+            [router.URL and router.USER and router.PASS for router in settings.routers]
+        ):
+            raise ValueError("Mikrotik settings not set")
+        recent_s = timedelta(**settings.PRESENCE_FILE_RECENT_TIME).total_seconds()
+        if settings.max_interval_s > recent_s / 2:
+            raise ValueError(
+                f"Worker ticks up to {settings.max_interval_s}s apart would let "
+                f"present devices drop out of the {recent_s:.0f}s recent period, "
+                "lower WORKER_MAX_INTERVAL_S or WORKER_RECONCILE_S"
+            )
+
+        self.election.start(
+            settings.WORKER_LEADER_TTL_S / 3, on_elected=self.on_elected
+        )
+        threading.Thread(
+            target=self.watch_refresh_requests, name="refresh-watcher", daemon=True
+        ).start()
+
+        try:
+            while True:
+                self.scheduler.wait()
+                if not self.election.is_leader:
+                    logger.debug("Another worker is the leader, skipping update")
+                    continue
+                self.tick()
+                self.run_retention()
+        finally:
+            self.election.release()
+
+    def tick(self) -> None:
         try:
+            if self.cache_is_stale:
+                self.load_cache()
+                self.cache_is_stale = False
             logger.info("Updating device information")
-            count = update_devices()
-            logger.info(f"Updated information for {count} devices")
+            result = self.update_devices()
+            logger.info(
+                f"Updated information for {result.total} devices: "
+                f"{result.inserted} inserted, {result.updated} updated, "
+                f"{result.unchanged} unchanged"
+            )
         except Exception:
             logger.exception("Could not update device information")
+            return
+        finally:
+            self.database.remove_session()
 
-        time.sleep(production.worker_frequency_s)
+        self.scheduler.record(result.inserted + result.updated, result.total)
+        if self.mikrotik_settings.PRESENCE_FILE_DIR:
+            self.publish_presence()
+        logger.info(
+            f"Next update in {self.scheduler.interval_s:.0f}s, "
+            f"{self.scheduler.skipped} overrun ticks skipped so far"
+        )
+
+    def publish_presence(self) -> None:
+        """Write the presence of the recent period for the web app processes.
+
+        The file expires once the next tick is overdue, allowing for a tick
+        waiting MIKROTIK_TIMEOUT_S on the routers.
+        """
+        settings = self.mikrotik_settings
+        with self.publish_lock:
+            try:
+                version = self.state_repository.get(PRESENCE_VERSION)
+                snapshot = make_snapshot(
+                    version,
+                    self.device_read_repository.get_recent_with_owners(
+                        timedelta(**settings.PRESENCE_FILE_RECENT_TIME),
+                        visible_only=False,
+                    ),
+                )
+                presence_file.publish(
+                    settings.PRESENCE_FILE_DIR,
+                    time.time_ns(),
+                    snapshot,
+                    settings.PRESENCE_FILE_RECENT_TIME,
+                    max_age_s=self.scheduler.interval_s + settings.MIKROTIK_TIMEOUT_S,
+                )
+                self.published_version = version
+            except Exception:
+                logger.exception("Could not publish the presence file")
+            finally:
+                self.database.remove_session()
+
+    def run_retention(self) -> None:
+        """Remove stale devices once every RETENTION_INTERVAL_S."""
+        if not self.retention.enabled or time.monotonic() < self.retention_due:
+            return
+        self.retention_due = (
+            time.monotonic() + self.mikrotik_settings.RETENTION_INTERVAL_S
+        )
+
+        try:
+            result = self.retention.run(datetime.now(timezone.utc))
+        except Exception:
+            logger.exception("Could not remove stale devices")
+            return
+        finally:
+            self.database.remove_session()
+
+        logger.info(
+            f"Removed {result.removed} stale devices in {result.batches} batches, "
+            f"{result.archived} archived"
+        )
+        if result.removed:
+            # removed devices must be inserted again when they come back
+            self.cache_is_stale = True
 
 
 if __name__ == "__main__":
+    from whois.settings.production import mikrotik_settings
+
     logging.basicConfig(
         format="[%(asctime)s] %(name)s [%(levelname)s]: %(msg)s",
         level=logging.INFO,
         datefmt="%Y-%m-%d %H:%M:%S",
     )
-    run_worker()
+    Worker(Database(), mikrotik_settings).run()